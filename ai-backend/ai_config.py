@@ -5,11 +5,20 @@ Manages different AI providers and their settings
 
 import os
 from enum import Enum
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+def load_api_keys(single_var: str, pool_var: str) -> List[str]:
+    """Keys from a comma-separated pool variable plus the single-key variable, without duplicates"""
+    keys = [key.strip() for key in os.getenv(pool_var, "").split(",") if key.strip()]
+    single = os.getenv(single_var)
+    if single and single not in keys:
+        keys.insert(0, single)
+    return keys
 
 class AIProvider(Enum):
     OPENAI = "openai"
     GEMINI = "gemini"
+    GROK = "grok"
     LOCAL = "local"
     FALLBACK = "fallback"
 
@@ -17,6 +26,14 @@ class AIConfig:
     """Configuration class for AI providers"""
     
     def __init__(self):
+        # Low-connectivity deployments: keep every call on-box even if remote keys are set
+        offline = os.getenv("AI_OFFLINE_MODE", "false").lower() == "true"
+        local_model = os.getenv("LOCAL_LLM_MODEL", "llama2")
+        # Load and failure testing: send Grok and Gemini traffic to fake_providers.py instead
+        fake_url = os.getenv("AI_FAKE_PROVIDERS_URL", "").rstrip("/")
+        gemini_keys = load_api_keys("GOOGLE_API_KEY", "GOOGLE_API_KEYS") or (["fake-gemini-key"] if fake_url else [])
+        grok_keys = load_api_keys("GROK_API_KEY", "GROK_API_KEYS") or (["fake-grok-key"] if fake_url else [])
+        self.fake_providers_url = fake_url or None
         self.providers = {
             AIProvider.OPENAI: {
                 "enabled": bool(os.getenv("OPENAI_API_KEY")),
@@ -28,19 +45,87 @@ class AIConfig:
                 "priority": 2  # Make OpenAI secondary
             },
             AIProvider.GEMINI: {
-                "enabled": bool(os.getenv("GOOGLE_API_KEY")),
-                "api_key": os.getenv("GOOGLE_API_KEY"),
+                "enabled": bool(gemini_keys) and not offline,
+                "api_key": gemini_keys[0] if gemini_keys else None,
+                # Each key gets its own client and quota, so throughput scales with the pool
+                "api_keys": gemini_keys,
                 "model": os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),  # Lightweight model
                 "max_tokens": int(os.getenv("GEMINI_MAX_TOKENS", "300")),
                 "temperature": float(os.getenv("GEMINI_TEMPERATURE", "0.7")),
                 "cost_per_1k_tokens": 0.0,  # Free tier for students
+                # Model per tier: flash for interactive calls, a larger model for offline work
+                "models": {
+                    "fast": os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
+                    "large": os.getenv("GEMINI_LARGE_MODEL", "gemini-1.5-pro")
+                },
+                "model_costs": {
+                    "fast": 0.0,
+                    "large": float(os.getenv("GEMINI_LARGE_COST_PER_1K_TOKENS", "0.00125"))
+                },
                 "priority": 1,  # Make Gemini primary
-                "response_time": "fast"  # Flash model is optimized for speed
+                "response_time": "fast",  # Flash model is optimized for speed
+                "base_url": f"{fake_url}/v1beta" if fake_url else os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta"),
+                "timeout": float(os.getenv("GEMINI_TIMEOUT", "30")),
+                # Free-tier quota per key (0 = unlimited); the dollar budget is unused while the tier is free
+                "rpm": int(os.getenv("GEMINI_RPM", "15")),
+                "tpm": int(os.getenv("GEMINI_TPM", "1000000")),
+                "daily_requests": int(os.getenv("GEMINI_DAILY_REQUESTS", "1500")),
+                "daily_budget_usd": float(os.getenv("GEMINI_DAILY_BUDGET_USD", "0"))
+            },
+            AIProvider.GROK: {
+                "enabled": bool(grok_keys) and not offline,
+                "api_key": grok_keys[0] if grok_keys else None,
+                "api_keys": grok_keys,
+                "model": os.getenv("GROK_MODEL", "grok-beta"),
+                "max_tokens": int(os.getenv("GROK_MAX_TOKENS", "800")),
+                "temperature": float(os.getenv("GROK_TEMPERATURE", "0.7")),
+                "cost_per_1k_tokens": float(os.getenv("GROK_COST_PER_1K_TOKENS", "0.005")),  # USD
+                "models": {
+                    "fast": os.getenv("GROK_FAST_MODEL", os.getenv("GROK_MODEL", "grok-beta")),
+                    "large": os.getenv("GROK_LARGE_MODEL", os.getenv("GROK_MODEL", "grok-beta"))
+                },
+                "model_costs": {
+                    "fast": float(os.getenv("GROK_COST_PER_1K_TOKENS", "0.005")),
+                    "large": float(os.getenv("GROK_LARGE_COST_PER_1K_TOKENS", os.getenv("GROK_COST_PER_1K_TOKENS", "0.005")))
+                },
+                "priority": 2,
+                "base_url": f"{fake_url}/v1" if fake_url else os.getenv("GROK_BASE_URL", "https://api.x.ai/v1"),
+                "timeout": float(os.getenv("GROK_TIMEOUT", "30")),
+                "rpm": int(os.getenv("GROK_RPM", "60")),
+                "tpm": int(os.getenv("GROK_TPM", "100000")),
+                "daily_requests": int(os.getenv("GROK_DAILY_REQUESTS", "0")),
+                # Per key; converted to a daily token allowance through cost_per_1k_tokens
+                "daily_budget_usd": float(os.getenv("GROK_DAILY_BUDGET_USD", "5"))
             },
             AIProvider.LOCAL: {
-                "enabled": False,  # Not implemented yet
-                "model": "llama2",
-                "priority": 3
+                # OpenAI-compatible server on the box (llama.cpp server, Ollama, vLLM)
+                "enabled": bool(os.getenv("LOCAL_LLM_BASE_URL")),
+                "api_key": os.getenv("LOCAL_LLM_API_KEY", ""),
+                # One pseudo-key: local servers usually take none, but the registry pools clients by key
+                "api_keys": [os.getenv("LOCAL_LLM_API_KEY", "")],
+                "model": local_model,
+                "max_tokens": int(os.getenv("LOCAL_LLM_MAX_TOKENS", "700")),
+                "temperature": float(os.getenv("LOCAL_LLM_TEMPERATURE", "0.7")),
+                "cost_per_1k_tokens": 0.0,
+                "models": {"fast": local_model, "large": os.getenv("LOCAL_LLM_LARGE_MODEL", local_model)},
+                "model_costs": {"fast": 0.0, "large": 0.0},
+                "priority": 3,
+                "base_url": os.getenv("LOCAL_LLM_BASE_URL", "http://127.0.0.1:8080/v1"),
+                # Routing assumes CPU-speed latencies until real ones are measured
+                "default_latency_ms": {
+                    "fast": float(os.getenv("LOCAL_LLM_EXPECTED_MS", "6000")),
+                    "large": float(os.getenv("LOCAL_LLM_LARGE_EXPECTED_MS", "20000"))
+                },
+                # CPU inference is slow; the adaptive timeout tightens this once latencies are known
+                "timeout": float(os.getenv("LOCAL_LLM_TIMEOUT", "60")),
+                # Ask the server to constrain output to JSON (llama.cpp and Ollama support response_format)
+                "json_mode": os.getenv("LOCAL_LLM_JSON_MODE", "true").lower() == "true",
+                "rpm": 0,
+                "tpm": 0,
+                "daily_requests": 0,
+                "daily_budget_usd": 0.0,
+                # Deterministic questions from trait keywords and the J&K scenario bank, no model needed
+                "template_questions": os.getenv("LOCAL_TEMPLATE_QUESTIONS", "true").lower() == "true"
             },
             AIProvider.FALLBACK: {
                 "enabled": True,
@@ -54,6 +139,118 @@ class AIConfig:
             if config["enabled"]
         ]
         self.enabled_providers.sort(key=lambda p: self.providers[p]["priority"])
+        
+        # Shared keep-alive pool for all HTTP providers (per worker process)
+        self.http_pool = {
+            # Idle connections kept open per provider host, for both the sync and the async pool
+            "max_keepalive": int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "10")),
+            # Async calls multiplex on the event loop, so the async pool can be much larger
+            "async_max_connections": int(os.getenv("AI_HTTP_ASYNC_MAX_CONNECTIONS", "200"))
+        }
+        
+        # Hedged requests: start the next provider if the current one has not answered in time
+        hedge_delay = os.getenv("AI_HEDGE_DELAY_MS")
+        self.hedging = {
+            "enabled": os.getenv("AI_HEDGING_ENABLED", "true").lower() == "true",
+            "delay_ms": float(hedge_delay) if hedge_delay else None,  # None: use the provider's p95
+            "default_delay_ms": float(os.getenv("AI_HEDGE_DEFAULT_DELAY_MS", "3000")),  # before any p95 exists
+            "min_delay_ms": float(os.getenv("AI_HEDGE_MIN_DELAY_MS", "250"))
+        }
+        
+        # Per-provider circuit breakers: skip a provider outright while it is failing or slow
+        self.circuit_breaker = {
+            "window_size": int(os.getenv("AI_BREAKER_WINDOW", "20")),
+            "min_calls": int(os.getenv("AI_BREAKER_MIN_CALLS", "5")),
+            "error_rate_threshold": float(os.getenv("AI_BREAKER_ERROR_RATE", "0.5")),
+            "slow_call_ms": float(os.getenv("AI_BREAKER_SLOW_CALL_MS", "15000")),
+            "slow_rate_threshold": float(os.getenv("AI_BREAKER_SLOW_RATE", "0.8")),
+            "open_seconds": float(os.getenv("AI_BREAKER_OPEN_SECONDS", "30")),
+            "half_open_calls": int(os.getenv("AI_BREAKER_HALF_OPEN_CALLS", "2"))
+        }
+        
+        # Deferred insights: answer with algorithmic results, enrich stored recommendations in the background
+        self.deferred_insights = {
+            "default": os.getenv("AI_DEFER_INSIGHTS", "false").lower() == "true",
+            "workers": int(os.getenv("AI_DEFERRED_WORKERS", "4")),
+            "queue_size": int(os.getenv("AI_DEFERRED_QUEUE_SIZE", "1000")),
+            # Pending documents older than this are assumed lost (e.g. a worker restart) and re-queued
+            "requeue_after_seconds": int(os.getenv("AI_DEFERRED_REQUEUE_SECONDS", "120"))
+        }
+        
+        # Provider quota scheduling: calls wait briefly for a rate slot, otherwise fail fast
+        self.rate_limits = {
+            "max_wait_seconds": float(os.getenv("AI_QUEUE_MAX_WAIT_SECONDS", "2")),
+            "max_waiters": int(os.getenv("AI_QUEUE_MAX_WAITERS", "50")),
+            # Pause after a provider 429 even if our own buckets say there is room
+            "cooldown_seconds": float(os.getenv("AI_RATE_LIMIT_COOLDOWN_SECONDS", "10"))
+        }
+        
+        # Provider/model routing per task: interactive tasks weigh latency, offline tasks weigh cost
+        self.routing = {
+            "tasks": {
+                "question_generation": {"tier": "fast", "interactive": True, "latency_weight": 1.0, "cost_weight": 0.2},
+                "insights": {"tier": "fast", "interactive": True, "latency_weight": 1.0, "cost_weight": 0.2},
+                "offline_insights": {"tier": "large", "interactive": False, "latency_weight": 0.05, "cost_weight": 1.0},
+                "batch": {"tier": "large", "interactive": False, "latency_weight": 0.05, "cost_weight": 1.0}
+            },
+            # Assumed latency until a model has enough samples of its own
+            "default_latency_ms": {"fast": 2500.0, "large": 8000.0},
+            "min_samples": int(os.getenv("AI_ROUTING_MIN_SAMPLES", "5")),
+            "log_decisions": os.getenv("AI_LOG_ROUTING", "true").lower() == "true",
+            "recent_decisions": int(os.getenv("AI_ROUTING_RECENT_DECISIONS", "500"))
+        }
+        
+        # Where /generate-adaptive-questions gets its questions: the curated bank (no quota spent),
+        # "ai" (question_generation route, then templates) or "local" (on-box templates only);
+        # the bank question stays the fallback. Offline deployments default to the templates
+        self.question_generation = {
+            "source": os.getenv("AI_QUESTION_SOURCE", "local" if offline else "bank").lower()
+        }
+        
+        # Batch enrichment: several pending students per provider request, run as a periodic job
+        self.batch_enrichment = {
+            # When enabled, deferred submissions wait for the batch job instead of the per-student workers
+            "enabled": os.getenv("AI_BATCH_ENRICHMENT", "false").lower() == "true",
+            "batch_size": int(os.getenv("AI_BATCH_SIZE", "8")),
+            "concurrency": int(os.getenv("AI_BATCH_CONCURRENCY", "2")),
+            "interval_seconds": int(os.getenv("AI_BATCH_INTERVAL_SECONDS", "30")),
+            "max_students_per_run": int(os.getenv("AI_BATCH_MAX_STUDENTS", "500")),
+            "completion_tokens_per_student": int(os.getenv("AI_BATCH_TOKENS_PER_STUDENT", "450")),
+            # After this many failed batches a student is handed to the per-student path (with mock fallback)
+            "max_attempts": int(os.getenv("AI_BATCH_MAX_ATTEMPTS", "3")),
+            "lease_seconds": int(os.getenv("AI_BATCH_LEASE_SECONDS", "300"))
+        }
+        
+        # Ledger of every provider call's tokens, latency and cost, written to Mongo in batches
+        self.llm_ledger = {
+            "enabled": os.getenv("AI_LLM_LEDGER", "true").lower() == "true",
+            "batch_size": int(os.getenv("AI_LEDGER_BATCH_SIZE", "200")),
+            "flush_interval_seconds": float(os.getenv("AI_LEDGER_FLUSH_SECONDS", "5")),
+            # Records kept in memory while Mongo is unreachable; the oldest are dropped beyond this
+            "max_buffer": int(os.getenv("AI_LEDGER_MAX_BUFFER", "10000")),
+            "retention_days": int(os.getenv("AI_LEDGER_RETENTION_DAYS", "90"))
+        }
+        
+        # Per-request deadline budgets: provider attempts get only what is left, then template insights
+        self.deadlines = {
+            "enabled": os.getenv("AI_DEADLINES_ENABLED", "true").lower() == "true",
+            "header": os.getenv("AI_DEADLINE_HEADER", "X-Request-Deadline-Ms"),
+            "default_ms": float(os.getenv("AI_REQUEST_DEADLINE_MS", "8000")),
+            # Client-supplied budgets are clamped to this range
+            "min_ms": float(os.getenv("AI_REQUEST_DEADLINE_MIN_MS", "200")),
+            "max_ms": float(os.getenv("AI_REQUEST_DEADLINE_MAX_MS", "60000")),
+            # Kept back from provider attempts so the fallback and response still fit in the budget
+            "reserve_ms": float(os.getenv("AI_DEADLINE_RESERVE_MS", "100"))
+        }
+        
+        # Timeouts follow observed latency (percentile x multiplier) within [min, provider timeout]
+        self.adaptive_timeout = {
+            "enabled": os.getenv("AI_ADAPTIVE_TIMEOUT", "true").lower() == "true",
+            "percentile": float(os.getenv("AI_TIMEOUT_PERCENTILE", "99")),
+            "multiplier": float(os.getenv("AI_TIMEOUT_MULTIPLIER", "2.0")),
+            "min_seconds": float(os.getenv("AI_TIMEOUT_MIN_SECONDS", "3")),
+            "min_samples": int(os.getenv("AI_TIMEOUT_MIN_SAMPLES", "20"))
+        }
     
     def get_provider_config(self, provider: AIProvider) -> Dict[str, Any]:
         """Get configuration for a specific provider"""
@@ -71,24 +268,36 @@ class AIConfig:
         """Get the fallback provider"""
         return AIProvider.FALLBACK
     
-    def estimate_cost(self, provider: AIProvider, num_questions: int) -> float:
-        """Estimate cost for generating questions"""
-        config = self.get_provider_config(provider)
+    def estimate_cost(self, provider: AIProvider, prompt_tokens: int, completion_tokens: int = 0,
+                      model: Optional[str] = None) -> float:
+        """Cost in USD of one call's tokens, at the price of the tier serving `model`"""
+        config = self.get_provider_config(AIProvider(provider))
         if not config:
             return 0.0
         
-        # Rough estimate: ~200 tokens per question
-        tokens_per_question = 200
-        total_tokens = num_questions * tokens_per_question
         cost_per_1k = config.get("cost_per_1k_tokens", 0.0)
+        for tier, tier_model in config.get("models", {}).items():
+            if tier_model == model:
+                cost_per_1k = config["model_costs"].get(tier, cost_per_1k)
+                break
         
-        return (total_tokens / 1000) * cost_per_1k
+        return ((prompt_tokens + completion_tokens) / 1000) * cost_per_1k
     
     def get_status_report(self) -> Dict[str, Any]:
         """Get status report of all providers"""
         report = {
             "primary_provider": self.get_primary_provider().value,
             "enabled_providers": [p.value for p in self.enabled_providers],
+            "hedging": self.hedging,
+            "circuit_breaker": self.circuit_breaker,
+            "adaptive_timeout": self.adaptive_timeout,
+            "deadlines": self.deadlines,
+            "batch_enrichment": self.batch_enrichment,
+            "llm_ledger": self.llm_ledger,
+            "rate_limits": self.rate_limits,
+            "routing": self.routing,
+            "question_generation": self.question_generation,
+            "fake_providers_url": self.fake_providers_url,
             "provider_status": {}
         }
         
@@ -101,11 +310,19 @@ class AIConfig:
             if provider == AIProvider.OPENAI:
                 status["api_key_configured"] = bool(config["api_key"])
                 status["model"] = config["model"]
-            elif provider == AIProvider.GEMINI:
-                status["api_key_configured"] = bool(config["api_key"])
+            elif provider in (AIProvider.GEMINI, AIProvider.GROK):
+                status["api_key_configured"] = bool(config["api_keys"])
+                status["api_keys"] = len(config["api_keys"])
                 status["model"] = config["model"]
+                status["models"] = config["models"]
+                status["base_url"] = config["base_url"]
+                status["quota"] = {
+                    key: config[key] for key in ("rpm", "tpm", "daily_requests", "daily_budget_usd")
+                }
             elif provider == AIProvider.LOCAL:
-                status["implementation"] = "Not implemented"
+                status["model"] = config["model"]
+                status["base_url"] = config["base_url"]
+                status["template_questions"] = config["template_questions"]
             
             report["provider_status"][provider.value] = status
         
@@ -139,6 +356,18 @@ def get_recommended_setup() -> Dict[str, str]:
             "Set environment variable: GOOGLE_API_KEY=your_key_here"
         )
     
+    if not ai_config.is_provider_enabled(AIProvider.GROK):
+        setup["grok"] = (
+            "Get Grok API key from https://console.x.ai\n"
+            "Set environment variable: GROK_API_KEY=your_key_here"
+        )
+    
+    if not ai_config.is_provider_enabled(AIProvider.LOCAL):
+        setup["local"] = (
+            "Run an OpenAI-compatible server on the box, e.g. llama.cpp: llama-server -m model.gguf --port 8080\n"
+            "Set environment variable: LOCAL_LLM_BASE_URL=http://127.0.0.1:8080/v1"
+        )
+    
     if not setup:
         setup["status"] = "All available AI providers are configured!"
     
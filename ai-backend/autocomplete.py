@@ -0,0 +1,193 @@
+"""
+Prefix Autocomplete over Streams, Careers, Courses and Colleges
+Keeps a sorted array of normalised keys in memory so a lookup is two bisects plus a
+small top-k, instead of the frontend downloading whole JSON datasets for type-ahead
+"""
+
+import bisect
+import heapq
+import json
+import os
+import re
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+from streams_database import get_all_streams, get_catalog_version
+
+# The shared JSON datasets live at the repository root; override for container deployments
+DATA_DIR = Path(os.getenv("AUTOCOMPLETE_DATA_DIR", Path(__file__).resolve().parent.parent))
+CAREER_OPTIONS_FILE = os.getenv(
+    "CAREER_OPTIONS_FILE", str(DATA_DIR / "backend" / "comprehensive_career_options_after_12th.json")
+)
+COLLEGES_FILE = os.getenv("COLLEGES_FILE", str(DATA_DIR / "colleges_latlong_all.json"))
+
+# Base weight per suggestion type; popularity (how often a term appears across datasets) is added on top
+TYPE_WEIGHTS = {
+    "stream": 4.0,
+    "career": 3.0,
+    "course": 2.0,
+    "college": 1.0
+}
+
+# Prefixes up to this length are answered from a precomputed top-k table
+PRECOMPUTED_PREFIX_LENGTH = 2
+PRECOMPUTED_TOP_K = 20
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse punctuation so "B.Tech/B.E" matches "btech" and "b tech" alike"""
+    text = text.lower().replace(".", "")
+    return re.sub(r"[^\w]+", " ", text).strip()
+
+
+def _load_json(path: str) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Autocomplete: could not load {path}: {e}")
+        return None
+
+
+def _iter_course_entries(node: Any) -> Iterable[Dict[str, Any]]:
+    """Walk the nested career options file and yield every course entry"""
+    if isinstance(node, dict):
+        if "course" in node:
+            yield node
+        else:
+            for value in node.values():
+                yield from _iter_course_entries(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _iter_course_entries(item)
+
+
+def _college_display_name(name: str) -> str:
+    """Trim the geocoding suffix ("..., Srinagar, Jammu and Kashmir, India") down to name and city"""
+    parts = [part.strip() for part in name.split(",")]
+    if len(parts) > 2 and parts[-1].lower() == "india":
+        parts = parts[:-2]
+    return ", ".join(parts[:2])
+
+
+class AutocompleteIndex:
+    """Sorted-array prefix index with popularity-weighted top-k"""
+
+    def __init__(self, catalog_version: str):
+        self.catalog_version = catalog_version
+        self.entries: List[Dict[str, Any]] = []
+        self._entry_ids: Dict[Tuple[str, str], int] = {}
+
+        self._add_catalog()
+        self._add_career_options()
+        self._add_colleges()
+
+        # Index every word start so "srinagar" also finds "NIT Srinagar"
+        keyed = []
+        for entry_id, entry in enumerate(self.entries):
+            normalized = normalize_text(entry["text"])
+            words = normalized.split()
+            for i in range(len(words)):
+                keyed.append((" ".join(words[i:]), entry_id))
+            for alias in entry.pop("aliases", []):
+                keyed.append((normalize_text(alias), entry_id))
+        keyed.sort()
+        self.keys = [key for key, _ in keyed]
+        self.key_entries = [entry_id for _, entry_id in keyed]
+
+        self.precomputed: Dict[str, List[int]] = {}
+        prefixes = {key[:n] for key in self.keys for n in range(1, PRECOMPUTED_PREFIX_LENGTH + 1)}
+        for prefix in prefixes:
+            self.precomputed[prefix] = self._scan(prefix, PRECOMPUTED_TOP_K, None)
+
+    def _add(self, text: str, suggestion_type: str, aliases: Optional[List[str]] = None, **extra):
+        """Add a suggestion, or bump its popularity if the same text/type was already seen"""
+        text = (text or "").strip()
+        if not text:
+            return
+        key = (normalize_text(text), suggestion_type)
+        if key in self._entry_ids:
+            entry = self.entries[self._entry_ids[key]]
+            entry["popularity"] += 1
+            entry.setdefault("aliases", []).extend(aliases or [])
+            return
+        self._entry_ids[key] = len(self.entries)
+        self.entries.append({
+            "text": text,
+            "type": suggestion_type,
+            "popularity": 1,
+            "aliases": list(aliases or []),
+            **extra
+        })
+
+    def _add_catalog(self):
+        for stream in get_all_streams():
+            self._add(stream["name"], "stream", category=stream.get("category"))
+            for career in stream.get("career_paths", []):
+                self._add(career, "career", stream=stream["name"])
+            for college in stream.get("top_colleges", []):
+                self._add(college, "college")
+
+    def _add_career_options(self):
+        data = _load_json(CAREER_OPTIONS_FILE)
+        if data is None:
+            return
+        for entry in _iter_course_entries(data):
+            full_form = entry.get("full_form")
+            self._add(entry["course"], "course", aliases=[full_form] if full_form else [],
+                      duration=entry.get("duration"))
+
+    def _add_colleges(self):
+        data = _load_json(COLLEGES_FILE)
+        if not isinstance(data, list):
+            return
+        for college in data:
+            if isinstance(college, dict) and college.get("name"):
+                self._add(_college_display_name(college["name"]), "college")
+
+    def weight(self, entry_id: int) -> float:
+        entry = self.entries[entry_id]
+        return TYPE_WEIGHTS.get(entry["type"], 0.0) + entry["popularity"]
+
+    def _scan(self, prefix: str, limit: int, types: Optional[set]) -> List[int]:
+        """Top-k entry ids for a prefix by scanning its slice of the sorted keys"""
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_right(self.keys, prefix + "\uffff")
+        candidates = {
+            entry_id for entry_id in self.key_entries[start:end]
+            if types is None or self.entries[entry_id]["type"] in types
+        }
+        return heapq.nlargest(limit, candidates, key=lambda entry_id: (self.weight(entry_id), -entry_id))
+
+    def suggest(self, query: str, limit: int = 8, types: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` suggestions whose text (or any word in it) starts with ``query``"""
+        prefix = normalize_text(query)
+        if not prefix:
+            return []
+        type_filter = set(types) if types else None
+
+        if type_filter is None and len(prefix) <= PRECOMPUTED_PREFIX_LENGTH and limit <= PRECOMPUTED_TOP_K:
+            entry_ids = self.precomputed.get(prefix, [])[:limit]
+        else:
+            entry_ids = self._scan(prefix, limit, type_filter)
+
+        suggestions = []
+        for entry_id in entry_ids:
+            entry = self.entries[entry_id]
+            suggestion = {"text": entry["text"], "type": entry["type"]}
+            if entry.get("stream"):
+                suggestion["stream"] = entry["stream"]
+            suggestions.append(suggestion)
+        return suggestions
+
+
+_autocomplete_index: Optional[AutocompleteIndex] = None
+
+
+def get_autocomplete_index() -> AutocompleteIndex:
+    """Get the autocomplete index, rebuilding it when the catalog version changes"""
+    global _autocomplete_index
+    version = get_catalog_version()
+    if _autocomplete_index is None or _autocomplete_index.catalog_version != version:
+        _autocomplete_index = AutocompleteIndex(version)
+    return _autocomplete_index
@@ -0,0 +1,364 @@
+"""
+Batch AI Insight Enrichment
+Packs compact summaries of several pending students into one provider request, validates
+each student's section on its own and re-queues only the students whose section failed,
+so cohort runs pay the instructions and schema once per batch instead of once per student
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from ai_config import ai_config
+from db import recommendations_collection
+from provider_clients import LLMResponse, ProviderError, provider_registry
+from psychometric_ai import psychometric_ai, RECOMMENDATION_REQUEST_OPTIONS
+from provider_router import provider_router
+from insight_cache import insight_cache, insight_cache_key
+from deferred_insights import deferred_insights, job_from_document, patch_recommendations
+from llm_output import LLMOutputError, extract_json, validate_insight, parse_stats
+from llm_ledger import ledger_scope
+
+BATCH_SYSTEM_PROMPT = (
+    "You are a career counselor specializing in Jammu & Kashmir students. "
+    "Provide practical, actionable advice for every student you are given."
+)
+
+
+def compact_student_summary(student_id: str, trait_scores: Dict[str, float],
+                            academic_performance: Dict[str, float],
+                            basic_recommendations: List[Dict[str, Any]]) -> str:
+    """One prompt line with the same features the single-student prompt uses"""
+    top_traits = sorted(trait_scores.items(), key=lambda x: x[1], reverse=True)[:3]
+    strong_subjects = [subj for subj, score in academic_performance.items() if score > 75]
+    weak_subjects = [subj for subj, score in academic_performance.items() if score < 60]
+    scores = academic_performance.values()
+    average = f"{sum(scores) / len(scores):.0f}%" if scores else "n/a"
+    return " | ".join([
+        student_id,
+        "traits: " + ", ".join(f'{trait.replace("_", " ").title()} {score:.0%}' for trait, score in top_traits),
+        "strong: " + (", ".join(strong_subjects) or "none"),
+        "weak: " + (", ".join(weak_subjects) or "none"),
+        f"avg: {average}",
+        "streams: " + "; ".join(f"{rec['stream']} ({rec['match_percentage']}%)" for rec in basic_recommendations[:3])
+    ])
+
+
+def build_batch_prompt(summaries: List[str]) -> str:
+    return f"""Analyze these J&K students' profiles and provide personalized career stream insights for each.
+
+STUDENTS (id | top traits | strong subjects >75% | weak subjects <60% | average | top streams with match %):
+{chr(10).join(summaries)}
+
+For every student and each of their listed streams, provide:
+1. Why this stream fits their personality and academic profile
+2. Specific career opportunities in Jammu & Kashmir context
+3. Potential challenges and how to overcome them
+4. Actionable next steps for this student
+
+Return ONLY this JSON, with one entry per student id and the stream names exactly as listed:
+{{
+  "students": [
+    {{
+      "id": "S1",
+      "enhanced_recommendations": [
+        {{
+          "stream": "Stream Name",
+          "personality_fit": "Brief explanation of personality match...",
+          "jk_opportunities": "Specific J&K career opportunities...",
+          "challenges": "Main challenges and solutions...",
+          "next_steps": "3-4 actionable steps...",
+          "confidence": 0.85
+        }}
+      ],
+      "overall_guidance": "General career advice for this student profile..."
+    }}
+  ]
+}}"""
+
+
+def parse_batch_response(text: str) -> Dict[str, Dict[str, Any]]:
+    """Student sections keyed by id; a reply cut off at the token limit keeps its complete sections"""
+    try:
+        result, outcome = extract_json(text, dict)
+    except LLMOutputError:
+        parse_stats.record("batch", "failed")
+        return {}
+    students = result.get("students")
+    if not isinstance(students, list):
+        parse_stats.record("batch", "failed")
+        return {}
+    parse_stats.record("batch", outcome)
+    return {
+        str(section["id"]): section
+        for section in students
+        if isinstance(section, dict) and section.get("id") is not None
+    }
+
+
+def validate_section(section: Optional[Dict[str, Any]], streams: List[str]) -> Optional[Dict[str, Any]]:
+    """The student's analysis if it covers every listed stream, else None"""
+    if not isinstance(section, dict) or not isinstance(section.get("enhanced_recommendations"), list):
+        return None
+    by_stream = {
+        ai_rec["stream"]: ai_rec
+        for ai_rec in (validate_insight(item) for item in section["enhanced_recommendations"])
+        if ai_rec is not None
+    }
+    enhanced = []
+    for stream in streams:
+        ai_rec = by_stream.get(stream)
+        if not ai_rec or not ai_rec["next_steps"]:
+            return None
+        enhanced.append(ai_rec)
+    analysis: Dict[str, Any] = {"enhanced_recommendations": enhanced}
+    if isinstance(section.get("overall_guidance"), str):
+        analysis["overall_guidance"] = section["overall_guidance"]
+    return analysis
+
+
+class BatchEnrichmentJob:
+    """Claims pending stream_recommendations documents and enriches them in batches"""
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.settings = settings
+        self.task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.stats = {
+            "runs": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "students_enriched": 0,
+            "students_reused": 0,
+            "students_failed": 0,
+            "students_handed_off": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "estimated_token_calls": 0,
+            "busy_seconds": 0.0
+        }
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def start(self):
+        """Run the job every interval_seconds on the app's event loop"""
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._loop())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                print(f"Batch enrichment run failed: {e}")
+            await asyncio.sleep(self.settings["interval_seconds"])
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _claim(self, limit: int) -> List[Dict[str, Any]]:
+        """Lease up to `limit` pending documents so the sweeper and other runs skip them"""
+        now = datetime.utcnow()
+        docs = list(recommendations_collection.find(
+            {
+                "insights_pending": True,
+                "batch_lease_until": {"$not": {"$gt": now}},
+                "batch_attempts": {"$not": {"$gte": self.settings["max_attempts"]}}
+            },
+            {"_id": 0, "user_id": 1, "assessment_id": 1, "recommended_streams": 1, "batch_attempts": 1,
+             "trait_scores_snapshot": 1, "academic_performance_snapshot": 1},
+            sort=[("generated_at", 1)]
+        ).limit(limit))
+        if docs:
+            recommendations_collection.update_many(
+                {"assessment_id": {"$in": [doc["assessment_id"] for doc in docs]}},
+                {"$set": {"batch_lease_until": now + timedelta(seconds=self.settings["lease_seconds"])}}
+            )
+        return docs
+
+    def _release_failed(self, assessment_ids: List[str]):
+        """Put failed students back in the pending pool for the next run"""
+        recommendations_collection.update_many(
+            {"assessment_id": {"$in": assessment_ids}, "insights_pending": True},
+            {"$inc": {"batch_attempts": 1}, "$unset": {"batch_lease_until": ""}}
+        )
+
+    async def run(self, max_students: Optional[int] = None, batch_size: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Enrich one round of pending documents; None if a run is already in progress"""
+        if self._lock.locked():
+            return None
+        async with self._lock:
+            # One prompt covers many students, so calls are not attributed to a user
+            with ledger_scope("batch_enrichment"):
+                return await self._run(
+                    max_students or self.settings["max_students_per_run"],
+                    max(1, batch_size or self.settings["batch_size"])
+                )
+
+    async def _run(self, max_students: int, batch_size: int) -> Dict[str, Any]:
+        start = time.perf_counter()
+        docs = await run_in_threadpool(self._claim, max_students)
+        summary = {
+            "claimed": len(docs),
+            "reused": 0,
+            "enriched": 0,
+            "failed": 0,
+            "handed_off": 0,
+            "batches": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0
+        }
+        if not docs:
+            return self._finish(summary, start)
+        attempts = {doc["assessment_id"]: doc.get("batch_attempts", 0) for doc in docs}
+        jobs = [job_from_document(doc) for doc in docs]
+
+        # Profiles that already have an analysis (prompt cache or cohort cluster) skip the provider
+        reused = await asyncio.gather(*[
+            psychometric_ai._reuse_ai_analysis(job["trait_scores"], job["academic_performance"],
+                                               job["recommended_streams"])
+            for job in jobs
+        ])
+        # Students with the same prompt key share one slot in the batch
+        slots: Dict[str, List[Dict[str, Any]]] = {}
+        for job, analysis in zip(jobs, reused):
+            if analysis is not None:
+                await self._apply(job, analysis)
+                summary["reused"] += 1
+                continue
+            key = insight_cache_key(job["trait_scores"], job["academic_performance"], job["recommended_streams"])
+            slots.setdefault(key, []).append(job)
+
+        keys = list(slots)
+        batches = [keys[i:i + batch_size] for i in range(0, len(keys), batch_size)]
+        semaphore = asyncio.Semaphore(self.settings["concurrency"])
+
+        async def run_batch(batch_keys: List[str]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self._enrich_batch(batch_keys, slots, summary)
+
+        failed_jobs = [job for failed in await asyncio.gather(*[run_batch(batch) for batch in batches])
+                       for job in failed]
+        summary["batches"] = len(batches)
+
+        if failed_jobs:
+            await run_in_threadpool(self._release_failed, [job["assessment_id"] for job in failed_jobs])
+            for job in failed_jobs:
+                if attempts[job["assessment_id"]] + 1 >= self.settings["max_attempts"]:
+                    # Out of batch attempts: the per-student path falls back to template insights
+                    if deferred_insights.enqueue(job):
+                        summary["handed_off"] += 1
+        summary["failed"] = len(failed_jobs)
+        return self._finish(summary, start)
+
+    async def _enrich_batch(self, batch_keys: List[str], slots: Dict[str, List[Dict[str, Any]]],
+                            summary: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """One provider request for the batch; returns the jobs whose section did not validate"""
+        ids = {f"S{i + 1}": key for i, key in enumerate(batch_keys)}
+        summaries = []
+        for student_id, key in ids.items():
+            job = slots[key][0]
+            summaries.append(compact_student_summary(
+                student_id, job["trait_scores"], job["academic_performance"], job["recommended_streams"]
+            ))
+        prompt = build_batch_prompt(summaries)
+        max_tokens = 200 + self.settings["completion_tokens_per_student"] * len(ids)
+
+        response = await self._request(prompt, max_tokens)
+        self.stats["batches"] += 1
+        all_jobs = [job for key in batch_keys for job in slots[key]]
+        if response is None:
+            self.stats["failed_batches"] += 1
+            return all_jobs
+        self._count_tokens(prompt, response, summary)
+
+        sections = parse_batch_response(response.text)
+        failed = []
+        for student_id, key in ids.items():
+            streams = [rec["stream"] for rec in slots[key][0]["recommended_streams"][:3]]
+            analysis = validate_section(sections.get(student_id), streams)
+            if analysis is None:
+                failed.extend(slots[key])
+                continue
+            await insight_cache.put(key, analysis, response.provider)
+            for job in slots[key]:
+                await self._apply(job, analysis)
+                summary["enriched"] += 1
+        return failed
+
+    async def _request(self, prompt: str, max_tokens: int) -> Optional[LLMResponse]:
+        # Offline work: the router picks the large model tier and weighs cost over latency
+        for provider, options in provider_router.plan("batch", RECOMMENDATION_REQUEST_OPTIONS):
+            try:
+                return await provider_registry.get_client(provider).agenerate(
+                    prompt, **{**options, "system_prompt": BATCH_SYSTEM_PROMPT, "max_tokens": max_tokens}
+                )
+            except ProviderError as e:
+                print(f"{provider.value.title()} batch request failed: {e}")
+        return None
+
+    def _count_tokens(self, prompt: str, response: LLMResponse, summary: Dict[str, Any]):
+        prompt_tokens, completion_tokens = response.prompt_tokens, response.completion_tokens
+        if prompt_tokens is None or completion_tokens is None:
+            # Provider did not report usage; ~4 characters per token
+            prompt_tokens = prompt_tokens if prompt_tokens is not None else len(prompt) // 4
+            completion_tokens = completion_tokens if completion_tokens is not None else len(response.text) // 4
+            self.stats["estimated_token_calls"] += 1
+        summary["prompt_tokens"] += prompt_tokens
+        summary["completion_tokens"] += completion_tokens
+
+    async def _apply(self, job: Dict[str, Any], analysis: Dict[str, Any]):
+        enhanced = psychometric_ai._merge_ai_analysis(analysis, job["recommended_streams"])
+        await run_in_threadpool(patch_recommendations, job["user_id"], job["assessment_id"], enhanced)
+
+    def _finish(self, summary: Dict[str, Any], start: float) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - start
+        done = summary["reused"] + summary["enriched"]
+        tokens = summary["prompt_tokens"] + summary["completion_tokens"]
+        summary["elapsed_seconds"] = round(elapsed, 2)
+        summary["students_per_second"] = round(done / elapsed, 2) if done and elapsed > 0 else None
+        summary["tokens_per_student"] = round(tokens / summary["enriched"], 1) if summary["enriched"] else None
+        summary["finished_at"] = datetime.utcnow().isoformat()
+
+        self.stats["runs"] += 1
+        self.stats["students_enriched"] += summary["enriched"]
+        self.stats["students_reused"] += summary["reused"]
+        self.stats["students_failed"] += summary["failed"]
+        self.stats["students_handed_off"] += summary["handed_off"]
+        self.stats["prompt_tokens"] += summary["prompt_tokens"]
+        self.stats["completion_tokens"] += summary["completion_tokens"]
+        self.stats["busy_seconds"] += elapsed
+        self.last_run = summary
+        if summary["claimed"]:
+            print(f"Batch enrichment: {done}/{summary['claimed']} students in {elapsed:.1f}s "
+                  f"({summary['batches']} batches, {summary['failed']} re-queued)")
+        return summary
+
+    def get_stats(self) -> Dict[str, Any]:
+        enriched = self.stats["students_enriched"]
+        done = enriched + self.stats["students_reused"]
+        busy = self.stats["busy_seconds"]
+        tokens = self.stats["prompt_tokens"] + self.stats["completion_tokens"]
+        return {
+            **{key: value for key, value in self.stats.items() if key != "busy_seconds"},
+            "enabled": self.settings["enabled"],
+            "scheduled": self.task is not None,
+            "running": self.running,
+            "batch_size": self.settings["batch_size"],
+            "students_per_second": round(done / busy, 2) if done and busy > 0 else None,
+            "tokens_per_student": round(tokens / enriched, 1) if enriched else None,
+            "last_run": self.last_run
+        }
+
+
+# Global job instance
+batch_enrichment = BatchEnrichmentJob(ai_config.batch_enrichment)
@@ -0,0 +1,126 @@
+"""
+Per-provider Circuit Breaker
+Trips when a provider's recent calls fail or run slow too often, so callers skip it at once
+instead of waiting out a timeout, then lets a few probe calls through to detect recovery
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open"""
+
+
+class CircuitBreaker:
+    """closed -> open on high error or slow-call rate; open -> half_open after a cooldown;
+    half_open -> closed after enough successful probes, or back to open on any failure"""
+
+    def __init__(self, name: str, settings: Dict[str, Any]):
+        self.name = name
+        self.window_size = settings["window_size"]
+        self.min_calls = settings["min_calls"]
+        self.error_rate_threshold = settings["error_rate_threshold"]
+        self.slow_call_ms = settings["slow_call_ms"]
+        self.slow_rate_threshold = settings["slow_rate_threshold"]
+        self.open_seconds = settings["open_seconds"]
+        self.half_open_calls = settings["half_open_calls"]
+
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=self.window_size)  # (failed, slow)
+        self.opened_at: Optional[float] = None
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self.last_trip_reason: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _open(self, reason: str):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self.last_trip_reason = reason
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        print(f"Circuit breaker for {self.name} opened: {reason}")
+
+    def is_open(self) -> bool:
+        """True while the cooldown runs; does not reserve a probe slot"""
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.open_seconds
+
+    def acquire(self):
+        """Reserve permission for one call or raise CircuitOpenError"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} circuit open")
+                self.state = HALF_OPEN
+                self.probes_in_flight = 0
+                self.probe_successes = 0
+            if self.state == HALF_OPEN:
+                if self.probes_in_flight >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} circuit half-open, probes in flight")
+                self.probes_in_flight += 1
+
+    def release(self):
+        """Give back a reserved call that ended without an outcome (e.g. cancelled by a hedge)"""
+        with self._lock:
+            if self.state == HALF_OPEN and self.probes_in_flight > 0:
+                self.probes_in_flight -= 1
+
+    def record(self, success: bool, latency_ms: float):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                if not success:
+                    self._open("probe failed")
+                    return
+                self.probe_successes += 1
+                if self.probe_successes >= self.half_open_calls:
+                    self.state = CLOSED
+                    self.outcomes.clear()
+                    print(f"Circuit breaker for {self.name} closed")
+                return
+            if self.state == OPEN:
+                # A call that started before the trip; it says nothing new
+                return
+
+            self.outcomes.append((not success, latency_ms >= self.slow_call_ms))
+            if len(self.outcomes) < self.min_calls:
+                return
+            error_rate = sum(failed for failed, _ in self.outcomes) / len(self.outcomes)
+            slow_rate = sum(slow for _, slow in self.outcomes) / len(self.outcomes)
+            if error_rate >= self.error_rate_threshold:
+                self._open(f"error rate {error_rate:.0%} over last {len(self.outcomes)} calls")
+            elif slow_rate >= self.slow_rate_threshold:
+                self._open(f"{slow_rate:.0%} of last {len(self.outcomes)} calls slower than {self.slow_call_ms:.0f}ms")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            outcomes = list(self.outcomes)
+            state = self.state
+            retry_in = None
+            if state == OPEN:
+                retry_in = max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+                if retry_in == 0.0:
+                    state = HALF_OPEN  # the next call will be a probe
+            return {
+                "state": state,
+                "window_calls": len(outcomes),
+                "error_rate": round(sum(f for f, _ in outcomes) / len(outcomes), 3) if outcomes else 0.0,
+                "slow_call_rate": round(sum(s for _, s in outcomes) / len(outcomes), 3) if outcomes else 0.0,
+                "times_opened": self.times_opened,
+                "rejected_calls": self.rejected,
+                "last_trip_reason": self.last_trip_reason,
+                "retry_in_seconds": round(retry_in, 1) if retry_in is not None else None
+            }
@@ -0,0 +1,428 @@
+"""
+Trait-space Cohort Clusters for Reusable AI Insights
+Clusters stored profiles in trait x academic space with k-means, generates provider insights
+once per cluster x top stream, and serves them to any student close enough to a centroid
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from db import answers_collection, cluster_collection
+from streams_database import get_all_streams, get_catalog_version, search_streams_by_requirements
+from student_index import TRAIT_NAMES, SUBJECT_GROUPS, ACADEMIC_WEIGHT, build_profile_vector
+
+CLUSTER_K = int(os.getenv("CLUSTER_K", "32"))
+CLUSTER_MAX_PROFILES = int(os.getenv("CLUSTER_MAX_PROFILES", "200000"))
+# Streams per cluster that get insights; generated three per provider call
+CLUSTER_STREAMS_PER_CLUSTER = int(os.getenv("CLUSTER_STREAMS_PER_CLUSTER", "6"))
+# A student is served from a cluster only within this percentile of its members' distances
+CLUSTER_RADIUS_PERCENTILE = float(os.getenv("CLUSTER_RADIUS_PERCENTILE", "90"))
+CLUSTER_INSIGHT_CONCURRENCY = int(os.getenv("CLUSTER_INSIGHT_CONCURRENCY", "4"))
+
+SILHOUETTE_SAMPLE = 2000
+MODEL_ID = "current"
+RELOAD_INTERVAL_SECONDS = 60
+
+AnalysisFetcher = Callable[[Dict[str, float], Dict[str, float], List[Dict[str, Any]]],
+                           Awaitable[Tuple[Dict[str, Any], str]]]
+
+
+def _squared_distances(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """(n, k) squared euclidean distances via ||a||^2 + ||b||^2 - 2ab"""
+    distances = (
+        np.einsum("ij,ij->i", points, points)[:, None]
+        + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+        - 2.0 * points @ centroids.T
+    )
+    return np.maximum(distances, 0.0)
+
+
+def kmeans(points: np.ndarray, k: int, max_iter: int = 100, tol: float = 1e-5,
+           seed: int = 0) -> Tuple[np.ndarray, np.ndarray, float, int]:
+    """Lloyd's k-means with k-means++ seeding; returns (centroids, labels, inertia, iterations)"""
+    n = len(points)
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+
+    centroids = np.empty((k, points.shape[1]), dtype=points.dtype)
+    centroids[0] = points[rng.integers(n)]
+    closest = _squared_distances(points, centroids[:1])[:, 0]
+    for i in range(1, k):
+        total = closest.sum()
+        index = rng.choice(n, p=closest / total) if total > 0 else rng.integers(n)
+        centroids[i] = points[index]
+        closest = np.minimum(closest, _squared_distances(points, centroids[i:i + 1])[:, 0])
+
+    labels = np.zeros(n, dtype=np.int64)
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        distances = _squared_distances(points, centroids)
+        labels = distances.argmin(axis=1)
+
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, points)
+        updated = centroids.copy()
+        filled = counts > 0
+        updated[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters with the points that are currently worst served
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            worst = np.argsort(distances[np.arange(n), labels])[::-1][:len(empty)]
+            updated[empty] = points[worst]
+
+        shift = float(np.max(np.linalg.norm(updated - centroids, axis=1)))
+        centroids = updated
+        if shift < tol:
+            break
+
+    distances = _squared_distances(points, centroids)
+    labels = distances.argmin(axis=1)
+    inertia = float(distances[np.arange(n), labels].sum())
+    return centroids, labels, inertia, iterations
+
+
+def silhouette_score(points: np.ndarray, labels: np.ndarray, sample_size: int = SILHOUETTE_SAMPLE,
+                     seed: int = 0) -> Optional[float]:
+    """Mean silhouette over a random sample (exact pairwise distances within the sample)"""
+    if len(np.unique(labels)) < 2:
+        return None
+    rng = np.random.default_rng(seed)
+    if len(points) > sample_size:
+        chosen = rng.choice(len(points), sample_size, replace=False)
+        points, labels = points[chosen], labels[chosen]
+
+    distances = np.sqrt(_squared_distances(points, points))
+    clusters, labels = np.unique(labels, return_inverse=True)
+    one_hot = np.eye(len(clusters), dtype=points.dtype)[labels]
+    counts = one_hot.sum(axis=0)
+    sums = distances @ one_hot
+
+    own = sums[np.arange(len(points)), labels]
+    own_counts = counts[labels] - 1
+    a = np.divide(own, own_counts, out=np.zeros_like(own), where=own_counts > 0)
+    mean_to_cluster = sums / np.maximum(counts, 1)
+    mean_to_cluster[np.arange(len(points)), labels] = np.inf
+    b = mean_to_cluster.min(axis=1)
+
+    scores = np.where(own_counts > 0, (b - a) / np.maximum(np.maximum(a, b), 1e-12), 0.0)
+    return float(scores.mean())
+
+
+def centroid_profile(centroid: np.ndarray) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """Decode a centroid back into (trait_scores, academic_performance) for prompting"""
+    traits = {trait: round(float(centroid[i]), 3) for i, trait in enumerate(TRAIT_NAMES)}
+    offset = len(TRAIT_NAMES)
+    academics = {
+        group: round(float(centroid[offset + i]) / ACADEMIC_WEIGHT * 100, 1)
+        for i, group in enumerate(SUBJECT_GROUPS)
+    }
+    return traits, academics
+
+
+def _profile_streams(doc: Dict[str, Any]) -> List[str]:
+    """A stored profile's top streams, preferring the reverse-index scores when present"""
+    if doc.get("top_stream_scores"):
+        return [entry["stream"] for entry in doc["top_stream_scores"][:3]]
+    return [rec.get("stream") for rec in (doc.get("recommended_streams") or [])[:3] if rec.get("stream")]
+
+
+def load_profiles(max_profiles: int = CLUSTER_MAX_PROFILES) -> Tuple[np.ndarray, List[List[str]]]:
+    projection = {
+        "trait_scores": 1,
+        "academic_performance": 1,
+        "top_stream_scores": 1,
+        "recommended_streams": {"$slice": 3}
+    }
+    vectors = []
+    streams = []
+    for doc in answers_collection.find({"trait_scores": {"$exists": True}}, projection).limit(max_profiles):
+        if not doc.get("trait_scores"):
+            continue
+        vectors.append(build_profile_vector(doc["trait_scores"], doc.get("academic_performance") or {}))
+        streams.append(_profile_streams(doc))
+    dimensions = len(TRAIT_NAMES) + len(SUBJECT_GROUPS) + 1
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, dimensions), dtype=np.float32)
+    return matrix, streams
+
+
+def fit_clusters(points: np.ndarray, profile_streams: List[List[str]], k: int, seed: int = 0) -> Dict[str, Any]:
+    """Fit k-means and summarise each cluster (size, radius, most common top streams)"""
+    start = time.perf_counter()
+    centroids, labels, inertia, iterations = kmeans(points, k, seed=seed)
+    distances = np.sqrt(_squared_distances(points, centroids)[np.arange(len(points)), labels])
+
+    clusters = []
+    for cluster_id in range(len(centroids)):
+        members = np.flatnonzero(labels == cluster_id)
+        stream_counts = Counter(stream for i in members for stream in profile_streams[i])
+        clusters.append({
+            "cluster": cluster_id,
+            "size": int(len(members)),
+            "centroid": centroids[cluster_id].astype(float).tolist(),
+            "radius": float(np.percentile(distances[members], CLUSTER_RADIUS_PERCENTILE)) if len(members) else 0.0,
+            "mean_distance": float(distances[members].mean()) if len(members) else 0.0,
+            "top_streams": [stream for stream, _ in stream_counts.most_common(CLUSTER_STREAMS_PER_CLUSTER)],
+            "insights": {},
+            "overall_guidance": None
+        })
+
+    sizes = [cluster["size"] for cluster in clusters]
+    silhouette = silhouette_score(points, labels, seed=seed)
+    return {
+        "k": len(centroids),
+        "profiles": int(len(points)),
+        "clusters": clusters,
+        "quality": {
+            "inertia": round(inertia, 4),
+            "mean_distance": round(float(distances.mean()), 4) if len(distances) else None,
+            "silhouette": round(silhouette, 4) if silhouette is not None else None,
+            "min_cluster_size": min(sizes) if sizes else 0,
+            "max_cluster_size": max(sizes) if sizes else 0,
+            "iterations": iterations,
+            "fit_seconds": round(time.perf_counter() - start, 3)
+        },
+        # One provider call per three streams per cluster
+        "estimated_llm_calls": sum(-(-len(cluster["top_streams"]) // 3) for cluster in clusters)
+    }
+
+
+def evaluate_k(k_values: List[int], max_profiles: int = CLUSTER_MAX_PROFILES) -> List[Dict[str, Any]]:
+    """Cluster quality against insight generation cost for several k, without saving anything"""
+    points, profile_streams = load_profiles(max_profiles)
+    if len(points) == 0:
+        return []
+    results = []
+    for k in k_values:
+        fitted = fit_clusters(points, profile_streams, k)
+        results.append({"k": fitted["k"], "quality": fitted["quality"],
+                        "estimated_llm_calls": fitted["estimated_llm_calls"]})
+    return results
+
+
+def build_cluster_model(k: int = CLUSTER_K, max_profiles: int = CLUSTER_MAX_PROFILES) -> Optional[Dict[str, Any]]:
+    """Fit clusters over stored profiles; insights are added by generate_cluster_insights"""
+    points, profile_streams = load_profiles(max_profiles)
+    if len(points) == 0:
+        return None
+    model = fit_clusters(points, profile_streams, k)
+    model.update({
+        "_id": MODEL_ID,
+        "catalog_version": get_catalog_version(),
+        "trained_at": datetime.now(timezone.utc),
+        "insights_generated_at": None,
+        "llm_calls": 0
+    })
+    return model
+
+
+async def generate_cluster_insights(model: Dict[str, Any], fetch: AnalysisFetcher) -> Dict[str, Any]:
+    """Ask the providers for insights on each cluster's top streams, three streams per call
+
+    ``fetch`` is the recommendation pipeline's (traits, academics, recommendations) ->
+    (analysis, provider) coroutine, so cluster insights use the same prompt and parsing.
+    """
+    streams_by_name = {stream["name"]: stream for stream in get_all_streams()}
+    semaphore = asyncio.Semaphore(CLUSTER_INSIGHT_CONCURRENCY)
+    failures = 0
+
+    async def enrich(cluster: Dict[str, Any], names: List[str]):
+        nonlocal failures
+        traits, academics = centroid_profile(np.array(cluster["centroid"], dtype=np.float32))
+        matches = search_streams_by_requirements(
+            traits, academics, threshold=0.0,
+            streams=[streams_by_name[name] for name in names if name in streams_by_name]
+        )
+        recommendations = [
+            {"stream": match["stream_data"]["name"], "match_percentage": round(match["match_score"] * 100, 1)}
+            for match in matches
+        ]
+        if not recommendations:
+            return
+        async with semaphore:
+            try:
+                analysis, _ = await fetch(traits, academics, recommendations)
+            except Exception as e:
+                print(f"Cluster {cluster['cluster']} insight generation failed: {e}")
+                failures += 1
+                return
+        model["llm_calls"] += 1
+        for ai_rec in analysis.get("enhanced_recommendations", []):
+            if ai_rec.get("stream") in names:
+                cluster["insights"][ai_rec["stream"]] = ai_rec
+        if cluster["overall_guidance"] is None and analysis.get("overall_guidance"):
+            cluster["overall_guidance"] = analysis["overall_guidance"]
+
+    jobs = []
+    for cluster in model["clusters"]:
+        streams = cluster["top_streams"]
+        for i in range(0, len(streams), 3):
+            jobs.append(enrich(cluster, streams[i:i + 3]))
+    await asyncio.gather(*jobs)
+
+    model["insights_generated_at"] = datetime.now(timezone.utc)
+    model["insight_failures"] = failures
+    return model
+
+
+def save_cluster_model(model: Dict[str, Any]):
+    cluster_collection.replace_one({"_id": MODEL_ID}, model, upsert=True)
+    cluster_model.invalidate()
+
+
+class ClusterInsightModel:
+    """In-memory centroids and per-cluster insights, reloaded when a new model is saved"""
+
+    def __init__(self):
+        self.model: Optional[Dict[str, Any]] = None
+        self.centroids: Optional[np.ndarray] = None
+        self.radii: Optional[np.ndarray] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "hits": 0,
+            "no_model": 0,
+            "too_far": 0,
+            "streams_not_covered": 0,
+            "stale_catalog": 0
+        }
+
+    def invalidate(self):
+        self._last_check = 0.0
+
+    def _reload(self):
+        with self._lock:
+            doc = cluster_collection.find_one({"_id": MODEL_ID})
+            if doc and doc.get("insights_generated_at") and doc.get("clusters"):
+                if self.model is None or doc["trained_at"] != self.model["trained_at"] \
+                        or doc["insights_generated_at"] != self.model["insights_generated_at"]:
+                    self.model = doc
+                    self.centroids = np.array([c["centroid"] for c in doc["clusters"]], dtype=np.float32)
+                    self.radii = np.array([c["radius"] for c in doc["clusters"]], dtype=np.float32)
+            self._last_check = time.monotonic()
+
+    async def ensure_loaded(self):
+        if time.monotonic() - self._last_check > RELOAD_INTERVAL_SECONDS:
+            try:
+                await run_in_threadpool(self._reload)
+            except Exception as e:
+                print(f"Failed to load cluster model: {e}")
+                self._last_check = time.monotonic()
+
+    def assign(self, trait_scores: Dict[str, float],
+               academic_performance: Dict[str, float]) -> Optional[Tuple[int, float]]:
+        """Nearest centroid and the distance to it"""
+        if self.centroids is None:
+            return None
+        vector = build_profile_vector(trait_scores, academic_performance)
+        distances = np.sqrt(_squared_distances(vector[None, :], self.centroids)[0])
+        cluster_id = int(distances.argmin())
+        return cluster_id, float(distances[cluster_id])
+
+    async def lookup(self, trait_scores: Dict[str, float], academic_performance: Dict[str, float],
+                     basic_recommendations: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """The cluster's analysis for the student's top 3 streams, or None if it does not fit"""
+        await self.ensure_loaded()
+        self.stats["requests"] += 1
+        assigned = self.assign(trait_scores, academic_performance)
+        if assigned is None:
+            self.stats["no_model"] += 1
+            return None
+        if self.model.get("catalog_version") != get_catalog_version():
+            # Insights written for an older catalog may cite changed requirements or salaries
+            self.stats["stale_catalog"] += 1
+            return None
+        cluster_id, distance = assigned
+        cluster = self.model["clusters"][cluster_id]
+        if distance > self.radii[cluster_id]:
+            self.stats["too_far"] += 1
+            return None
+        wanted = [rec["stream"] for rec in basic_recommendations[:3]]
+        if not all(stream in cluster["insights"] for stream in wanted):
+            self.stats["streams_not_covered"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        return {
+            "enhanced_recommendations": [cluster["insights"][stream] for stream in wanted],
+            "overall_guidance": cluster.get("overall_guidance") or "",
+            "cluster": cluster_id
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        requests = self.stats["requests"]
+        status = {
+            "loaded": self.model is not None,
+            "reuse": {
+                **self.stats,
+                "reuse_rate": round(self.stats["hits"] / requests, 3) if requests else None
+            }
+        }
+        if self.model is not None:
+            clusters = self.model["clusters"]
+            status.update({
+                "k": self.model["k"],
+                "profiles": self.model["profiles"],
+                "trained_at": self.model["trained_at"].isoformat(),
+                "catalog_version": self.model.get("catalog_version"),
+                "stale_catalog": self.model.get("catalog_version") != get_catalog_version(),
+                "quality": self.model["quality"],
+                "llm_calls": self.model.get("llm_calls", 0),
+                "insight_coverage": round(
+                    sum(len(c["insights"]) for c in clusters) / max(1, sum(len(c["top_streams"]) for c in clusters)), 3
+                ),
+                "clusters": [
+                    {
+                        "cluster": c["cluster"],
+                        "size": c["size"],
+                        "radius": round(c["radius"], 4),
+                        "top_streams": c["top_streams"],
+                        "streams_with_insights": list(c["insights"].keys())
+                    }
+                    for c in clusters
+                ]
+            })
+        return status
+
+
+# Global model instance
+cluster_model = ClusterInsightModel()
+
+
+async def rebuild_clusters(fetch: AnalysisFetcher, k: int = CLUSTER_K,
+                           max_profiles: int = CLUSTER_MAX_PROFILES) -> Optional[Dict[str, Any]]:
+    """Fit, enrich and publish a new cluster model"""
+    model = await run_in_threadpool(build_cluster_model, k, max_profiles)
+    if model is None:
+        return None
+    model = await generate_cluster_insights(model, fetch)
+    await run_in_threadpool(save_cluster_model, model)
+    return model
+
+
+if __name__ == "__main__":
+    # Offline job: python cohort_clusters.py [k]
+    import sys
+    from psychometric_ai import psychometric_ai
+
+    k_arg = int(sys.argv[1]) if len(sys.argv) > 1 else CLUSTER_K
+    result = asyncio.run(rebuild_clusters(
+        lambda traits, academics, recommendations: psychometric_ai._fetch_ai_analysis(
+            traits, academics, recommendations, task="offline_insights"
+        ),
+        k=k_arg
+    ))
+    if result is None:
+        print("No stored profiles to cluster")
+    else:
+        print(f"Built {result['k']} clusters over {result['profiles']} profiles "
+              f"with {result['llm_calls']} provider calls; quality: {result['quality']}")
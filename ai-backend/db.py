@@ -13,3 +13,8 @@ marksheets_collection = db["marksheets"]
 answers_collection = db["psychometric_answers"]
 recommendations_collection = db["stream_recommendations"]
 recommendation_logs_collection = db["recommendation_logs"]
+stream_fit_collection = db["stream_fit_scores"]
+insight_cache_collection = db["llm_insight_cache"]
+cluster_collection = db["trait_clusters"]
+benchmark_collection = db["provider_benchmarks"]
+llm_ledger_collection = db["llm_ledger"]
@@ -0,0 +1,183 @@
+"""
+Deferred AI Insight Enrichment
+Assessments can be answered with the algorithmic ranking straight away; a pool of
+background workers adds the provider insights afterwards and patches the stored
+stream_recommendations document (and the profile) in place
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from ai_config import ai_config
+from db import answers_collection, recommendations_collection
+from llm_ledger import ledger_scope
+from psychometric_ai import psychometric_ai
+
+
+class DeferredInsightWorker:
+    """asyncio queue + worker tasks living on the app's event loop"""
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.settings = settings
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks: List[asyncio.Task] = []
+        self.in_flight: set = set()
+        self.events: Dict[str, asyncio.Event] = {}
+        self.stats = {
+            "enqueued": 0,
+            "completed": 0,
+            "failed": 0,
+            "dropped": 0,
+            "requeued": 0,
+            "total_delay_ms": 0.0
+        }
+
+    def start(self, sweep: bool = True):
+        """Start the workers; without the sweeper, pending documents are left to the batch job"""
+        if self.tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.settings["queue_size"])
+        self.tasks = [asyncio.ensure_future(self._run()) for _ in range(self.settings["workers"])]
+        if sweep:
+            self.tasks.append(asyncio.ensure_future(self._sweep()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def enqueue(self, job: Dict[str, Any]) -> bool:
+        """Queue an enrichment job; a full queue leaves the document for the sweeper"""
+        self.start()
+        assessment_id = job["assessment_id"]
+        if assessment_id in self.in_flight:
+            return True
+        try:
+            self.queue.put_nowait({**job, "enqueued_at": time.perf_counter()})
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self.in_flight.add(assessment_id)
+        self.events.setdefault(assessment_id, asyncio.Event())
+        self.stats["enqueued"] += 1
+        return True
+
+    async def _run(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._process(job)
+                self.stats["completed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Deferred insight enrichment failed for {job['assessment_id']}: {e}")
+                self.stats["failed"] += 1
+            finally:
+                self.in_flight.discard(job["assessment_id"])
+                event = self.events.pop(job["assessment_id"], None)
+                if event is not None:
+                    event.set()
+                self.queue.task_done()
+
+    async def _process(self, job: Dict[str, Any]):
+        with ledger_scope("deferred_insights", job["user_id"]):
+            enhanced = await psychometric_ai._get_ai_enhanced_recommendations(
+                job["trait_scores"], job["academic_performance"], job["recommended_streams"]
+            )
+        await run_in_threadpool(patch_recommendations, job["user_id"], job["assessment_id"], enhanced)
+        self.stats["total_delay_ms"] += (time.perf_counter() - job["enqueued_at"]) * 1000
+
+    def _find_stale(self, limit: int) -> List[Dict[str, Any]]:
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.settings["requeue_after_seconds"])
+        return list(recommendations_collection.find(
+            # Documents leased by a batch enrichment run are left to it
+            {"insights_pending": True, "generated_at": {"$lt": cutoff}, "batch_lease_until": {"$not": {"$gt": now}}},
+            {"_id": 0, "user_id": 1, "assessment_id": 1, "recommended_streams": 1,
+             "trait_scores_snapshot": 1, "academic_performance_snapshot": 1}
+        ).limit(limit))
+
+    async def requeue_stale(self, limit: int = 500) -> int:
+        """Re-queue pending documents whose job was lost (process restart, full queue)"""
+        docs = await run_in_threadpool(self._find_stale, limit)
+        requeued = 0
+        for doc in docs:
+            if doc["assessment_id"] in self.in_flight:
+                continue
+            if not self.enqueue(job_from_document(doc)):
+                break
+            requeued += 1
+        self.stats["requeued"] += requeued
+        return requeued
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.settings["requeue_after_seconds"])
+            try:
+                await self.requeue_stale()
+            except Exception as e:
+                print(f"Deferred insight sweep failed: {e}")
+
+    async def wait_for(self, assessment_id: str, timeout: float) -> bool:
+        """Wait until this worker finishes the assessment's job; False if it is not queued here"""
+        event = self.events.get(assessment_id)
+        if event is None:
+            return False
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        completed = self.stats["completed"]
+        return {
+            **{key: value for key, value in self.stats.items() if key != "total_delay_ms"},
+            "running": bool(self.tasks),
+            "workers": self.settings["workers"],
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "in_flight": len(self.in_flight),
+            "avg_enrichment_delay_ms": round(self.stats["total_delay_ms"] / completed, 1) if completed else None,
+            "default_deferred": self.settings["default"]
+        }
+
+
+def patch_recommendations(user_id: str, assessment_id: str, enhanced: List[Dict[str, Any]]):
+    """Write enriched recommendations into a pending stream_recommendations document"""
+    has_ai_insights = any(stream.get("ai_insights") for stream in enhanced)
+    update = {
+        "recommended_streams": enhanced,
+        "recommendation_method": "ai_enhanced" if has_ai_insights else "algorithmic_smart",
+        "recommendation_quality": "high" if has_ai_insights else "good",
+        "insights_pending": False,
+        "insights_completed_at": datetime.utcnow()
+    }
+    recommendations_collection.update_one(
+        {"assessment_id": assessment_id, "insights_pending": True},
+        {"$set": update}
+    )
+    # The profile only carries these insights if it has not been replaced by a newer assessment
+    answers_collection.update_one(
+        {"user_id": user_id, "assessment_id": assessment_id},
+        {"$set": update}
+    )
+
+
+def job_from_document(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "user_id": doc["user_id"],
+        "assessment_id": doc["assessment_id"],
+        "trait_scores": doc["trait_scores_snapshot"],
+        "academic_performance": doc["academic_performance_snapshot"],
+        "recommended_streams": doc["recommended_streams"]
+    }
+
+
+# Global worker instance
+deferred_insights = DeferredInsightWorker(ai_config.deferred_insights)
@@ -0,0 +1,240 @@
+"""
+Fake Grok and Gemini Service for Load and Failure Testing
+Speaks the x.ai chat-completions and Gemini generateContent APIs (plain and streamed) with
+configurable latency distributions, error and 429 rates and fenced, prose-wrapped or truncated
+JSON, so provider paths can be measured without real quota. Point the backend at it with
+AI_FAKE_PROVIDERS_URL=http://127.0.0.1:8990 and run: python fake_providers.py [port]
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+from typing import List, Dict, Any, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from insight_templates import get_insight_templates
+
+_TOP_STREAM_LINE = re.compile(r"^\d+\. (.+) \([\d.]+% match\)$", re.M)
+_BATCH_LINE = re.compile(r"^(S\d+) \|.*\| streams: (.+)$", re.M)
+_STREAM_MATCH = re.compile(r" \([\d.]+%\)$")
+
+# Neutral student used to render plausible insight text for the requested streams
+_SAMPLE_TRAITS = {"analytical_thinking": 0.7, "creativity": 0.6, "leadership": 0.55, "social_skills": 0.6,
+                  "technical_aptitude": 0.65, "entrepreneurial_spirit": 0.5, "research_orientation": 0.6,
+                  "helping_others": 0.6}
+_SAMPLE_MARKS = {"Mathematics": 78, "Physics": 72, "Chemistry": 70, "Biology": 68, "English": 75}
+
+_SAMPLE_QUESTIONS = [
+    {"question": "A handicraft cooperative in Srinagar is losing customers. What would you do first?",
+     "options": ["Wait for the tourist season to return", "Ask the elders what worked before",
+                 "Compare prices with other sellers", "Study sales data to find the real cause"],
+     "scenario": "Handicraft business in Kashmir"},
+    {"question": "Your school in Jammu plans a science fair. Which role would you take?",
+     "options": ["Visit the fair as a guest", "Help set up the stalls",
+                 "Present a project with friends", "Lead the organising committee"],
+     "scenario": "School science fair in J&K"},
+]
+
+
+def load_settings(provider: str) -> Dict[str, Any]:
+    """Behaviour for one fake provider; FAKE_GROK_* / FAKE_GEMINI_* override the FAKE_LLM_* defaults"""
+    prefix = f"FAKE_{provider.upper()}_"
+
+    def setting(name: str, default: str) -> str:
+        return os.getenv(prefix + name, os.getenv("FAKE_LLM_" + name, default))
+
+    return {
+        # lognormal:<median ms>:<sigma>, uniform:<min ms>:<max ms> or fixed:<ms>
+        "latency": setting("LATENCY", "lognormal:800:0.5"),
+        "error_rate": float(setting("ERROR_RATE", "0")),
+        "rate_limit_rate": float(setting("RATE_LIMIT_RATE", "0")),
+        # Share of replies wrapped in ```json fences, wrapped in chatty prose or cut off mid-JSON
+        "fence_rate": float(setting("FENCE_RATE", "0.5" if provider == "grok" else "0")),
+        "prose_rate": float(setting("PROSE_RATE", "0")),
+        "truncate_rate": float(setting("TRUNCATE_RATE", "0")),
+        "first_token_ms": float(setting("FIRST_TOKEN_MS", "300")),
+        "chunk_chars": int(setting("CHUNK_CHARS", "40")),
+        "chunk_delay_ms": float(setting("CHUNK_DELAY_MS", "30"))
+    }
+
+
+class FakeProviderState:
+    """Per-provider settings (changeable at runtime) and counters of what was served"""
+
+    def __init__(self, seed: Optional[int] = None):
+        self.settings = {provider: load_settings(provider) for provider in ("grok", "gemini")}
+        self.counts: Dict[str, Dict[str, int]] = {provider: {} for provider in self.settings}
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def count(self, provider: str, outcome: str):
+        with self._lock:
+            self.counts[provider][outcome] = self.counts[provider].get(outcome, 0) + 1
+
+    def chance(self, rate: float) -> bool:
+        return rate > 0 and self.rng.random() < rate
+
+    def latency_seconds(self, provider: str) -> float:
+        kind, *params = self.settings[provider]["latency"].split(":")
+        values = [float(p) for p in params]
+        if kind == "fixed":
+            ms = values[0]
+        elif kind == "uniform":
+            ms = self.rng.uniform(values[0], values[1])
+        else:
+            # Long-tailed like real LLM latency: median plus sigma in log space
+            ms = self.rng.lognormvariate(0, values[1] if len(values) > 1 else 0.5) * values[0]
+        return ms / 1000
+
+
+def reply_for(prompt: str) -> str:
+    """A well-formed JSON reply for the production prompt kinds: batch, recommendations or question"""
+    templates = get_insight_templates()
+
+    def insights(streams: List[str]) -> List[Dict[str, Any]]:
+        items = []
+        for stream in streams:
+            rendered = templates.render(stream, _SAMPLE_TRAITS, _SAMPLE_MARKS) or {
+                "personality_fit": f"Your profile suits {stream}.",
+                "jk_opportunities": "Opportunities across Jammu & Kashmir.",
+                "challenges": "Strong competition for seats.",
+                "next_steps": "1. Research colleges 2. Prepare for entrance exams",
+                "confidence": 0.8
+            }
+            items.append({"stream": stream, **rendered})
+        return items
+
+    guidance = "Focus on your strongest traits and compare the entrance exams of your top streams."
+    if "STUDENTS (" in prompt:
+        return json.dumps({"students": [
+            {"id": student_id,
+             "enhanced_recommendations": insights([_STREAM_MATCH.sub("", s) for s in streams.split("; ")]),
+             "overall_guidance": guidance}
+            for student_id, streams in _BATCH_LINE.findall(prompt)
+        ]}, ensure_ascii=False)
+    if "TOP STREAM RECOMMENDATIONS" in prompt:
+        return json.dumps({"enhanced_recommendations": insights(_TOP_STREAM_LINE.findall(prompt)[:3]),
+                           "overall_guidance": guidance}, ensure_ascii=False)
+    return json.dumps(_SAMPLE_QUESTIONS[len(prompt) % len(_SAMPLE_QUESTIONS)], ensure_ascii=False)
+
+
+def shape_reply(text: str, settings: Dict[str, Any], state: FakeProviderState, provider: str) -> str:
+    """Apply the configured output faults to a clean reply"""
+    if state.chance(settings["fence_rate"]):
+        text = f"```json\n{text}\n```"
+        state.count(provider, "fenced")
+    if state.chance(settings["prose_rate"]):
+        text = f"Sure! Here is the analysis you asked for:\n{text}\nLet me know if you need anything else."
+        state.count(provider, "prose")
+    if state.chance(settings["truncate_rate"]):
+        # Cut somewhere in the second half, as a max_tokens stop would
+        text = text[:int(len(text) * state.rng.uniform(0.5, 0.95))]
+        state.count(provider, "truncated")
+    return text
+
+
+def create_app(seed: Optional[int] = None) -> FastAPI:
+    app = FastAPI(title="Fake LLM Providers")
+    state = FakeProviderState(seed)
+    app.state.fake = state
+
+    async def serve(provider: str, prompt: str, stream: bool, model: str):
+        """Shared behaviour: fault injection, latency, then a plain or streamed body"""
+        settings = state.settings[provider]
+        if state.chance(settings["rate_limit_rate"]):
+            state.count(provider, "429")
+            await asyncio.sleep(0.01)
+            return JSONResponse({"error": {"code": 429, "message": "Resource exhausted (fake)"}},
+                                status_code=429, headers={"Retry-After": "1"})
+        if state.chance(settings["error_rate"]):
+            state.count(provider, "error")
+            await asyncio.sleep(state.latency_seconds(provider) / 2)
+            return JSONResponse({"error": {"code": 503, "message": "Service unavailable (fake)"}}, status_code=503)
+
+        text = shape_reply(reply_for(prompt), settings, state, provider)
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(text) // 4
+        if not stream:
+            await asyncio.sleep(state.latency_seconds(provider))
+            state.count(provider, "ok")
+            if provider == "grok":
+                return JSONResponse({
+                    "id": "fake", "object": "chat.completion", "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens}
+                })
+            return JSONResponse({
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+                "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens,
+                                  "totalTokenCount": prompt_tokens + completion_tokens}
+            })
+
+        async def events():
+            await asyncio.sleep(settings["first_token_ms"] / 1000)
+            size = max(1, settings["chunk_chars"])
+            for start in range(0, len(text), size):
+                piece = text[start:start + size]
+                if provider == "grok":
+                    event = {"id": "fake", "object": "chat.completion.chunk", "model": model,
+                             "choices": [{"index": 0, "delta": {"content": piece}}]}
+                else:
+                    event = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]}
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(settings["chunk_delay_ms"] / 1000)
+            if provider == "grok":
+                yield "data: [DONE]\n\n"
+            state.count(provider, "streamed")
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        return await serve("grok", prompt, bool(body.get("stream")), body.get("model", "grok-beta"))
+
+    @app.post("/v1beta/models/{model_action:path}")
+    async def generate_content(model_action: str, request: Request):
+        model, _, action = model_action.partition(":")
+        if action not in ("generateContent", "streamGenerateContent"):
+            return JSONResponse({"error": {"code": 404, "message": f"unknown action {action}"}}, status_code=404)
+        body = await request.json()
+        prompt = "".join(part.get("text", "") for part in body["contents"][-1]["parts"])
+        return await serve("gemini", prompt, action == "streamGenerateContent", model)
+
+    @app.get("/fake/settings")
+    async def get_settings():
+        return state.settings
+
+    @app.post("/fake/settings/{provider}")
+    async def update_settings(provider: str, request: Request):
+        """Change behaviour mid-test, e.g. {"error_rate": 0.5} to trip the circuit breaker"""
+        if provider not in state.settings:
+            return JSONResponse({"error": f"unknown provider {provider}"}, status_code=404)
+        updates = await request.json()
+        unknown = set(updates) - set(state.settings[provider])
+        if unknown:
+            return JSONResponse({"error": f"unknown settings {sorted(unknown)}"}, status_code=400)
+        state.settings[provider].update(updates)
+        return state.settings[provider]
+
+    @app.get("/fake/stats")
+    async def get_stats():
+        return state.counts
+
+    return app
+
+
+if __name__ == "__main__":
+    import sys
+    import uvicorn
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8990
+    seed = os.getenv("FAKE_LLM_SEED")
+    uvicorn.run(create_app(int(seed) if seed else None), host="127.0.0.1", port=port, log_level="warning")
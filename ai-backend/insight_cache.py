@@ -0,0 +1,205 @@
+"""
+Prompt-keyed Cache for LLM Stream Insights
+The recommendation prompt only depends on a handful of coarse profile features, so many
+students send the same prompt; analyses are kept in an in-process LRU backed by a Mongo
+collection with a TTL index, and stale entries are served while being refreshed
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
+
+from pymongo import ASCENDING
+from starlette.concurrency import run_in_threadpool
+
+from db import insight_cache_collection
+
+# Bump when the recommendation prompt changes so old analyses are not reused
+PROMPT_VERSION = 1
+
+INSIGHT_CACHE_MAX_ENTRIES = int(os.getenv("INSIGHT_CACHE_MAX_ENTRIES", "10000"))
+# Served as-is while fresh; after that served stale and refreshed in the background
+INSIGHT_CACHE_FRESH_SECONDS = int(os.getenv("INSIGHT_CACHE_FRESH_SECONDS", str(7 * 24 * 3600)))
+# Removed by the Mongo TTL monitor (and ignored in memory) after this long
+INSIGHT_CACHE_TTL_SECONDS = int(os.getenv("INSIGHT_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+
+def _normalize_subject(subject: str) -> str:
+    return " ".join(subject.lower().replace("_", " ").split())
+
+
+def insight_cache_key(trait_scores: Dict[str, float], academic_performance: Dict[str, float],
+                      basic_recommendations: List[Dict[str, Any]]) -> str:
+    """Hash of exactly the inputs the recommendation prompt is built from
+
+    Traits are rounded to whole percentages and the average to a whole number, as they
+    appear in the prompt; subject lists are sorted so input order does not split entries.
+    """
+    top_traits = sorted(trait_scores.items(), key=lambda x: x[1], reverse=True)[:3]
+    scores = academic_performance.values()
+    features = {
+        "v": PROMPT_VERSION,
+        "traits": [[trait, int(round(score * 100))] for trait, score in top_traits],
+        "strong": sorted(_normalize_subject(subj) for subj, score in academic_performance.items() if score > 75),
+        "weak": sorted(_normalize_subject(subj) for subj, score in academic_performance.items() if score < 60),
+        "average": int(round(sum(scores) / len(scores))) if scores else None,
+        "streams": [rec["stream"] for rec in basic_recommendations[:3]]
+    }
+    canonical = json.dumps(features, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class InsightCache:
+    """Two-tier (memory LRU, then Mongo) cache of parsed provider analyses"""
+
+    def __init__(self, max_entries: int = INSIGHT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {
+            "memory_hits": 0,
+            "mongo_hits": 0,
+            "misses": 0,
+            "stale_served": 0,
+            "writes": 0,
+            "revalidations": 0,
+            "revalidation_failures": 0,
+            "mongo_errors": 0
+        }
+        self._revalidating: set = set()
+        self._background: set = set()
+        self._indexes_ready = False
+        self._lock = threading.Lock()
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        insight_cache_collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0, name="ttl")
+        self._indexes_ready = True
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        self._ensure_indexes()
+        doc = insight_cache_collection.find_one({"_id": key})
+        if not doc:
+            return None
+        return {
+            "analysis": doc["analysis"],
+            "provider": doc.get("provider"),
+            "created_at": doc["created_at"],
+            "fresh_until": doc["fresh_until"],
+            "expires_at": doc["expires_at"]
+        }
+
+    def _save(self, key: str, entry: Dict[str, Any]):
+        self._ensure_indexes()
+        insight_cache_collection.replace_one({"_id": key}, {"_id": key, **entry}, upsert=True)
+
+    async def get(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Return (entry, "fresh" | "stale") or (None, None) on a miss"""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is not None and entry["expires_at"] > now:
+            self.stats["memory_hits"] += 1
+        else:
+            try:
+                entry = await run_in_threadpool(self._load, key)
+            except Exception as e:
+                print(f"Insight cache lookup failed: {e}")
+                self.stats["mongo_errors"] += 1
+                entry = None
+            if entry is not None:
+                # pymongo returns naive UTC datetimes
+                for field in ("created_at", "fresh_until", "expires_at"):
+                    if entry[field].tzinfo is None:
+                        entry[field] = entry[field].replace(tzinfo=timezone.utc)
+            if entry is None or entry["expires_at"] <= now:
+                self.stats["misses"] += 1
+                return None, None
+            self.stats["mongo_hits"] += 1
+            self._remember(key, entry)
+
+        if entry["fresh_until"] > now:
+            return entry, "fresh"
+        self.stats["stale_served"] += 1
+        return entry, "stale"
+
+    async def put(self, key: str, analysis: Dict[str, Any], provider: Optional[str] = None):
+        with self._lock:
+            current = self.entries.get(key)
+        if current is not None and current["analysis"] is analysis:
+            # Coalesced callers all receive the same analysis object; store it once
+            return
+        now = datetime.now(timezone.utc)
+        entry = {
+            "analysis": analysis,
+            "provider": provider,
+            "created_at": now,
+            "fresh_until": now + timedelta(seconds=INSIGHT_CACHE_FRESH_SECONDS),
+            "expires_at": now + timedelta(seconds=INSIGHT_CACHE_TTL_SECONDS)
+        }
+        self._remember(key, entry)
+        self.stats["writes"] += 1
+        try:
+            await run_in_threadpool(self._save, key, entry)
+        except Exception as e:
+            print(f"Insight cache write failed: {e}")
+            self.stats["mongo_errors"] += 1
+
+    def revalidate(self, key: str, fetch: Callable[[], Awaitable[Tuple[Dict[str, Any], Optional[str]]]]):
+        """Refresh a stale entry in the background; at most one refresh per key at a time"""
+        if key in self._revalidating:
+            return
+        self._revalidating.add(key)
+
+        async def refresh():
+            start = time.perf_counter()
+            try:
+                analysis, provider = await fetch()
+                await self.put(key, analysis, provider)
+                self.stats["revalidations"] += 1
+            except Exception as e:
+                print(f"Insight cache revalidation failed after {time.perf_counter() - start:.1f}s: {e}")
+                self.stats["revalidation_failures"] += 1
+            finally:
+                self._revalidating.discard(key)
+
+        # Hold a reference so the task is not garbage collected mid-flight
+        task = asyncio.ensure_future(refresh())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def clear_memory(self):
+        with self._lock:
+            self.entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.stats["memory_hits"] + self.stats["mongo_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            "memory_entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "revalidating": len(self._revalidating),
+            "fresh_seconds": INSIGHT_CACHE_FRESH_SECONDS,
+            "ttl_seconds": INSIGHT_CACHE_TTL_SECONDS
+        }
+
+
+# Global cache instance
+insight_cache = InsightCache()
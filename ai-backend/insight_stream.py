@@ -0,0 +1,170 @@
+"""
+Server-Sent Events Streaming of Stream Recommendations
+Sends the algorithmic ranking first, then each stream's ai_insights as soon as its object in
+the provider's streamed JSON closes, so students see results long before the completion ends
+"""
+
+import json
+import time
+from typing import Dict, Any, Optional, AsyncIterator
+
+from provider_clients import ProviderError, provider_registry
+from psychometric_ai import psychometric_ai, RECOMMENDATION_REQUEST_OPTIONS
+from provider_router import provider_router
+from insight_cache import insight_cache, insight_cache_key
+from cohort_clusters import cluster_model
+from llm_output import IncrementalArrayParser, validate_insight
+from request_deadline import current_deadline, remaining_seconds, deadline_stage, without_deadline, deadline_stats
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream_recommendation_events(trait_scores: Dict[str, float],
+                                       academic_performance: Dict[str, float]) -> AsyncIterator[str]:
+    """SSE events: recommendations, one insight per stream, guidance, done
+
+    Provider streaming stops when the request deadline runs out; the remaining streams get
+    template insights and the done event carries the deadline report.
+    """
+    start = time.perf_counter()
+    deadline = current_deadline()
+
+    def elapsed() -> float:
+        return round((time.perf_counter() - start) * 1000, 1)
+
+    basic_recommendations = psychometric_ai._get_basic_recommendations(trait_scores, academic_performance)
+    yield sse_event("recommendations", {
+        "recommendations": basic_recommendations,
+        "insights_pending": bool(basic_recommendations),
+        "elapsed_ms": elapsed()
+    })
+    if not basic_recommendations:
+        yield sse_event("done", {"source": None, "elapsed_ms": elapsed(), "deadline": finish_deadline(None)})
+        return
+
+    by_stream = {rec["stream"]: rec for rec in basic_recommendations}
+    sent: Dict[str, Dict[str, Any]] = {}
+
+    def insight_event(item: Dict[str, Any]) -> Optional[str]:
+        # Streamed objects are checked against the insight schema before they reach the client
+        ai_rec = validate_insight(item)
+        if ai_rec is None:
+            return None
+        stream = ai_rec["stream"]
+        if stream not in by_stream or stream in sent:
+            return None
+        sent[stream] = psychometric_ai._format_ai_insights(ai_rec)
+        return sse_event("insight", {
+            "stream": stream,
+            "ai_insights": sent[stream],
+            "match_percentage": min(100, by_stream[stream]["match_percentage"] + 3),
+            "elapsed_ms": elapsed()
+        })
+
+    # Cached or cohort insights are complete already; send them straight away
+    cache_key = insight_cache_key(trait_scores, academic_performance, basic_recommendations)
+    analysis: Optional[Dict[str, Any]] = None
+    source: Optional[str] = None
+    with deadline_stage("cache"):
+        cached, state = await insight_cache.get(cache_key)
+    if cached is not None:
+        analysis, source = cached["analysis"], "cache"
+        if state == "stale":
+            insight_cache.revalidate(
+                cache_key,
+                lambda: without_deadline(lambda: psychometric_ai._fetch_ai_analysis(
+                    trait_scores, academic_performance, basic_recommendations
+                ))
+            )
+    else:
+        with deadline_stage("cluster"):
+            analysis = await cluster_model.lookup(trait_scores, academic_performance, basic_recommendations)
+        source = "cluster" if analysis is not None else None
+
+    if analysis is None:
+        prompt = psychometric_ai._build_recommendation_prompt(trait_scores, academic_performance, basic_recommendations)
+        for provider, options in provider_router.plan("insights", RECOMMENDATION_REQUEST_OPTIONS, remaining_seconds()):
+            if deadline is not None and deadline.expired():
+                deadline.exhaust("insights")
+                break
+            parser = IncrementalArrayParser("enhanced_recommendations")
+            chunks = []
+            cut_off = False
+            try:
+                async for text in provider_registry.get_client(provider).astream(prompt, **options):
+                    chunks.append(text)
+                    for ai_rec in parser.feed(text):
+                        event = insight_event(ai_rec)
+                        if event:
+                            yield event
+                    if deadline is not None and deadline.expired():
+                        # Out of budget mid-stream: keep what arrived, template insights fill the rest
+                        deadline.exhaust(f"{provider.value}:stream")
+                        cut_off = True
+                        break
+            except ProviderError as e:
+                print(f"{provider.value.title()} stream failed: {e}")
+                if sent:
+                    # Keep what already reached the client; the rest is filled in below
+                    source = provider.value
+                    break
+                continue
+
+            source = provider.value
+            if cut_off:
+                analysis = {"enhanced_recommendations": parser.objects} if parser.objects else None
+                break
+            try:
+                analysis = psychometric_ai._parse_ai_analysis("".join(chunks))
+                await insight_cache.put(cache_key, analysis, provider.value)
+            except ValueError as e:
+                print(f"{provider.value.title()} stream had no usable analysis: {e}")
+                analysis = {"enhanced_recommendations": parser.objects}
+            break
+
+    if analysis is not None:
+        for ai_rec in analysis.get("enhanced_recommendations", []):
+            event = insight_event(ai_rec)
+            if event:
+                yield event
+        if analysis.get("overall_guidance"):
+            yield sse_event("guidance", {"overall_guidance": analysis["overall_guidance"], "elapsed_ms": elapsed()})
+
+    # Providers failed or skipped streams: fill the top 3 from the template insights
+    if any(rec["stream"] not in sent for rec in basic_recommendations[:3]):
+        try:
+            with deadline_stage("mock"):
+                mock_recommendations = psychometric_ai._get_mock_ai_insights(
+                    basic_recommendations, trait_scores, academic_performance
+                )
+        except Exception as e:
+            print(f"Mock insights failed: {e}")
+            mock_recommendations = []
+        for rec in mock_recommendations[:3]:
+            if rec.get("ai_insights") and rec["stream"] not in sent:
+                event = insight_event({"stream": rec["stream"], **rec["ai_insights"]})
+                if event:
+                    yield event
+                    source = source or "mock"
+        if analysis is None and mock_recommendations and mock_recommendations[0].get("overall_guidance"):
+            yield sse_event("guidance", {"overall_guidance": mock_recommendations[0]["overall_guidance"],
+                                         "elapsed_ms": elapsed()})
+
+    yield sse_event("done", {
+        "source": source,
+        "streams_with_insights": list(sent.keys()),
+        "elapsed_ms": elapsed(),
+        "deadline": finish_deadline(source)
+    })
+
+
+def finish_deadline(source: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Record the stream's deadline outcome; its report goes out with the done event"""
+    deadline = current_deadline()
+    if deadline is None:
+        return None
+    deadline.serve(source or "basic")
+    deadline_stats.record(deadline)
+    return deadline.report()
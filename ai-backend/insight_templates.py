@@ -0,0 +1,202 @@
+"""
+Template Insights for the Whole Streams Catalog
+Compiles each catalog stream's structured fields into insight templates once per catalog
+version; rendering a stream's ai_insights for a student's traits and marks takes microseconds,
+so the zero-LLM path covers every stream
+"""
+
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+from streams_database import get_all_streams, get_catalog_version
+
+# Academic requirement keys that are not school subjects a student has marks in
+NON_SUBJECT_REQUIREMENTS = {"any_subject", "portfolio", "general_knowledge", "communication_skills"}
+# College names that place a college in J&K
+JK_PLACE_NAMES = ("Kashmir", "Jammu", "Srinagar", "SKUAST", "Ladakh")
+
+
+def _display(key: str) -> str:
+    return key.replace("_", " ")
+
+
+def _join(items: List[str]) -> str:
+    """"a", "a and b", "a, b and c\""""
+    if len(items) <= 1:
+        return "".join(items)
+    return ", ".join(items[:-1]) + " and " + items[-1]
+
+
+def _lower_first(text: str) -> str:
+    """Lower-case a leading common word for use mid-sentence; acronyms and places stay as they are"""
+    first = text.split(" ", 1)[0]
+    if first[1:].islower() and first not in JK_PLACE_NAMES:
+        return text[:1].lower() + text[1:]
+    return text
+
+
+def _lower_words(text: str) -> str:
+    """Lower-case a Title Case skill name ("Circuit Analysis"), keeping acronyms ("AutoCAD")"""
+    return " ".join(word.lower() if word[1:].islower() else word for word in text.split(" "))
+
+
+def _subject_key(subject: str) -> str:
+    return subject.strip().lower().replace(" ", "_")
+
+
+class CompiledStreamInsights:
+    """Everything about one stream that does not depend on the student, built once"""
+
+    __slots__ = ("name", "requirements", "subjects", "paths_text", "jk_opportunities",
+                 "admission_text", "exam_step", "skill_step", "explore_step")
+
+    def __init__(self, stream: Dict[str, Any]):
+        self.name = stream["name"]
+        # (trait, display name, required score), most demanding first
+        self.requirements: List[Tuple[str, str, float]] = sorted(
+            ((trait, _display(trait), required)
+             for trait, required in stream.get("personality_requirements", {}).items()),
+            key=lambda requirement: requirement[2], reverse=True
+        )
+        # (subject key, display name, required marks)
+        self.subjects: List[Tuple[str, str, float]] = [
+            (subject, _display(subject).title(), required)
+            for subject, required in stream.get("academic_requirements", {}).items()
+            if subject not in NON_SUBJECT_REQUIREMENTS
+        ]
+        self.paths_text = _join(stream.get("career_paths", [])[:3]) or "a range of careers"
+
+        salary = stream.get("salary_range")
+        if isinstance(salary, dict):
+            salary_text = f"entry salaries of {salary.get('entry_level')} rising to {salary.get('senior_level')}"
+        else:
+            salary_text = f"salaries of {salary}" if salary else ""
+        opportunities = stream.get("jk_opportunities", [])
+        jk_colleges = [college for college in stream.get("top_colleges", [])
+                       if any(place in college for place in JK_PLACE_NAMES)]
+        sentences = []
+        if opportunities:
+            sentences.append(f"In J&K this field leads to {_join([_lower_first(o) for o in opportunities[:3]])}.")
+        if jk_colleges:
+            sentences.append(f"You can study it close to home at {_join(jk_colleges[:3])}.")
+        growth = stream.get("growth_prospects")
+        if growth and salary_text:
+            sentences.append(f"Growth prospects are {growth.lower()}, with {salary_text}.")
+        elif growth:
+            sentences.append(f"Growth prospects are {growth.lower()}.")
+        elif salary_text:
+            sentences.append(f"Expect {salary_text}.")
+        self.jk_opportunities = " ".join(sentences) or f"{self.name} is open to J&K students through national programmes."
+
+        exams = stream.get("entrance_exams", [])
+        duration = stream.get("duration")
+        admission = []
+        if exams:
+            admission.append(f"Admission runs through competitive exams such as {_join(exams[:2])}")
+        if duration:
+            admission.append(f"the course takes {duration}")
+        admission_text = " and ".join(admission)
+        self.admission_text = admission_text[:1].upper() + admission_text[1:] + "." if admission else ""
+
+        self.exam_step = f"Prepare early for {_join(exams[:2])}" if exams else "Shortlist colleges and their admission criteria"
+        skills = stream.get("skills_required", [])
+        self.skill_step = (f"Build {_join([_lower_words(s) for s in skills[:2]])} skills through projects"
+                           if skills else f"Talk to people working as {self.paths_text}")
+        self.explore_step = (f"Explore {_lower_first(opportunities[0])} in J&K" if opportunities
+                             else "Look for internships and mentors in J&K")
+
+    def render(self, trait_scores: Dict[str, float], marks: Dict[str, float]) -> Dict[str, Any]:
+        known = [(trait, name, required, trait_scores[trait])
+                 for trait, name, required in self.requirements if trait in trait_scores]
+        met = sorted((r for r in known if r[3] >= r[2]), key=lambda r: r[3], reverse=True)
+        gaps = sorted((r for r in known if r[3] < r[2]), key=lambda r: r[3] - r[2])
+
+        if met:
+            strengths = _join([f"{name} ({score:.0%})" for _, name, _, score in met[:2]])
+            personality_fit = (f"Your {strengths} {'meets' if len(met) == 1 else 'meet'} what {self.name} "
+                               f"asks for, which suits roles such as {self.paths_text}.")
+        elif known:
+            _, name, required, score = max(known, key=lambda r: r[3])
+            personality_fit = (f"{self.name} builds on {name}; at {score:.0%} against the usual {required:.0%} "
+                               f"it is your closest match here, and roles such as {self.paths_text} will develop it further.")
+        else:
+            personality_fit = f"{self.name} matches your overall profile and leads to roles such as {self.paths_text}."
+
+        weak_subjects = [(name, marks[key], required) for key, name, required in self.subjects
+                         if key in marks and marks[key] < required]
+        challenges = []
+        if gaps:
+            _, name, required, score = gaps[0]
+            challenges.append(f"Your score for {name} ({score:.0%}) is below the {required:.0%} the field usually expects, "
+                              f"so practise it deliberately.")
+        if weak_subjects:
+            name, score, required = weak_subjects[0]
+            challenges.append(f"{name} at {score:.0f}% needs to reach about {required:.0f}%.")
+        if self.admission_text:
+            challenges.append(self.admission_text)
+        if not challenges:
+            challenges.append("Competition for the best seats is strong, so plan your preparation early.")
+
+        if weak_subjects:
+            subject_step = f"Raise your {_join([name for name, _, _ in weak_subjects[:2]])} marks"
+        else:
+            strong = [name for key, name, _ in self.subjects if key in marks][:2]
+            subject_step = f"Keep your {_join(strong)} marks strong" if strong else "Strengthen the core subjects for this stream"
+
+        fit = (sum(min(1.0, score / required) for _, _, required, score in known) / len(known)
+               if known else 0.7)
+        return {
+            "personality_fit": personality_fit,
+            "jk_opportunities": self.jk_opportunities,
+            "challenges": " ".join(challenges),
+            "next_steps": f"1. {subject_step} 2. {self.exam_step} 3. {self.skill_step} 4. {self.explore_step}",
+            "confidence": round(0.6 + 0.3 * fit, 2)
+        }
+
+
+class InsightTemplateEngine:
+    """Compiled insight templates for every stream of one catalog version"""
+
+    def __init__(self, streams: List[Dict[str, Any]], catalog_version: str):
+        self.catalog_version = catalog_version
+        self.streams = {stream["name"]: CompiledStreamInsights(stream) for stream in streams}
+        self._extra_lock = threading.Lock()
+
+    def render(self, stream_name: str, trait_scores: Dict[str, float],
+               academic_performance: Dict[str, float],
+               fallback_stream: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """ai_insights for a stream, or None if it is neither in the catalog nor given as a fallback"""
+        compiled = self.streams.get(stream_name)
+        if compiled is None:
+            if fallback_stream is None:
+                return None
+            # Streams outside the catalog (the legacy list) are compiled on first use
+            with self._extra_lock:
+                compiled = self.streams.setdefault(stream_name, CompiledStreamInsights(fallback_stream))
+        marks = {_subject_key(subject): score for subject, score in academic_performance.items()}
+        return compiled.render(trait_scores, marks)
+
+    def render_guidance(self, trait_scores: Dict[str, float], stream_names: List[str]) -> str:
+        top_traits = sorted(trait_scores.items(), key=lambda item: item[1], reverse=True)[:2]
+        if not top_traits:
+            return "Explore the recommended streams and talk to people working in them before you decide."
+        (first, first_score), second = top_traits[0], top_traits[1:]
+        guidance = f"Your strongest trait is {_display(first).title()} ({first_score:.0%})"
+        guidance += f", followed by {_display(second[0][0])} ({second[0][1]:.0%})." if second else "."
+        if stream_names:
+            guidance += f" {stream_names[0]} fits your profile best"
+            guidance += f", with {_join(stream_names[1:3])} as strong alternatives." if len(stream_names) > 1 else "."
+        return guidance + (" Compare their entrance exams and J&K opportunities, and build a network both"
+                           " locally and nationally before you decide.")
+
+
+_engine: Optional[InsightTemplateEngine] = None
+
+
+def get_insight_templates() -> InsightTemplateEngine:
+    """Get the template engine, recompiling it when the catalog version changes"""
+    global _engine
+    version = get_catalog_version()
+    if _engine is None or _engine.catalog_version != version:
+        _engine = InsightTemplateEngine(get_all_streams(), version)
+    return _engine
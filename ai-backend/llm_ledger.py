@@ -0,0 +1,222 @@
+"""
+LLM Token and Cost Ledger
+One record per provider call (tokens, latency, provider, model, outcome and cost) tagged with
+the endpoint and user that caused it; records are buffered in memory and written in batches
+by a background task, then rolled up per day, endpoint and provider
+"""
+
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
+
+from pymongo import ASCENDING
+from starlette.concurrency import run_in_threadpool
+
+from ai_config import ai_config
+from db import llm_ledger_collection
+
+# Fields a rollup can be grouped by
+ROLLUP_FIELDS = ("day", "endpoint", "provider", "model", "outcome")
+
+# Mutable so a user id set deep inside an endpoint (or its threadpool calls) reaches every later call
+_ledger_scope: ContextVar[Optional[Dict[str, Any]]] = ContextVar("llm_ledger_scope", default=None)
+
+
+def begin_ledger_scope(endpoint: str, user_id: Optional[str] = None):
+    """Attribute the provider calls of the current request or task to an endpoint (and user)"""
+    _ledger_scope.set({"endpoint": endpoint, "user_id": user_id})
+
+
+@contextmanager
+def ledger_scope(endpoint: str, user_id: Optional[str] = None):
+    """Attribute the provider calls made inside the block, e.g. by a background job"""
+    token = _ledger_scope.set({"endpoint": endpoint, "user_id": user_id})
+    try:
+        yield
+    finally:
+        _ledger_scope.reset(token)
+
+
+def set_ledger_user(user_id: Optional[str]):
+    """Attach the user to the current scope once the endpoint knows who it is serving"""
+    scope = _ledger_scope.get()
+    if scope is not None and user_id:
+        scope["user_id"] = user_id
+
+
+class LLMLedger:
+    """Thread-safe in-memory buffer plus one writer task flushing it with insert_many"""
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.settings = settings
+        self.buffer: deque = deque()
+        self.task: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._indexes_ready = False
+        self._lock = threading.Lock()
+        self.stats = {
+            "recorded": 0,
+            "written": 0,
+            "dropped": 0,
+            "flushes": 0,
+            "write_failures": 0
+        }
+
+    def record(self, provider: str, model: str, outcome: str, latency_ms: float,
+               prompt_tokens: int = 0, completion_tokens: int = 0, tokens_estimated: bool = False,
+               status_code: Optional[int] = None):
+        """Buffer one provider call; callable from the event loop and from threadpool workers"""
+        if not self.settings["enabled"]:
+            return
+        scope = _ledger_scope.get() or {}
+        now = datetime.utcnow()
+        entry = {
+            "at": now,
+            "day": now.strftime("%Y-%m-%d"),
+            "endpoint": scope.get("endpoint", "background"),
+            "user_id": scope.get("user_id"),
+            "provider": provider,
+            "model": model,
+            "outcome": outcome,
+            "status_code": status_code,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "tokens_estimated": tokens_estimated,
+            "latency_ms": round(latency_ms, 1),
+            "cost_usd": ai_config.estimate_cost(provider, prompt_tokens, completion_tokens, model)
+        }
+        with self._lock:
+            if len(self.buffer) >= self.settings["max_buffer"]:
+                # Mongo is down or slow: keep the newest records
+                self.buffer.popleft()
+                self.stats["dropped"] += 1
+            self.buffer.append(entry)
+            self.stats["recorded"] += 1
+            full = len(self.buffer) >= self.settings["batch_size"]
+        if full and self.loop is not None and self._wake is not None:
+            self.loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self):
+        """Run the writer on the app's event loop"""
+        if self.task is not None or not self.settings["enabled"]:
+            return
+        self.loop = asyncio.get_event_loop()
+        self._wake = asyncio.Event()
+        self.task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """Stop the writer and write what is still buffered"""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.settings["flush_interval_seconds"])
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def _take(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            count = min(len(self.buffer), self.settings["batch_size"])
+            return [self.buffer.popleft() for _ in range(count)]
+
+    def _requeue(self, entries: List[Dict[str, Any]]):
+        """Put a failed batch back in front, within max_buffer"""
+        with self._lock:
+            room = max(0, self.settings["max_buffer"] - len(self.buffer))
+            self.stats["dropped"] += len(entries) - min(room, len(entries))
+            self.buffer.extendleft(reversed(entries[:room]))
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        llm_ledger_collection.create_index(
+            [("at", ASCENDING)], expireAfterSeconds=self.settings["retention_days"] * 86400, name="ttl"
+        )
+        llm_ledger_collection.create_index([("day", ASCENDING), ("endpoint", ASCENDING)], name="day_endpoint")
+        self._indexes_ready = True
+
+    def _write(self, entries: List[Dict[str, Any]]):
+        self._ensure_indexes()
+        llm_ledger_collection.insert_many(entries, ordered=False)
+
+    async def flush(self) -> int:
+        """Write the buffer in batches of batch_size; returns the number of records written"""
+        written = 0
+        while True:
+            entries = self._take()
+            if not entries:
+                return written
+            try:
+                await run_in_threadpool(self._write, entries)
+            except Exception as e:
+                print(f"LLM ledger write failed: {e}")
+                self.stats["write_failures"] += 1
+                self._requeue(entries)
+                return written
+            written += len(entries)
+            self.stats["written"] += len(entries)
+            self.stats["flushes"] += 1
+
+    def rollup(self, group_by: List[str], days: int = 7,
+               endpoint: Optional[str] = None, provider: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Calls, errors, tokens, cost and latency over the last `days` days, grouped by `group_by`"""
+        match: Dict[str, Any] = {"at": {"$gte": datetime.utcnow() - timedelta(days=days)}}
+        if endpoint:
+            match["endpoint"] = endpoint
+        if provider:
+            match["provider"] = provider
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {field: f"${field}" for field in group_by},
+                "calls": {"$sum": 1},
+                # Deadline cuts and cancellations are our choice, not provider failures
+                "errors": {"$sum": {"$cond": [{"$in": ["$outcome", ["error", "rate_limited"]]}, 1, 0]}},
+                "prompt_tokens": {"$sum": "$prompt_tokens"},
+                "completion_tokens": {"$sum": "$completion_tokens"},
+                "total_tokens": {"$sum": "$total_tokens"},
+                "cost_usd": {"$sum": "$cost_usd"},
+                "avg_latency_ms": {"$avg": "$latency_ms"}
+            }},
+            {"$sort": {"cost_usd": -1, "calls": -1}}
+        ]
+        rows = []
+        for doc in llm_ledger_collection.aggregate(pipeline):
+            group = doc.pop("_id")
+            rows.append({
+                **group,
+                **doc,
+                "cost_usd": round(doc["cost_usd"], 6),
+                "avg_latency_ms": round(doc["avg_latency_ms"], 1) if doc["avg_latency_ms"] is not None else None
+            })
+        if "day" in group_by:
+            # Newest day first, most expensive first within a day
+            rows.sort(key=lambda row: row["day"], reverse=True)
+        return rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buffered = len(self.buffer)
+        return {
+            **self.stats,
+            "buffered": buffered,
+            "running": self.task is not None,
+            "enabled": self.settings["enabled"]
+        }
+
+
+# Global ledger instance
+llm_ledger = LLMLedger(ai_config.llm_ledger)
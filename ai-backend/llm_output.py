@@ -0,0 +1,306 @@
+"""
+Tolerant Parsing and Validation of LLM Output
+Extracts the first JSON value from a provider reply (code fences, prose and trailing text
+included), repairs replies truncated at the token limit, validates questions and insights
+against pydantic schemas and parses streamed arrays incrementally
+"""
+
+import json
+import re
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+# Candidate start positions tried before giving up on a reply
+MAX_START_ATTEMPTS = 10
+# Cut points tried, newest first, when repairing a truncated reply
+MAX_REPAIR_ATTEMPTS = 50
+
+_CLOSERS = {"{": "}", "[": "]"}
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+class LLMOutputError(ValueError):
+    """No usable JSON value in a provider reply"""
+
+
+class QuestionOutput(BaseModel):
+    """A generated assessment question"""
+
+    question: str = Field(min_length=1)
+    options: List[str] = Field(min_length=4, max_length=4)
+    scenario: Optional[str] = None
+
+    @field_validator("options")
+    @classmethod
+    def options_not_blank(cls, options: List[str]) -> List[str]:
+        if any(not option.strip() for option in options):
+            raise ValueError("blank option")
+        return options
+
+
+class InsightOutput(BaseModel):
+    """Personalised insight for one recommended stream"""
+
+    stream: str = Field(min_length=1)
+    personality_fit: str = Field(min_length=1)
+    jk_opportunities: str = ""
+    challenges: str = ""
+    next_steps: str = ""
+    confidence: float = 0.8
+
+    @field_validator("personality_fit", "jk_opportunities", "challenges", "next_steps", mode="before")
+    @classmethod
+    def join_lists(cls, value: Any) -> Any:
+        # Models often answer "next steps" as a list of steps
+        if isinstance(value, list):
+            return "; ".join(str(item) for item in value)
+        return value
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def clamp_confidence(cls, value: Any) -> float:
+        try:
+            return min(1.0, max(0.0, float(value)))
+        except (TypeError, ValueError):
+            return 0.8
+
+
+class ParseStats:
+    """Per output kind: clean, extracted from surrounding text, repaired after truncation, failed"""
+
+    def __init__(self):
+        self.kinds: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, outcome: str, dropped_items: int = 0):
+        with self._lock:
+            entry = self.kinds.setdefault(kind, {
+                "clean": 0, "extracted": 0, "repaired": 0, "failed": 0, "dropped_items": 0
+            })
+            entry[outcome] += 1
+            entry["dropped_items"] += dropped_items
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            kinds = {}
+            for kind, entry in self.kinds.items():
+                total = entry["clean"] + entry["extracted"] + entry["repaired"] + entry["failed"]
+                kinds[kind] = {
+                    **entry,
+                    # Replies a plain json.loads after fence stripping would have thrown away
+                    "salvaged": entry["extracted"] + entry["repaired"],
+                    "failure_rate": round(entry["failed"] / total, 3) if total else None
+                }
+            return kinds
+
+
+def _scan(text: str, start: int) -> Tuple[Optional[int], List[str], List[Tuple[int, Tuple[str, ...]]], bool]:
+    """Bracket-match from ``start``: (end, open closers, cut points, inside a string at the end)
+
+    Cut points are the positions where the text can be cut and closed into valid JSON: after a
+    nested container closes, and before each comma (dropping the partial member after it).
+    """
+    stack: List[str] = []
+    cuts: List[Tuple[int, Tuple[str, ...]]] = []
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(_CLOSERS[char])
+        elif char in "}]":
+            if not stack or stack[-1] != char:
+                return None, [], [], False
+            stack.pop()
+            if not stack:
+                return i + 1, [], cuts, False
+            cuts.append((i + 1, tuple(stack)))
+        elif char == ",":
+            cuts.append((i, tuple(stack)))
+    return None, stack, cuts, in_string
+
+
+def _loads(candidate: str) -> Any:
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        # Trailing commas are the most common near-miss
+        return json.loads(_TRAILING_COMMA.sub(r"\1", candidate))
+
+
+def _repair(text: str, start: int, stack: List[str], cuts: List[Tuple[int, Tuple[str, ...]]],
+            in_string: bool) -> Any:
+    """Close a truncated value, preferring to keep as many complete members as possible"""
+    if not in_string:
+        tail = text[start:].rstrip().rstrip(",")
+        try:
+            return _loads(tail + "".join(reversed(stack)))
+        except ValueError:
+            pass
+    for end, open_closers in reversed(cuts[-MAX_REPAIR_ATTEMPTS:]):
+        try:
+            return _loads(text[start:end] + "".join(reversed(open_closers)))
+        except ValueError:
+            continue
+    raise LLMOutputError("truncated reply could not be repaired")
+
+
+def extract_json(text: str, expect: Optional[type] = None) -> Tuple[Any, str]:
+    """(first JSON value in ``text``, how it was obtained: clean, extracted or repaired)
+
+    ``expect`` (dict or list) restricts which value may start the match, so prose such as
+    "[Note]" before an object is skipped.
+    """
+    stripped = text.strip()
+    try:
+        value = json.loads(stripped)
+        if expect is None or isinstance(value, expect):
+            return value, "clean"
+    except ValueError:
+        pass
+
+    openers = {dict: "{", list: "["}.get(expect, "{[")
+    position = 0
+    for _ in range(MAX_START_ATTEMPTS):
+        starts = [index for index in (stripped.find(opener, position) for opener in openers) if index >= 0]
+        if not starts:
+            break
+        start = min(starts)
+        end, stack, cuts, in_string = _scan(stripped, start)
+        if end is not None:
+            try:
+                value = _loads(stripped[start:end])
+                if expect is None or isinstance(value, expect):
+                    return value, "extracted"
+            except ValueError:
+                pass
+        elif stack:
+            # Ran off the end of the reply: cut at the token limit
+            return _repair(stripped, start, stack, cuts, in_string), "repaired"
+        position = start + 1
+    raise LLMOutputError("no JSON value in reply")
+
+
+def parse_question(text: str) -> Dict[str, Any]:
+    """A validated question object, raising LLMOutputError if there is none"""
+    try:
+        value, outcome = extract_json(text, dict)
+        question = QuestionOutput.model_validate(value).model_dump()
+    except (LLMOutputError, ValidationError) as e:
+        parse_stats.record("question", "failed")
+        raise LLMOutputError(f"unusable question: {e}")
+    parse_stats.record("question", outcome)
+    return question
+
+
+def validate_insight(item: Any) -> Optional[Dict[str, Any]]:
+    """One stream's insight as a clean dict, or None if it is unusable"""
+    try:
+        return InsightOutput.model_validate(item).model_dump()
+    except ValidationError:
+        return None
+
+
+def validate_analysis(value: Any) -> Tuple[Dict[str, Any], int]:
+    """(analysis with only valid insights, number dropped); raises if no insight is usable
+
+    Items are checked one by one, so a reply repaired after truncation keeps its complete streams.
+    """
+    if not isinstance(value, dict) or not isinstance(value.get("enhanced_recommendations"), list):
+        raise LLMOutputError("unexpected analysis structure")
+    items = value["enhanced_recommendations"]
+    insights = [insight for insight in (validate_insight(item) for item in items) if insight is not None]
+    if not insights:
+        raise LLMOutputError("no valid stream insight in analysis")
+    analysis: Dict[str, Any] = {"enhanced_recommendations": insights}
+    if isinstance(value.get("overall_guidance"), str) and value["overall_guidance"].strip():
+        analysis["overall_guidance"] = value["overall_guidance"]
+    return analysis, len(items) - len(insights)
+
+
+def parse_analysis(text: str) -> Dict[str, Any]:
+    """A validated recommendation analysis, raising LLMOutputError if there is none"""
+    try:
+        value, outcome = extract_json(text, dict)
+        analysis, dropped = validate_analysis(value)
+    except LLMOutputError:
+        parse_stats.record("analysis", "failed")
+        raise
+    parse_stats.record("analysis", outcome, dropped)
+    return analysis
+
+
+class IncrementalArrayParser:
+    """Incrementally extracts the objects of one named array from a streamed JSON reply
+
+    Tracks string/escape state and brace depth over the growing buffer, so each object is
+    decoded exactly once, the moment its closing brace arrives.
+    """
+
+    def __init__(self, array_key: str):
+        self.array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(array_key))
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.object_start = 0
+        self.objects: List[Dict[str, Any]] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        self.buffer += text
+        completed = []
+        if not self.started:
+            match = self.array_start.search(self.buffer)
+            if not match:
+                return completed
+            self.started = True
+            self.pos = match.end()
+
+        buffer = self.buffer
+        while self.pos < len(buffer) and not self.finished:
+            char = buffer[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                if self.depth == 0:
+                    self.object_start = self.pos
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        item = _loads(buffer[self.object_start:self.pos + 1])
+                        if isinstance(item, dict):
+                            self.objects.append(item)
+                            completed.append(item)
+                    except ValueError:
+                        pass
+            elif char == "]" and self.depth == 0:
+                self.finished = True
+            self.pos += 1
+        return completed
+
+
+# Process-wide parse outcomes, reported on /ai-status
+parse_stats = ParseStats()
@@ -0,0 +1,238 @@
+"""
+On-box Question Generation
+Deterministic assessment questions built from trait keywords and the J&K scenario bank, so
+the question flow keeps working without any provider, plus a latency benchmark for the
+template engine and the local OpenAI-compatible model server
+"""
+
+import hashlib
+import random
+import statistics
+import time
+from typing import List, Dict, Any, Optional
+
+# Answer options per trait, ordered from weakest to strongest expression of the trait:
+# scoring maps option index i to (i + 1) / 4. Each rung has variants for variety.
+OPTION_LADDERS: Dict[str, List[List[str]]] = {
+    "analytical_thinking": [
+        ["Wait and see how things turn out before doing anything",
+         "Go with my first instinct and move on"],
+        ["Do what worked last time without looking into it much",
+         "Ask someone else what they think I should do"],
+        ["Compare a few options and pick the most sensible one",
+         "List the pros and cons before deciding"],
+        ["Break the problem into parts, gather the facts and reason through each step",
+         "Work out the root cause systematically before choosing a solution"],
+    ],
+    "creativity": [
+        ["Stick to the usual way it has always been done",
+         "Copy what others around me are already doing"],
+        ["Make small changes to an existing idea",
+         "Pick the safest of the ideas people suggest"],
+        ["Mix ideas from different places into something new",
+         "Try a fresh approach alongside the usual one"],
+        ["Come up with an original idea nobody has tried here before",
+         "Imagine a completely new solution and sketch how it would work"],
+    ],
+    "leadership": [
+        ["Let others decide and follow along",
+         "Stay in the background and do my part quietly"],
+        ["Help out if someone asks me to",
+         "Share my view when the group asks for it"],
+        ["Suggest a plan and help the group agree on it",
+         "Take charge of one part of the work"],
+        ["Bring people together, divide the work and guide the group to the goal",
+         "Step up to organise everyone and take responsibility for the outcome"],
+    ],
+    "social_skills": [
+        ["Handle it on my own without involving others",
+         "Avoid the discussion and focus on my own work"],
+        ["Talk to one or two people I already know",
+         "Listen to others but keep my opinions to myself"],
+        ["Discuss it with the people involved to understand their views",
+         "Work with a small team and keep everyone informed"],
+        ["Reach out to everyone involved, listen to each side and build agreement",
+         "Start conversations across groups and keep the team working together"],
+    ],
+    "technical_aptitude": [
+        ["Avoid technology and solve it by hand",
+         "Leave anything technical to someone else"],
+        ["Use a familiar app or tool if one is handy",
+         "Look up a simple online guide"],
+        ["Find a digital tool that fits and learn to use it well",
+         "Set up a spreadsheet or app to track the problem"],
+        ["Build or program a technical solution myself",
+         "Design an engineering fix, test it and improve it"],
+    ],
+    "entrepreneurial_spirit": [
+        ["Wait for the government or someone else to fix it",
+         "Avoid anything that involves financial risk"],
+        ["Support a business someone else is starting",
+         "Look for a stable job connected to the problem"],
+        ["Plan a small venture around it after studying the market",
+         "Start a low-risk side project to test the idea"],
+        ["Turn it into a business opportunity and take the risk to launch it",
+         "Start a venture that solves the problem and grows into a business"],
+    ],
+    "research_orientation": [
+        ["Accept the common explanation and move on",
+         "Not spend time digging into why it happens"],
+        ["Read one article about it",
+         "Ask a teacher for a quick answer"],
+        ["Look into several sources to understand it better",
+         "Collect some information and compare what I find"],
+        ["Investigate it properly with data, observation and experiments",
+         "Plan a small research project to discover what is really going on"],
+    ],
+    "helping_others": [
+        ["Focus on my own goals first",
+         "Leave it to the people whose job it is"],
+        ["Help if it does not take much of my time",
+         "Donate something small if asked"],
+        ["Volunteer regularly to support the people affected",
+         "Organise help for a few families I know"],
+        ["Dedicate myself to caring for and supporting everyone affected",
+         "Make helping the affected community my main priority"],
+    ],
+}
+
+QUESTION_STEMS = [
+    "{scenario}. What would you most likely do?",
+    "Imagine this situation: {scenario}. Which response sounds most like you?",
+    "Think about this in your own area: {scenario}. What is your first step?",
+]
+SUBJECT_STEM = "{scenario}. As a student good at {subject}, how would you respond?"
+
+# Used when the question bank has no scenarios
+DEFAULT_SCENARIOS = [
+    "Winter tourism decline affecting local handicraft business in Kashmir",
+    "Power shortage problem affecting education in J&K",
+    "Community leadership opportunity in J&K village",
+]
+
+
+class TemplateQuestionEngine:
+    """Deterministic question generator: same trait, academics and question number, same question"""
+
+    def __init__(self, traits: List[Any], question_bank: List[Any]):
+        self.keywords = {trait.name: list(trait.keywords) for trait in traits}
+        scenarios = sorted({q.scenario for q in question_bank if getattr(q, "scenario", None)})
+        self.scenarios = scenarios or DEFAULT_SCENARIOS
+        # Scenarios already used for a trait in the bank come first, so the context stays on topic
+        self.trait_scenarios = {
+            name: sorted({q.scenario for q in question_bank
+                          if getattr(q, "scenario", None) and name in q.traits_measured}) or self.scenarios
+            for name in self.keywords
+        }
+
+    def supports(self, trait: str) -> bool:
+        return trait in OPTION_LADDERS
+
+    def generate(self, target_trait: str, academic_performance: Dict[str, float],
+                 question_num: int) -> Optional[Dict[str, Any]]:
+        """Question fields for ``target_trait``, or None for a trait without a template"""
+        ladder = OPTION_LADDERS.get(target_trait)
+        if ladder is None:
+            return None
+        academics = "|".join(f"{subject}:{round(score / 10)}"
+                             for subject, score in sorted(academic_performance.items()))
+        seed = hashlib.sha1(f"{target_trait}|{question_num}|{academics}".encode()).hexdigest()
+        rng = random.Random(int(seed[:16], 16))
+
+        # Mostly scenarios from the trait's own bank questions, sometimes any scenario for variety
+        pool = self.trait_scenarios.get(target_trait, self.scenarios) if rng.random() < 0.7 else self.scenarios
+        scenario = rng.choice(pool)
+        strong_subjects = sorted(subject for subject, score in academic_performance.items() if score > 75)
+        if strong_subjects and rng.random() < 0.5:
+            question = SUBJECT_STEM.format(scenario=scenario, subject=rng.choice(strong_subjects))
+        else:
+            question = rng.choice(QUESTION_STEMS).format(scenario=scenario)
+
+        keywords = self.keywords.get(target_trait, [])
+        return {
+            "id": f"local_{target_trait}_{question_num}",
+            "question": question,
+            "options": [rng.choice(rung) for rung in ladder],
+            "scenario": scenario,
+            "context": f"Template on {', '.join(keywords[:3])}" if keywords else "Template question"
+        }
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"p50": round(pick(0.50), 2), "p95": round(pick(0.95), 2), "p99": round(pick(0.99), 2),
+            "mean": round(statistics.fmean(ordered), 2)}
+
+
+def benchmark_templates(engine: TemplateQuestionEngine, iterations: int = 10000) -> Dict[str, Any]:
+    """Template question latency in microseconds across traits and academic profiles"""
+    traits = list(OPTION_LADDERS)
+    academics = [{"Mathematics": 85, "Physics": 70}, {"Biology": 90, "English": 60}, {}]
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        engine.generate(traits[i % len(traits)], academics[i % len(academics)], i)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return {"iterations": iterations, "unit": "us", **_percentiles(samples)}
+
+
+def benchmark_local_model(ai: Any, requests: int = 5) -> Dict[str, Any]:
+    """Latency and parse rate of the local model server for questions and recommendation insights"""
+    from ai_config import AIProvider
+    from provider_clients import provider_registry
+    from llm_output import parse_question, parse_analysis, LLMOutputError
+
+    client = provider_registry.get_client(AIProvider.LOCAL)
+    question_prompt = (
+        "Create a psychometric question to assess analytical thinking for a student from Jammu & Kashmir.\n"
+        'Return ONLY this JSON: {"question": "...", "options": ["...", "...", "...", "..."], "scenario": "..."}'
+    )
+    traits = {trait.name: 0.6 for trait in ai.personality_traits}
+    academics = {"Mathematics": 82, "Physics": 74, "English": 68}
+    recommendations = ai._get_basic_recommendations(traits, academics)
+    insight_prompt = ai._build_recommendation_prompt(traits, academics, recommendations)
+
+    report = {}
+    for kind, prompt, max_tokens, parse in (("question", question_prompt, 300, parse_question),
+                                            ("insights", insight_prompt, 700, parse_analysis)):
+        samples, parsed, failed = [], 0, 0
+        for _ in range(requests):
+            started = time.perf_counter()
+            try:
+                response = client.generate(prompt, max_tokens=max_tokens)
+            except Exception as e:
+                failed += 1
+                print(f"Local {kind} request failed: {e}")
+                continue
+            samples.append((time.perf_counter() - started) * 1000)
+            try:
+                parse(response.text)
+                parsed += 1
+            except LLMOutputError:
+                pass
+        report[kind] = {
+            "requests": requests,
+            "failed": failed,
+            "parse_rate": round(parsed / (requests - failed), 3) if requests > failed else None,
+            "unit": "ms",
+            **(_percentiles(samples) if samples else {})
+        }
+    return report
+
+
+if __name__ == "__main__":
+    # Benchmark: python local_generation.py [model requests]
+    import json
+    import sys
+    from ai_config import AIProvider, ai_config
+    from psychometric_ai import psychometric_ai
+
+    result = {"templates": benchmark_templates(psychometric_ai.template_questions)}
+    if ai_config.is_provider_enabled(AIProvider.LOCAL):
+        result["local_model"] = benchmark_local_model(
+            psychometric_ai, int(sys.argv[1]) if len(sys.argv) > 1 else 5
+        )
+    else:
+        print("LOCAL_LLM_BASE_URL not set: skipping the local model benchmark")
+    print(json.dumps(result, indent=2))
@@ -1,11 +1,15 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import pytesseract
 from PIL import Image
 import io
 import json
+import time
+import asyncio
 from datetime import datetime, timezone, timezone
 
 import os
@@ -24,11 +28,35 @@ from psychometric_ai import (
 from streams_database import (
     COMPREHENSIVE_STREAMS_DATABASE,
     get_all_streams,
+    get_catalog_version,
     search_streams_by_requirements
 )
-from ai_config import ai_config, get_recommended_setup
+from ai_config import ai_config, AIProvider, get_recommended_setup
+from provider_clients import provider_registry
+from provider_hedging import provider_hedger
+from insight_cache import insight_cache
+from deferred_insights import deferred_insights
+from batch_enrichment import batch_enrichment
+from single_flight import insight_flights
+from provider_router import provider_router
+from request_deadline import RequestDeadline, start_deadline, deadline_stats
+from llm_output import parse_stats
+from llm_ledger import llm_ledger, begin_ledger_scope, set_ledger_user, ROLLUP_FIELDS
+from provider_benchmark import run_benchmark, load_runs
+from insight_stream import stream_recommendation_events
+from cohort_clusters import cluster_model, rebuild_clusters, evaluate_k, CLUSTER_K, CLUSTER_MAX_PROFILES
+from stream_facets import get_facet_index
+from stream_search import search_streams_by_text
+from autocomplete import get_autocomplete_index
+from student_index import student_index, build_profile_vector, summarize_neighbour_choices
+from stream_fit_index import index_student, find_students_for_stream, refresh_stale_scores, count_stale_profiles
 
-app = FastAPI()
+async def attribute_llm_calls(request: Request):
+    """Dependency: provider calls made while serving a route are ledgered under its path template"""
+    route = request.scope.get("route")
+    begin_ledger_scope(getattr(route, "path", request.url.path), request.path_params.get("user_id"))
+
+app = FastAPI(dependencies=[Depends(attribute_llm_calls)])
 
 # Allow CORS for local frontend
 app.add_middleware(
@@ -39,6 +67,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_deferred_insights():
+    llm_ledger.start()
+    if ai_config.batch_enrichment["enabled"]:
+        # Pending documents, including ones left by a previous process, are enriched in batches
+        deferred_insights.start(sweep=False)
+        batch_enrichment.start()
+        return
+    deferred_insights.start()
+    # Pick up enrichment jobs lost by a previous process
+    try:
+        await deferred_insights.requeue_stale()
+    except Exception as e:
+        print(f"Failed to requeue pending insights: {e}")
+
+@app.on_event("shutdown")
+async def close_provider_clients():
+    await batch_enrichment.stop()
+    await deferred_insights.stop()
+    await provider_registry.aclose()
+    # Last, so the calls of the jobs stopped above are written too
+    await llm_ledger.stop()
+
+async def open_request_deadline(request: Request) -> Optional[RequestDeadline]:
+    """Dependency: the request's time budget, from the client's deadline header or the server default"""
+    return start_deadline(request.headers.get(ai_config.deadlines["header"]), ai_config.deadlines)
+
+def close_request_deadline(deadline: Optional[RequestDeadline], response: Response) -> Optional[Dict[str, Any]]:
+    """Record the deadline outcome and expose its stage timings as Server-Timing headers"""
+    if deadline is None:
+        return None
+    deadline_stats.record(deadline)
+    response.headers["Server-Timing"] = deadline.server_timing()
+    if deadline.exhausted_by:
+        response.headers["X-Deadline-Exhausted-By"] = deadline.exhausted_by
+    return deadline.report()
+
 # Models
 class SubjectMark(BaseModel):
     name: str
@@ -71,6 +136,7 @@ class AssessmentSubmission(BaseModel):
     user_id: str
     responses: List[UserResponse]
     academic_performance: Dict[str, float]
+    defer_insights: Optional[bool] = None  # None: server default (AI_DEFER_INSIGHTS)
 
 # OCR endpoint
 @app.post("/ocr-upload", response_model=OCRResult)
@@ -104,15 +170,20 @@ def ocr_upload(marksheet: UploadFile = File(...)):
 # AI-Powered Psychometric Assessment Endpoints
 
 @app.post("/generate-adaptive-questions", response_model=List[Dict[str, Any]])
-def generate_adaptive_questions(request: AssessmentRequest):
+def generate_adaptive_questions(request: AssessmentRequest, response: Response,
+                                deadline: Optional[RequestDeadline] = Depends(open_request_deadline)):
     """Generate adaptive psychometric questions using AI"""
+    set_ledger_user(request.user_id)
     try:
-        # Generate questions based on user's profile and previous responses
+        # Generate questions based on user's profile and previous responses; with generated
+        # questions (AI_QUESTION_SOURCE=ai) provider calls stop once the deadline runs out and
+        # the remaining slots come from the on-box templates, then the curated bank
         questions = psychometric_ai.generate_adaptive_questions(
             user_responses=request.previous_responses,
             academic_performance=request.academic_performance,
             num_questions=request.num_questions
         )
+        close_request_deadline(deadline, response)
         
         # Convert to dict format for JSON response
         return [
@@ -131,14 +202,89 @@ def generate_adaptive_questions(request: AssessmentRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate questions: {str(e)}")
 
+def _store_assessment(submission: AssessmentSubmission, profile: PersonalityProfile, profile_data: Dict[str, Any]):
+    """Persist an analysed assessment: profile, academics, versioned recommendations and indexes"""
+    recommendation_method = profile_data["recommendation_method"]
+    has_ai_insights = recommendation_method == "ai_enhanced"
+    
+    # Store in MongoDB (replace existing profile for same user)
+    answers_collection.replace_one(
+        {"user_id": submission.user_id},
+        profile_data,
+        upsert=True
+    )
+    
+    # Store academic performance separately for quick access
+    academic_data = {
+        "user_id": submission.user_id,
+        "academic_performance": submission.academic_performance,
+        "academic_average": profile_data["academic_average"],
+        "strong_subjects": profile_data["strong_subjects"],
+        "weak_subjects": profile_data["weak_subjects"],
+        "updated_at": datetime.utcnow()
+    }
+    
+    marksheets_collection.replace_one(
+        {"user_id": submission.user_id},
+        academic_data,
+        upsert=True
+    )
+    
+    # Store stream recommendations separately with versioning
+    recommendations_data = {
+        "user_id": submission.user_id,
+        "assessment_id": profile_data["assessment_id"],
+        "recommended_streams": profile.recommended_streams,
+        "recommendation_method": recommendation_method,
+        "recommendation_quality": "high" if has_ai_insights else "good",
+        "insights_pending": profile_data["insights_pending"],
+        "trait_scores_snapshot": profile.trait_scores,
+        "academic_performance_snapshot": submission.academic_performance,
+        "generated_at": datetime.utcnow(),
+        "is_latest": True,
+        "version": 1
+    }
+    
+    # Mark previous recommendations as not latest
+    db["stream_recommendations"].update_many(
+        {"user_id": submission.user_id, "is_latest": True},
+        {"$set": {"is_latest": False}}
+    )
+    
+    # Insert new recommendations
+    db["stream_recommendations"].insert_one(recommendations_data)
+    
+    # Keep the "students like me" index current without waiting for its periodic sync
+    try:
+        student_index.upsert(
+            submission.user_id,
+            profile.trait_scores,
+            submission.academic_performance,
+            profile.recommended_streams[0]["stream"] if profile.recommended_streams else None
+        )
+    except Exception as e:
+        print(f"Failed to update student similarity index: {e}")
+    
+    try:
+        index_student(submission.user_id, profile.trait_scores, submission.academic_performance)
+    except Exception as e:
+        print(f"Failed to update stream fit index: {e}")
+
 @app.post("/analyze-psychometric-responses", response_model=Dict[str, Any])
-def analyze_psychometric_responses(submission: AssessmentSubmission):
+async def analyze_psychometric_responses(submission: AssessmentSubmission, response: Response,
+                                         deadline: Optional[RequestDeadline] = Depends(open_request_deadline)):
     """Analyze psychometric responses and generate AI-powered personality profile with stream recommendations"""
+    set_ledger_user(submission.user_id)
     try:
-        # Analyze responses using AI-enhanced system
-        profile = psychometric_ai.analyze_responses(
+        defer_insights = submission.defer_insights
+        if defer_insights is None:
+            defer_insights = ai_config.deferred_insights["default"]
+        
+        # Analyze responses using AI-enhanced system (or algorithmic only, enriched later)
+        profile = await psychometric_ai.analyze_responses(
             responses=submission.responses,
-            academic_performance=submission.academic_performance
+            academic_performance=submission.academic_performance,
+            enhance_with_ai=not defer_insights
         )
         
         # Set user ID
@@ -151,6 +297,7 @@ def analyze_psychometric_responses(submission: AssessmentSubmission):
         # Comprehensive profile data for MongoDB storage
         profile_data = {
             "user_id": submission.user_id,
+            "assessment_id": submission.user_id + "_" + datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S"),
             "assessment_date": datetime.now(timezone.utc),
             "assessment_type": "comprehensive_psychometric",
             
@@ -173,6 +320,7 @@ def analyze_psychometric_responses(submission: AssessmentSubmission):
             "recommended_streams": profile.recommended_streams,
             "recommendation_method": recommendation_method,
             "recommendation_quality": "high" if has_ai_insights else "good",
+            "insights_pending": defer_insights,
             "total_streams_analyzed": len(profile.recommended_streams),
             
             # Raw Response Data
@@ -194,55 +342,23 @@ def analyze_psychometric_responses(submission: AssessmentSubmission):
             "version": "2.0_ai_enhanced"
         }
         
-        # Store in MongoDB (replace existing profile for same user)
-        answers_collection.replace_one(
-            {"user_id": submission.user_id},
-            profile_data,
-            upsert=True
-        )
+        # Mongo writes are blocking, so they run in the threadpool instead of on the event loop
+        await run_in_threadpool(_store_assessment, submission, profile, profile_data)
         
-        # Store academic performance separately for quick access
-        academic_data = {
-            "user_id": submission.user_id,
-            "academic_performance": submission.academic_performance,
-            "academic_average": profile_data["academic_average"],
-            "strong_subjects": profile_data["strong_subjects"],
-            "weak_subjects": profile_data["weak_subjects"],
-            "updated_at": datetime.utcnow()
-        }
-        
-        marksheets_collection.replace_one(
-            {"user_id": submission.user_id},
-            academic_data,
-            upsert=True
-        )
-        
-        # Store stream recommendations separately with versioning
-        recommendations_data = {
-            "user_id": submission.user_id,
-            "assessment_id": submission.user_id + "_" + datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S"),
-            "recommended_streams": profile.recommended_streams,
-            "recommendation_method": recommendation_method,
-            "recommendation_quality": "high" if has_ai_insights else "good",
-            "trait_scores_snapshot": profile.trait_scores,
-            "academic_performance_snapshot": submission.academic_performance,
-            "generated_at": datetime.utcnow(),
-            "is_latest": True,
-            "version": 1
-        }
-        
-        # Mark previous recommendations as not latest
-        db["stream_recommendations"].update_many(
-            {"user_id": submission.user_id, "is_latest": True},
-            {"$set": {"is_latest": False}}
-        )
-        
-        # Insert new recommendations
-        db["stream_recommendations"].insert_one(recommendations_data)
+        if defer_insights and not ai_config.batch_enrichment["enabled"]:
+            deferred_insights.enqueue({
+                "user_id": submission.user_id,
+                "assessment_id": profile_data["assessment_id"],
+                "trait_scores": profile.trait_scores,
+                "academic_performance": submission.academic_performance,
+                "recommended_streams": profile.recommended_streams
+            })
         
         return {
             "success": True,
             "assessment_id": submission.user_id,
+            "recommendations_assessment_id": profile_data["assessment_id"],
+            "insights_pending": defer_insights,
             "profile": {
                 "user_id": profile.user_id,
                 "trait_scores": profile.trait_scores,
@@ -254,8 +370,10 @@ def analyze_psychometric_responses(submission: AssessmentSubmission):
                 "recommended_streams": profile.recommended_streams,
                 "confidence_score": profile.confidence_score,
                 "academic_performance": submission.academic_performance,
-                "recommendation_method": profile_data["recommendation_method"]
-            }
+                "recommendation_method": profile_data["recommendation_method"],
+                "insights_pending": defer_insights
+            },
+            "deadline": close_request_deadline(deadline, response)
         }
         
     except Exception as e:
@@ -302,18 +420,20 @@ def get_user_profile(user_id: str):
         }
 
 @app.post("/get-stream-recommendations", response_model=Dict[str, Any])
-def get_stream_recommendations(request: Dict[str, Any]):
+async def get_stream_recommendations(request: Dict[str, Any], response: Response,
+                                     deadline: Optional[RequestDeadline] = Depends(open_request_deadline)):
     """Get AI-enhanced personalized stream recommendations"""
     try:
         user_id = request.get("user_id")
         trait_scores = request.get("trait_scores", {})
         academic_performance = request.get("academic_performance", {})
+        set_ledger_user(user_id)
         
         if not trait_scores:
             raise HTTPException(status_code=400, detail="Trait scores required")
         
         # Generate AI-enhanced recommendations
-        recommendations = psychometric_ai._recommend_streams(trait_scores, academic_performance)
+        recommendations = await psychometric_ai._recommend_streams(trait_scores, academic_performance)
         
         # Store the recommendation request for analytics
         recommendation_log = {
@@ -327,14 +447,15 @@ def get_stream_recommendations(request: Dict[str, Any]):
         }
         
         # Store in a separate collection for analytics
-        db["recommendation_logs"].insert_one(recommendation_log)
+        await run_in_threadpool(db["recommendation_logs"].insert_one, recommendation_log)
         
         return {
             "success": True,
             "recommendations": recommendations,
             "ai_enhanced": recommendation_log["ai_enhanced"],
             "generated_at": datetime.utcnow().isoformat(),
-            "user_id": user_id
+            "user_id": user_id,
+            "deadline": close_request_deadline(deadline, response)
         }
         
     except HTTPException:
@@ -342,6 +463,37 @@ def get_stream_recommendations(request: Dict[str, Any]):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate recommendations: {str(e)}")
 
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.post("/stream-recommendations")
+async def stream_recommendations(request: Dict[str, Any],
+                                 deadline: Optional[RequestDeadline] = Depends(open_request_deadline)):
+    """Server-sent events: algorithmic recommendations first, then each stream's AI insights as generated"""
+    trait_scores = request.get("trait_scores", {})
+    academic_performance = request.get("academic_performance", {})
+    if not trait_scores:
+        raise HTTPException(status_code=400, detail="Trait scores required")
+    return StreamingResponse(
+        stream_recommendation_events(trait_scores, academic_performance),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@app.get("/stream-recommendations/{user_id}")
+async def stream_user_recommendations(user_id: str,
+                                      deadline: Optional[RequestDeadline] = Depends(open_request_deadline)):
+    """EventSource-friendly variant that streams recommendations for a stored profile"""
+    profile = await run_in_threadpool(
+        answers_collection.find_one, {"user_id": user_id}, {"trait_scores": 1, "academic_performance": 1}
+    )
+    if not profile or not profile.get("trait_scores"):
+        raise HTTPException(status_code=404, detail="User profile not found")
+    return StreamingResponse(
+        stream_recommendation_events(profile["trait_scores"], profile.get("academic_performance") or {}),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 @app.get("/get-user-complete-profile/{user_id}", response_model=Dict[str, Any])
 def get_user_complete_profile(user_id: str):
     """Get user's complete profile including academic performance and psychometric results"""
@@ -426,6 +578,19 @@ def get_ai_status():
             "success": True,
             "ai_status": status_report,
             "setup_instructions": setup_instructions,
+            "provider_clients": provider_registry.get_stats(),
+            "circuit_breakers": {
+                provider.value: breaker.snapshot()["state"] for provider, breaker in provider_registry.breakers.items()
+            },
+            "hedging": provider_hedger.stats.snapshot(),
+            "single_flight": insight_flights.get_stats(),
+            "routing": provider_router.get_stats(),
+            "deadlines": deadline_stats.snapshot(),
+            "llm_output": parse_stats.snapshot(),
+            "insight_cache": insight_cache.get_stats(),
+            "deferred_insights": deferred_insights.get_stats(),
+            "batch_enrichment": batch_enrichment.get_stats(),
+            "llm_ledger": llm_ledger.get_stats(),
             "recommendations": {
                 "primary": "Use OpenAI for best quality (requires API key)",
                 "free_alternative": "Use Google Gemini (free tier available)",
@@ -441,13 +606,15 @@ def health_check():
     providers_available = 0
     primary_provider = "mock"
     
-    # Check Grok availability
-    if os.getenv("GROK_API_KEY"):
+    # Check Grok availability (single key or key pool)
+    grok_available = ai_config.is_provider_enabled(AIProvider.GROK)
+    if grok_available:
         providers_available += 1
         primary_provider = "grok"
     
     # Check Gemini availability
-    if os.getenv("GOOGLE_API_KEY"):
+    gemini_available = ai_config.is_provider_enabled(AIProvider.GEMINI)
+    if gemini_available:
         providers_available += 1
         if primary_provider == "mock":
             primary_provider = "gemini"
@@ -457,70 +624,67 @@ def health_check():
         "ai_providers_available": providers_available,
         "primary_provider": primary_provider,
         "fallback_questions": len(psychometric_ai.question_bank),
-        "grok_available": bool(os.getenv("GROK_API_KEY")),
-        "gemini_available": bool(os.getenv("GOOGLE_API_KEY"))
+        "grok_available": grok_available,
+        "gemini_available": gemini_available
     }
 
-@app.post("/test-grok")
-def test_grok_generation():
-    """Test Grok AI recommendation generation"""
-    try:
-        # Test with sample data
-        sample_trait_scores = {
-            "analytical_thinking": 0.75,
-            "creativity": 0.80,
-            "leadership": 0.70,
-            "social_skills": 0.65,
-            "technical_aptitude": 0.85,
-            "entrepreneurial_spirit": 0.60,
-            "research_orientation": 0.75,
-            "helping_others": 0.70
-        }
-        
-        sample_academic = {
-            "Mathematics": 85,
-            "Physics": 78,
-            "Computer Science": 90,
-            "English": 75,
-            "Chemistry": 70
-        }
-        
-        # Get basic recommendations first
-        basic_recs = psychometric_ai._get_basic_recommendations(sample_trait_scores, sample_academic)
-        
-        # Test Grok enhancement
-        enhanced_recs = psychometric_ai._try_grok_recommendations(
-            sample_trait_scores, 
-            sample_academic, 
-            basic_recs
+class BenchmarkRequest(BaseModel):
+    providers: Optional[List[str]] = None
+    tasks: Optional[List[str]] = None
+    tiers: Optional[List[str]] = None
+    requests: int = 10
+    concurrency: int = 5
+    store: bool = True
+    label: Optional[str] = None
+
+@app.post("/benchmark/providers", response_model=Dict[str, Any])
+async def benchmark_providers(request: BenchmarkRequest):
+    """Send N concurrent production-prompt requests per provider and model; latency, parse rate,
+    tokens/sec and the change against the previous stored run (spends real provider quota)"""
+    try:
+        run = await run_benchmark(
+            psychometric_ai, providers=request.providers, tasks=request.tasks, tiers=request.tiers,
+            requests=request.requests, concurrency=request.concurrency, store=request.store, label=request.label
         )
-        
-        if enhanced_recs and any(rec.get("ai_insights") for rec in enhanced_recs):
-            return {
-                "success": True,
-                "message": "Grok AI is working correctly!",
-                "sample_recommendation": {
-                    "stream": enhanced_recs[0]["stream"],
-                    "match_percentage": enhanced_recs[0]["match_percentage"],
-                    "ai_insights": enhanced_recs[0].get("ai_insights", {}),
-                    "has_ai_insights": bool(enhanced_recs[0].get("ai_insights"))
-                },
-                "generation_time": "< 5 seconds (Grok Beta)",
-                "model_used": "grok-beta",
-                "framework": "Grok API via X.AI"
-            }
-        else:
-            return {
-                "success": False,
-                "message": "Grok generation failed, check API key and configuration"
-            }
-            
+        return {"success": bool(run["results"]), **run}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Benchmark failed: {str(e)}")
+
+@app.get("/benchmark/providers/runs", response_model=Dict[str, Any])
+async def list_benchmark_runs(limit: int = 10):
+    """Stored benchmark runs, newest first"""
+    try:
+        runs = await run_in_threadpool(load_runs, max(1, min(limit, 100)))
+        return {"runs": runs}
     except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load benchmark runs: {str(e)}")
+
+@app.get("/llm-ledger/rollup", response_model=Dict[str, Any])
+async def get_llm_ledger_rollup(group_by: str = "day,endpoint,provider", days: int = 7,
+                                endpoint: Optional[str] = None, provider: Optional[str] = None):
+    """Provider calls, tokens, cost and latency from the ledger, grouped by any of day, endpoint,
+    provider, model and outcome (comma-separated)"""
+    fields = [field.strip() for field in group_by.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in ROLLUP_FIELDS]
+    if not fields or unknown:
+        raise HTTPException(status_code=400, detail=f"group_by takes any of {', '.join(ROLLUP_FIELDS)}")
+    days = max(1, min(days, 366))
+    try:
+        # Include what is still buffered
+        await llm_ledger.flush()
+        rows = await run_in_threadpool(llm_ledger.rollup, fields, days, endpoint, provider)
         return {
-            "success": False,
-            "error": str(e),
-            "message": "Grok test failed"
+            "group_by": fields,
+            "days": days,
+            "rows": rows,
+            "totals": {
+                "calls": sum(row["calls"] for row in rows),
+                "total_tokens": sum(row["total_tokens"] for row in rows),
+                "cost_usd": round(sum(row["cost_usd"] for row in rows), 6)
+            }
         }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to roll up the LLM ledger: {str(e)}")
 
 @app.get("/explore-streams", response_model=Dict[str, Any])
 def explore_comprehensive_streams():
@@ -562,17 +726,25 @@ def search_streams_by_profile(request: Dict[str, Any]):
         trait_scores = request.get("trait_scores", {})
         academic_performance = request.get("academic_performance", {})
         threshold = request.get("threshold", 0.6)
+        filters = request.get("filters", {})
         
         if not trait_scores or not academic_performance:
             raise HTTPException(status_code=400, detail="Both trait scores and academic performance required")
         
+        # Narrow the catalog with the facet bitmaps before scoring
+        facet_index = get_facet_index()
+        candidate_streams, facet_counts = facet_index.filter(filters)
+        
         # Search using comprehensive database
-        matching_streams = search_streams_by_requirements(trait_scores, academic_performance, threshold)
+        matching_streams = search_streams_by_requirements(
+            trait_scores, academic_performance, threshold, streams=candidate_streams
+        )
         
         # Format results
         results = []
         for match in matching_streams[:10]:  # Top 10 matches
             stream_data = match["stream_data"]
+            parsed_fields = facet_index.get_parsed_fields(stream_data["name"])
             results.append({
                 "name": stream_data["name"],
                 "category": stream_data["category"],
@@ -586,13 +758,25 @@ def search_streams_by_profile(request: Dict[str, Any]):
                 "top_colleges": stream_data.get("top_colleges", [])[:3],
                 "entrance_exams": stream_data.get("entrance_exams", [])[:3],
                 "skills_required": stream_data["skills_required"][:4],
-                "future_trends": stream_data["future_trends"][:2]
+                "future_trends": stream_data["future_trends"][:2],
+                "duration_years": {
+                    "min": parsed_fields.get("duration_min_years"),
+                    "max": parsed_fields.get("duration_max_years")
+                },
+                "entry_salary_lpa": {
+                    "min": parsed_fields.get("entry_salary_min_lpa"),
+                    "max": parsed_fields.get("entry_salary_max_lpa")
+                }
             })
         
         return {
             "success": True,
             "matches_found": len(results),
             "threshold_used": threshold,
+            "filters_applied": filters,
+            "streams_after_filters": len(candidate_streams),
+            "facets": facet_counts,
+            "catalog_version": facet_index.catalog_version,
             "streams": results
         }
         
@@ -601,6 +785,237 @@ def search_streams_by_profile(request: Dict[str, Any]):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to search streams: {str(e)}")
 
+@app.post("/search-streams-text", response_model=Dict[str, Any])
+def search_streams_text(request: Dict[str, Any]):
+    """Free-text search over streams and careers, optionally blended with the trait match score"""
+    try:
+        query = (request.get("query") or "").strip()
+        top_k = int(request.get("top_k", 10))
+        text_weight = float(request.get("text_weight", 0.6))
+        filters = request.get("filters")
+        
+        if not query:
+            raise HTTPException(status_code=400, detail="Query text required")
+        if not 0.0 <= text_weight <= 1.0:
+            raise HTTPException(status_code=400, detail="text_weight must be between 0 and 1")
+        
+        allowed_streams = None
+        if filters:
+            candidate_streams, _ = get_facet_index().filter(filters)
+            allowed_streams = [stream["name"] for stream in candidate_streams]
+        
+        search_result = search_streams_by_text(
+            query,
+            top_k=max(1, min(top_k, 50)),
+            trait_scores=request.get("trait_scores"),
+            academic_performance=request.get("academic_performance"),
+            text_weight=text_weight,
+            allowed_streams=allowed_streams
+        )
+        
+        streams = []
+        for hit in search_result["streams"]:
+            stream_data = hit["stream_data"]
+            result = {
+                "name": stream_data["name"],
+                "category": stream_data["category"],
+                "description": stream_data["description"],
+                "score": round(hit["score"] * 100, 1),
+                "text_relevance": round(hit["relevance"] * 100, 1),
+                "career_paths": stream_data["career_paths"][:5],
+                "jk_opportunities": stream_data.get("jk_opportunities", [])[:3],
+                "salary_range": stream_data["salary_range"]
+            }
+            if "match_score" in hit:
+                result["match_score"] = round(hit["match_score"] * 100, 1)
+            streams.append(result)
+        
+        careers = [
+            {
+                "career": hit["title"],
+                "stream": hit["stream"],
+                "text_score": round(hit["text_score"], 4)
+            }
+            for hit in search_result["careers"]
+        ]
+        
+        return {
+            "success": True,
+            "query": query,
+            "blended": search_result["blended"],
+            "catalog_version": search_result["catalog_version"],
+            "streams": streams,
+            "careers": careers
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to search streams: {str(e)}")
+
+@app.get("/autocomplete", response_model=Dict[str, Any])
+def autocomplete(q: str, limit: int = 8, types: Optional[str] = None):
+    """Type-ahead suggestions over stream names, career paths, course names and college names"""
+    try:
+        type_list = [t.strip() for t in types.split(",") if t.strip()] if types else None
+        suggestions = get_autocomplete_index().suggest(q, limit=max(1, min(limit, 20)), types=type_list)
+        return {
+            "success": True,
+            "query": q,
+            "suggestions": suggestions
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to autocomplete: {str(e)}")
+
+@app.get("/similar-students/{user_id}", response_model=Dict[str, Any])
+def get_similar_students(user_id: str, k: int = 20):
+    """What students with profiles like this user's were recommended"""
+    try:
+        student_index.ensure_loaded()
+        vector = student_index.get_vector(user_id)
+        if vector is None:
+            raise HTTPException(status_code=404, detail="No assessment found for user")
+        
+        neighbours = student_index.query(vector, k=max(1, min(k, 200)), exclude_user_id=user_id)
+        
+        return {
+            "success": True,
+            "user_id": user_id,
+            "neighbours_found": len(neighbours),
+            "average_distance": round(sum(d for _, d, _ in neighbours) / len(neighbours), 4) if neighbours else None,
+            "stream_choices": summarize_neighbour_choices(neighbours),
+            "index": student_index.get_stats()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to find similar students: {str(e)}")
+
+@app.post("/similar-students", response_model=Dict[str, Any])
+def find_similar_students(request: Dict[str, Any]):
+    """Same as GET /similar-students for a profile that has not been stored yet"""
+    try:
+        trait_scores = request.get("trait_scores", {})
+        academic_performance = request.get("academic_performance", {})
+        k = int(request.get("k", 20))
+        
+        if not trait_scores:
+            raise HTTPException(status_code=400, detail="Trait scores required")
+        
+        student_index.ensure_loaded()
+        neighbours = student_index.query(
+            build_profile_vector(trait_scores, academic_performance),
+            k=max(1, min(k, 200)),
+            exclude_user_id=request.get("user_id")
+        )
+        
+        return {
+            "success": True,
+            "neighbours_found": len(neighbours),
+            "stream_choices": summarize_neighbour_choices(neighbours)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to find similar students: {str(e)}")
+
+@app.get("/stream-fit/{stream_name}", response_model=Dict[str, Any])
+def get_students_for_stream(stream_name: str, limit: int = 50, cursor: Optional[str] = None,
+                            min_score: Optional[float] = None, user_ids: Optional[str] = None):
+    """Students ranked by how well they fit a stream (for colleges and counsellors)"""
+    try:
+        result = find_students_for_stream(
+            stream_name,
+            limit=max(1, min(limit, 200)),
+            cursor=cursor,
+            min_score=min_score,
+            user_ids=[u.strip() for u in user_ids.split(",") if u.strip()] if user_ids else None
+        )
+        return {
+            "success": True,
+            **result,
+            "returned": len(result["students"])
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to query stream fit index: {str(e)}")
+
+@app.post("/stream-fit/refresh", response_model=Dict[str, Any])
+def refresh_stream_fit_index(request: Optional[Dict[str, Any]] = None):
+    """Recompute stored stream scores for profiles indexed under an older catalog version"""
+    try:
+        request = request or {}
+        batch_size = int(request.get("batch_size", 500))
+        max_batches = request.get("max_batches")
+        result = refresh_stale_scores(
+            batch_size=max(1, min(batch_size, 5000)),
+            max_batches=int(max_batches) if max_batches is not None else None
+        )
+        return {"success": True, **result}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to refresh stream fit index: {str(e)}")
+
+@app.get("/stream-fit-status", response_model=Dict[str, Any])
+def get_stream_fit_status():
+    """How many stored profiles still carry scores from an older catalog version"""
+    try:
+        return {
+            "success": True,
+            "catalog_version": get_catalog_version(),
+            "stale_profiles": count_stale_profiles()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get stream fit status: {str(e)}")
+
+@app.post("/clusters/rebuild", response_model=Dict[str, Any])
+async def rebuild_cohort_clusters(request: Optional[Dict[str, Any]] = None):
+    """Re-cluster stored profiles and regenerate per-cluster AI insights (one call per 3 streams per cluster)"""
+    try:
+        request = request or {}
+        k = max(2, min(int(request.get("k", CLUSTER_K)), 512))
+        max_profiles = int(request.get("max_profiles", CLUSTER_MAX_PROFILES))
+        model = await rebuild_clusters(
+            lambda traits, academics, recommendations: psychometric_ai._fetch_ai_analysis(
+                traits, academics, recommendations, task="offline_insights"
+            ),
+            k=k, max_profiles=max_profiles
+        )
+        if model is None:
+            raise HTTPException(status_code=404, detail="No stored profiles to cluster")
+        return {
+            "success": True,
+            "k": model["k"],
+            "profiles": model["profiles"],
+            "quality": model["quality"],
+            "llm_calls": model["llm_calls"],
+            "insight_failures": model.get("insight_failures", 0)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to rebuild clusters: {str(e)}")
+
+@app.post("/clusters/evaluate", response_model=Dict[str, Any])
+async def evaluate_cohort_clusters(request: Dict[str, Any]):
+    """Compare cluster quality and insight generation cost across k values without saving"""
+    try:
+        k_values = [max(2, min(int(k), 512)) for k in request.get("k_values", [8, 16, 32, 64])]
+        max_profiles = int(request.get("max_profiles", CLUSTER_MAX_PROFILES))
+        results = await run_in_threadpool(evaluate_k, k_values, max_profiles)
+        return {"success": True, "results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to evaluate clusters: {str(e)}")
+
+@app.get("/cluster-status", response_model=Dict[str, Any])
+async def get_cluster_status():
+    """Current cohort cluster model, its quality and how often its insights are reused"""
+    try:
+        await cluster_model.ensure_loaded()
+        return {"success": True, **cluster_model.get_status()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get cluster status: {str(e)}")
+
 @app.get("/get-user-recommendations/{user_id}", response_model=Dict[str, Any])
 def get_user_stream_recommendations(user_id: str):
     """Get user's latest stream recommendations"""
@@ -643,6 +1058,83 @@ def get_user_stream_recommendations(user_id: str):
             "has_recommendations": False
         }
 
+@app.get("/recommendation-insights/{user_id}", response_model=Dict[str, Any])
+async def get_recommendation_insights(user_id: str, assessment_id: Optional[str] = None, wait: float = 0):
+    """Fetch deferred AI insights; with wait > 0 the call long-polls until they are ready (max 30s)"""
+    try:
+        query: Dict[str, Any] = {"user_id": user_id}
+        if assessment_id:
+            query["assessment_id"] = assessment_id
+        else:
+            query["is_latest"] = True
+        
+        def load():
+            return db["stream_recommendations"].find_one(query, {"_id": 0}, sort=[("generated_at", -1)])
+        
+        doc = await run_in_threadpool(load)
+        if not doc:
+            raise HTTPException(status_code=404, detail="No recommendations found for user")
+        
+        deadline = time.monotonic() + max(0.0, min(wait, 30.0))
+        while doc.get("insights_pending") and time.monotonic() < deadline:
+            # Woken directly when this process runs the job; otherwise re-check the document each second
+            remaining = max(0.0, deadline - time.monotonic())
+            if not await deferred_insights.wait_for(doc["assessment_id"], remaining):
+                await asyncio.sleep(min(1.0, max(0.0, deadline - time.monotonic())))
+            doc = await run_in_threadpool(load) or doc
+        
+        return {
+            "success": True,
+            "user_id": user_id,
+            "assessment_id": doc.get("assessment_id"),
+            "insights_pending": bool(doc.get("insights_pending")),
+            "recommended_streams": doc.get("recommended_streams", []),
+            "recommendation_method": doc.get("recommendation_method"),
+            "insights_completed_at": doc["insights_completed_at"].isoformat() if doc.get("insights_completed_at") else None
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get recommendation insights: {str(e)}")
+
+@app.post("/batch-enrichment/run", response_model=Dict[str, Any])
+async def run_batch_enrichment(request: Dict[str, Any]):
+    """Enrich pending recommendations in batches now; with "wait": false the run continues in the background"""
+    try:
+        if batch_enrichment.running:
+            return {"success": True, "started": False, "message": "A batch enrichment run is already in progress"}
+        run = batch_enrichment.run(
+            max_students=int(request["max_students"]) if request.get("max_students") else None,
+            batch_size=int(request["batch_size"]) if request.get("batch_size") else None
+        )
+        if not request.get("wait", True):
+            asyncio.ensure_future(run)
+            return {"success": True, "started": True}
+        summary = await run
+        return {"success": True, "started": summary is not None, "summary": summary}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to run batch enrichment: {str(e)}")
+
+@app.get("/batch-enrichment-status", response_model=Dict[str, Any])
+def get_batch_enrichment_status():
+    """Batch enrichment throughput, token use per student and the last run"""
+    try:
+        return {"success": True, **batch_enrichment.get_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get batch enrichment status: {str(e)}")
+
+@app.get("/routing-decisions", response_model=Dict[str, Any])
+def get_routing_decisions(limit: int = 50, task: Optional[str] = None):
+    """Most recent provider routing decisions with every candidate's latency, error rate, cost and score"""
+    try:
+        return {
+            "success": True,
+            **provider_router.get_stats(),
+            "recent": provider_router.recent(max(1, min(limit, 500)), task)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get routing decisions: {str(e)}")
+
 @app.get("/get-user-recommendation-history/{user_id}", response_model=Dict[str, Any])
 def get_user_recommendation_history(user_id: str):
     """Get user's recommendation history"""
@@ -672,8 +1164,28 @@ def get_user_recommendation_history(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve recommendation history: {str(e)}")
 
+def _store_recommendations(recommendations_data: Dict[str, Any]):
+    """Insert a new latest recommendations record and refresh the student's stream fit rows"""
+    user_id = recommendations_data["user_id"]
+    
+    # Mark previous recommendations as not latest
+    db["stream_recommendations"].update_many(
+        {"user_id": user_id, "is_latest": True},
+        {"$set": {"is_latest": False}}
+    )
+    
+    # Insert new recommendations
+    db["stream_recommendations"].insert_one(recommendations_data)
+    
+    try:
+        index_student(user_id, recommendations_data["trait_scores_snapshot"],
+                      recommendations_data["academic_performance_snapshot"])
+    except Exception as e:
+        print(f"Failed to update stream fit index: {e}")
+
 @app.post("/update-user-recommendations", response_model=Dict[str, Any])
-def update_user_recommendations(request: Dict[str, Any]):
+async def update_user_recommendations(request: Dict[str, Any], response: Response,
+                                      deadline: Optional[RequestDeadline] = Depends(open_request_deadline)):
     """Update user's stream recommendations (for retaking assessments)"""
     try:
         user_id = request.get("user_id")
@@ -682,9 +1194,10 @@ def update_user_recommendations(request: Dict[str, Any]):
         
         if not all([user_id, trait_scores, academic_performance]):
             raise HTTPException(status_code=400, detail="User ID, trait scores, and academic performance required")
+        set_ledger_user(user_id)
         
         # Generate new recommendations
-        new_recommendations = psychometric_ai._recommend_streams(trait_scores, academic_performance)
+        new_recommendations = await psychometric_ai._recommend_streams(trait_scores, academic_performance)
         
         # Determine recommendation method
         has_ai_insights = any(stream.get("ai_insights") for stream in new_recommendations)
@@ -704,14 +1217,7 @@ def update_user_recommendations(request: Dict[str, Any]):
             "version": 1
         }
         
-        # Mark previous recommendations as not latest
-        db["stream_recommendations"].update_many(
-            {"user_id": user_id, "is_latest": True},
-            {"$set": {"is_latest": False}}
-        )
-        
-        # Insert new recommendations
-        result = db["stream_recommendations"].insert_one(recommendations_data)
+        await run_in_threadpool(_store_recommendations, recommendations_data)
         
         return {
             "success": True,
@@ -720,7 +1226,8 @@ def update_user_recommendations(request: Dict[str, Any]):
             "recommendation_method": recommendation_method,
             "total_streams": len(new_recommendations),
             "has_ai_insights": has_ai_insights,
-            "updated_at": recommendations_data["generated_at"]
+            "updated_at": recommendations_data["generated_at"],
+            "deadline": close_request_deadline(deadline, response)
         }
         
     except HTTPException:
@@ -728,54 +1235,6 @@ def update_user_recommendations(request: Dict[str, Any]):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update recommendations: {str(e)}")
 
-@app.post("/test-gemini")
-def test_gemini_generation():
-    """Test Gemini AI question generation (backup)"""
-    try:
-        # Test with sample data
-        sample_academic = {
-            "Mathematics": 85,
-            "Physics": 78,
-            "Computer Science": 90,
-            "English": 75,
-            "Chemistry": 70
-        }
-        
-        # Generate a test question
-        question = psychometric_ai._try_gemini_generation(
-            "analytical_thinking", 
-            sample_academic, 
-            1
-        )
-        
-        if question:
-            return {
-                "success": True,
-                "message": "Gemini AI is working correctly!",
-                "sample_question": {
-                    "id": question.id,
-                    "question": question.question,
-                    "options": question.options,
-                    "scenario": question.scenario,
-                    "traits_measured": question.traits_measured
-                },
-                "generation_time": "< 3 seconds (Gemini Flash)",
-                "model_used": os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
-                "framework": "Direct Gemini API"
-            }
-        else:
-            return {
-                "success": False,
-                "message": "Gemini generation failed, check API key and configuration"
-            }
-            
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "message": "Gemini test failed"
-        }
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
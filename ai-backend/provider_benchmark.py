@@ -0,0 +1,302 @@
+"""
+Provider Latency Benchmark
+Sends N concurrent production-prompt requests per provider, model and task, reports the
+latency distribution, parse success rate and tokens per second, and compares each result
+with the previous stored run for the same provider, model, task, endpoint and concurrency
+"""
+
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from ai_config import AIProvider, ai_config
+from db import benchmark_collection
+from llm_output import LLMOutputError, QuestionOutput, extract_json, validate_analysis
+from provider_clients import CLIENT_CLASSES, provider_registry
+
+BENCHMARK_TASKS = ("question", "insights")
+MAX_BENCHMARK_REQUESTS = 200
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BOUNDS_MS = [250, 500, 1000, 2000, 4000, 8000, 16000]
+# Previous runs searched for a comparison baseline
+COMPARE_RUNS = 50
+# A p95 this much slower, or a parse rate this much lower, than the baseline is a regression
+REGRESSION_LATENCY_PCT = 20.0
+REGRESSION_PARSE_RATE_DROP = 0.05
+
+# The sample student the old /test-grok and /test-gemini endpoints used
+SAMPLE_TRAIT_SCORES = {
+    "analytical_thinking": 0.75,
+    "creativity": 0.80,
+    "leadership": 0.70,
+    "social_skills": 0.65,
+    "technical_aptitude": 0.85,
+    "entrepreneurial_spirit": 0.60,
+    "research_orientation": 0.75,
+    "helping_others": 0.70
+}
+SAMPLE_ACADEMIC = {
+    "Mathematics": 85,
+    "Physics": 78,
+    "Computer Science": 90,
+    "English": 75,
+    "Chemistry": 70
+}
+
+
+def _parses(task: str, text: str) -> bool:
+    """Whether production parsing would accept the reply (without touching the live parse stats)"""
+    try:
+        value, _ = extract_json(text, dict)
+        if task == "question":
+            QuestionOutput.model_validate(value)
+        else:
+            validate_analysis(value)
+        return True
+    except (LLMOutputError, ValueError):
+        return False
+
+
+def _percentile(ordered: List[float], pct: float) -> Optional[float]:
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return round(ordered[index], 1)
+
+
+def _histogram(latencies: List[float]) -> List[Dict[str, Any]]:
+    buckets = [{"le_ms": bound, "count": 0} for bound in HISTOGRAM_BOUNDS_MS] + [{"le_ms": None, "count": 0}]
+    for latency in latencies:
+        for bucket in buckets:
+            if bucket["le_ms"] is None or latency <= bucket["le_ms"]:
+                bucket["count"] += 1
+                break
+    return buckets
+
+
+def production_requests(ai: Any) -> Dict[str, Tuple[str, Dict[AIProvider, Dict[str, Any]], Dict[str, Any]]]:
+    """task -> (prompt, per-provider request options, default options) exactly as production builds them"""
+    from psychometric_ai import RECOMMENDATION_REQUEST_OPTIONS
+
+    basic_recommendations = ai._get_basic_recommendations(SAMPLE_TRAIT_SCORES, SAMPLE_ACADEMIC)
+    return {
+        "question": (
+            ai._build_question_prompt("analytical_thinking", SAMPLE_ACADEMIC),
+            {},
+            {"temperature": 0.7, "max_tokens": 300}
+        ),
+        "insights": (
+            ai._build_recommendation_prompt(SAMPLE_TRAIT_SCORES, SAMPLE_ACADEMIC, basic_recommendations),
+            RECOMMENDATION_REQUEST_OPTIONS,
+            {}
+        )
+    }
+
+
+async def _benchmark_one(provider: AIProvider, model: str, task: str, prompt: str,
+                         options: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Any]:
+    client = provider_registry.get_client(provider)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    completion_tokens: List[Tuple[int, float]] = []
+    errors: Dict[str, int] = {}
+    parsed = 0
+
+    async def one():
+        nonlocal parsed
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.agenerate(prompt, model=model, **options)
+            except Exception as e:
+                kind = f"http_{e.status_code}" if getattr(e, "status_code", None) else type(e).__name__
+                errors[kind] = errors.get(kind, 0) + 1
+                return
+            latency_ms = (time.perf_counter() - started) * 1000
+            latencies.append(latency_ms)
+            tokens = response.completion_tokens or len(response.text) // 4
+            completion_tokens.append((tokens, latency_ms))
+            if _parses(task, response.text):
+                parsed += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall_seconds = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    successes = len(ordered)
+    total_tokens = sum(tokens for tokens, _ in completion_tokens)
+    total_seconds = sum(latency for _, latency in completion_tokens) / 1000
+    return {
+        "provider": provider.value,
+        "model": model,
+        "task": task,
+        "base_url": ai_config.get_provider_config(provider).get("base_url"),
+        "requests": requests,
+        "concurrency": concurrency,
+        "successes": successes,
+        "errors": errors,
+        "success_rate": round(successes / requests, 3),
+        "parse_rate": round(parsed / successes, 3) if successes else None,
+        "latency_ms": {
+            "p50": _percentile(ordered, 50),
+            "p95": _percentile(ordered, 95),
+            "p99": _percentile(ordered, 99),
+            "mean": round(sum(ordered) / successes, 1) if successes else None,
+            "min": round(ordered[0], 1) if ordered else None,
+            "max": round(ordered[-1], 1) if ordered else None
+        },
+        "histogram": _histogram(ordered),
+        # Completion tokens per second of request time, i.e. what one caller sees
+        "tokens_per_second": round(total_tokens / total_seconds, 1) if total_seconds else None,
+        "requests_per_second": round(successes / wall_seconds, 2) if wall_seconds else None
+    }
+
+
+def _baseline_key(result: Dict[str, Any]) -> Tuple[Any, ...]:
+    # Concurrency changes queueing latency, so only like-for-like runs are compared
+    return result["provider"], result["model"], result["task"], result.get("base_url"), result.get("concurrency")
+
+
+def _compare(result: Dict[str, Any], baseline: Dict[str, Any], run: Dict[str, Any]) -> Dict[str, Any]:
+    def pct_change(now: Optional[float], before: Optional[float]) -> Optional[float]:
+        if now is None or not before:
+            return None
+        return round((now - before) / before * 100, 1)
+
+    latency_change = {pct: pct_change(result["latency_ms"][pct], baseline["latency_ms"][pct])
+                      for pct in ("p50", "p95", "p99")}
+    parse_delta = (round(result["parse_rate"] - baseline["parse_rate"], 3)
+                   if result["parse_rate"] is not None and baseline.get("parse_rate") is not None else None)
+    return {
+        "run_id": run["run_id"],
+        "started_at": run["started_at"],
+        "latency_ms": baseline["latency_ms"],
+        "parse_rate": baseline.get("parse_rate"),
+        "tokens_per_second": baseline.get("tokens_per_second"),
+        "latency_change_pct": latency_change,
+        "parse_rate_change": parse_delta,
+        "tokens_per_second_change_pct": pct_change(result["tokens_per_second"], baseline.get("tokens_per_second")),
+        "regression": bool(
+            (latency_change["p95"] is not None and latency_change["p95"] > REGRESSION_LATENCY_PCT)
+            or (parse_delta is not None and parse_delta < -REGRESSION_PARSE_RATE_DROP)
+        )
+    }
+
+
+def load_runs(limit: int = COMPARE_RUNS) -> List[Dict[str, Any]]:
+    """Stored runs, newest first"""
+    return list(benchmark_collection.find({}, {"_id": 0}).sort("started_at", -1).limit(limit))
+
+
+def attach_baselines(results: List[Dict[str, Any]], previous_runs: List[Dict[str, Any]]):
+    """Add to each result the newest earlier run of the same provider, model, task, endpoint and concurrency"""
+    for result in results:
+        key = _baseline_key(result)
+        result["previous"] = None
+        for run in previous_runs:
+            baseline = next((r for r in run.get("results", []) if _baseline_key(r) == key), None)
+            if baseline is not None:
+                result["previous"] = _compare(result, baseline, run)
+                break
+
+
+async def run_benchmark(ai: Any, providers: Optional[List[str]] = None, tasks: Optional[List[str]] = None,
+                        tiers: Optional[List[str]] = None, requests: int = 10, concurrency: int = 5,
+                        store: bool = True, label: Optional[str] = None) -> Dict[str, Any]:
+    """Benchmark every enabled provider x model tier x task and compare with stored runs
+
+    Calls go through the production clients (quota, circuit breaker, key pool), so they
+    spend real quota and show up in the provider stats.
+    """
+    requests = max(1, min(requests, MAX_BENCHMARK_REQUESTS))
+    concurrency = max(1, min(concurrency, requests))
+    tasks = [task for task in (tasks or BENCHMARK_TASKS) if task in BENCHMARK_TASKS]
+    selected = [provider for provider in CLIENT_CLASSES
+                if providers is None or provider.value in providers]
+    prompts = production_requests(ai)
+
+    run = {
+        "run_id": uuid.uuid4().hex[:12],
+        "label": label,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "settings": {"requests": requests, "concurrency": concurrency, "tasks": tasks, "tiers": tiers},
+        "results": [],
+        "skipped": []
+    }
+    for provider in selected:
+        if not ai_config.is_provider_enabled(provider):
+            run["skipped"].append({"provider": provider.value, "reason": "not configured"})
+            continue
+        if not provider_registry.is_callable(provider):
+            run["skipped"].append({"provider": provider.value, "reason": "circuit open or out of quota"})
+            continue
+        config = ai_config.get_provider_config(provider)
+        models = config.get("models") or {"fast": config["model"]}
+        # Tiers that resolve to the same model are benchmarked once
+        chosen_models = list(dict.fromkeys(
+            model for tier, model in models.items() if tiers is None or tier in tiers
+        ))
+        for model in chosen_models:
+            for task in tasks:
+                prompt, per_provider, defaults = prompts[task]
+                options = {**defaults, **per_provider.get(provider, {})}
+                run["results"].append(await _benchmark_one(
+                    provider, model, task, prompt, options, requests, concurrency
+                ))
+    run["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    previous_runs = await run_in_threadpool(load_runs)
+    attach_baselines(run["results"], previous_runs)
+    run["regressions"] = [f"{r['provider']}/{r['model']}/{r['task']}"
+                          for r in run["results"] if r["previous"] and r["previous"]["regression"]]
+    if store and run["results"]:
+        # Baselines are not stored with the run; they are recomputed against whatever came before
+        stored = {**run, "results": [{k: v for k, v in r.items() if k != "previous"} for r in run["results"]]}
+        await run_in_threadpool(benchmark_collection.insert_one, stored)
+    return run
+
+
+def print_report(run: Dict[str, Any]):
+    print(f"Benchmark run {run['run_id']} ({run['settings']['requests']} requests, "
+          f"concurrency {run['settings']['concurrency']})")
+    for r in run["results"]:
+        latency = r["latency_ms"]
+        line = (f"  {r['provider']:<7} {r['model']:<20} {r['task']:<9} "
+                f"p50 {latency['p50']} p95 {latency['p95']} p99 {latency['p99']} ms | "
+                f"ok {r['success_rate']:.0%} parsed {r['parse_rate']} | {r['tokens_per_second']} tok/s")
+        previous = r["previous"]
+        if previous:
+            line += (f" | vs {previous['run_id']}: p95 {previous['latency_change_pct']['p95']:+}%"
+                     if previous["latency_change_pct"]["p95"] is not None else f" | vs {previous['run_id']}")
+            if previous["regression"]:
+                line += " REGRESSION"
+        print(line)
+    for skipped in run["skipped"]:
+        print(f"  {skipped['provider']}: skipped ({skipped['reason']})")
+
+
+if __name__ == "__main__":
+    # python provider_benchmark.py [--requests N] [--concurrency C] [--providers grok gemini]
+    #                              [--tasks question insights] [--tiers fast large] [--label L] [--no-store]
+    import argparse
+    from psychometric_ai import psychometric_ai
+
+    parser = argparse.ArgumentParser(description="Benchmark LLM providers with production prompts")
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--providers", nargs="*")
+    parser.add_argument("--tasks", nargs="*", choices=BENCHMARK_TASKS)
+    parser.add_argument("--tiers", nargs="*")
+    parser.add_argument("--label")
+    parser.add_argument("--no-store", action="store_true")
+    args = parser.parse_args()
+
+    print_report(asyncio.run(run_benchmark(
+        psychometric_ai, providers=args.providers, tasks=args.tasks, tiers=args.tiers,
+        requests=args.requests, concurrency=args.concurrency, store=not args.no_store, label=args.label
+    )))
@@ -0,0 +1,717 @@
+"""
+LLM Provider Client Registry
+Creates one client per provider API key once per worker from AIConfig, shares one keep-alive
+HTTP connection pool between them and keeps per-provider latency statistics and per-key quotas
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+
+import httpx
+import requests
+from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
+
+from ai_config import AIConfig, AIProvider, get_ai_config
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from llm_ledger import llm_ledger
+from rate_limiter import ProviderRateLimiter, QuotaExhaustedError
+from request_deadline import RequestDeadline, current_deadline, deadline_stage
+
+# Latency samples kept per provider for percentiles
+LATENCY_WINDOW = 200
+# Hosts the sync session caches a connection pool for: Grok, Gemini, the local server, the fake service
+HTTP_POOL_HOSTS = 4
+
+
+class ProviderError(Exception):
+    """A provider call failed; status_code is set for HTTP errors"""
+
+    def __init__(self, provider: str, message: str, status_code: Optional[int] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status_code = status_code
+
+
+class ProviderQuotaError(ProviderError):
+    """The call was refused locally because the provider is out of rate or daily budget"""
+
+    def __init__(self, provider: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(provider, message, 429)
+        self.retry_after = retry_after
+
+
+class ProviderDeadlineError(ProviderError):
+    """The request's deadline ran out before or during the call"""
+
+    def __init__(self, provider: str):
+        super().__init__(provider, "request deadline exhausted")
+
+
+class LLMResponse(BaseModel):
+    text: str
+    provider: str
+    model: str
+    latency_ms: float
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+class ProviderStats:
+    """Rolling call statistics for one provider"""
+
+    def __init__(self):
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.status_codes: Dict[str, int] = {}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.outcomes = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float, success: bool, status_code: Optional[int] = None):
+        with self._lock:
+            self.requests += 1
+            if success:
+                self.successes += 1
+                self.latencies.append(latency_ms)
+            else:
+                self.failures += 1
+            self.outcomes.append(success)
+            if status_code is not None:
+                key = str(status_code)
+                self.status_codes[key] = self.status_codes.get(key, 0) + 1
+
+    def percentile(self, pct: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self.latencies)
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            outcomes = list(self.outcomes)
+        return (outcomes.count(False) / len(outcomes)) if outcomes else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            "requests": self.requests,
+            "successes": self.successes,
+            "failures": self.failures,
+            "error_rate": round(self.error_rate(), 3),
+            "latency_p50_ms": round(p50, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95, 1) if p95 is not None else None,
+            "status_codes": dict(self.status_codes)
+        }
+
+
+class HTTPProviderClient:
+    """Shared request/response handling; subclasses describe the provider's wire format"""
+
+    provider_name = ""
+
+    def __init__(self, config: Dict[str, Any], registry: "ProviderClientRegistry",
+                 stats: ProviderStats, breaker: CircuitBreaker, limiter: ProviderRateLimiter):
+        self.api_key = config["api_key"]
+        self.base_url = config["base_url"].rstrip("/")
+        self.model = config["model"]
+        self.temperature = config.get("temperature", 0.7)
+        self.max_tokens = config.get("max_tokens", 0)
+        self.timeout = config.get("timeout", 30)
+        self.registry = registry
+        self.stats = stats
+        self.breaker = breaker
+        self.limiter = limiter
+
+    def current_timeout(self) -> float:
+        """Configured timeout, tightened to a multiple of observed tail latency once known"""
+        settings = self.registry.config.adaptive_timeout
+        if not settings["enabled"]:
+            return self.timeout
+        tail_ms = self.stats.percentile(settings["percentile"], settings["min_samples"])
+        if tail_ms is None:
+            return self.timeout
+        return min(self.timeout, max(settings["min_seconds"], tail_ms / 1000.0 * settings["multiplier"]))
+
+    def _check_deadline(self) -> Optional[RequestDeadline]:
+        """The current request's deadline; raises if nothing is left of it"""
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired():
+            raise ProviderDeadlineError(self.provider_name)
+        return deadline
+
+    def _call_timeout(self, timeout: Optional[float], deadline: Optional[RequestDeadline]) -> Tuple[float, bool]:
+        """(timeout for this attempt, whether the request deadline is what limits it)"""
+        timeout = timeout or self.current_timeout()
+        if deadline is None or deadline.remaining() >= timeout:
+            return timeout, False
+        # Keep a small floor: a zero timeout would fail before the request is even sent
+        return max(0.01, deadline.remaining()), True
+
+    def _deadline_cut(self, estimated_tokens: int, model_name: str, latency_ms: float, prompt_tokens: int):
+        """The attempt ran out of request budget: neither the provider's latency nor a failure"""
+        self.breaker.release()
+        self.limiter.settle(estimated_tokens, None)
+        # The provider may still bill the prompt it received
+        llm_ledger.record(self.provider_name, model_name, "deadline", latency_ms, prompt_tokens, tokens_estimated=True)
+        return ProviderDeadlineError(self.provider_name)
+
+    def build_request(self, prompt: str, system_prompt: Optional[str], model: str,
+                      temperature: float, max_tokens: Optional[int]) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """Return (url, headers, json payload)"""
+        raise NotImplementedError
+
+    def parse_response(self, result: Dict[str, Any], model: str, latency_ms: float) -> LLMResponse:
+        raise NotImplementedError
+
+    def build_stream_request(self, url: str, payload: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """Turn a generate request into the provider's server-sent-events variant"""
+        raise NotImplementedError
+
+    def parse_stream_chunk(self, chunk: Dict[str, Any]) -> str:
+        """Text carried by one streamed event"""
+        raise NotImplementedError
+
+    def _prepare(self, prompt, system_prompt, model, temperature, max_tokens):
+        model_name = model or self.model
+        url, headers, payload = self.build_request(
+            prompt, system_prompt, model_name,
+            self.temperature if temperature is None else temperature, max_tokens
+        )
+        return model_name, url, headers, payload
+
+    def estimate_prompt_tokens(self, prompt: str, system_prompt: Optional[str] = None) -> int:
+        """~4 chars per token"""
+        return (len(prompt) + len(system_prompt or "")) // 4
+
+    def estimate_tokens(self, prompt: str, system_prompt: Optional[str] = None,
+                        max_tokens: Optional[int] = None) -> int:
+        """Tokens reserved against the quota before the provider reports usage"""
+        return self.estimate_prompt_tokens(prompt, system_prompt) + (max_tokens or self.max_tokens)
+
+    def _record(self, model_name: str, latency_ms: float, success: bool, status_code: Optional[int] = None,
+                prompt_tokens: int = 0, completion_tokens: int = 0, tokens_estimated: bool = False):
+        self.stats.record(latency_ms, success, status_code)
+        self.registry.model_stats(self.provider_name, model_name).record(latency_ms, success, status_code)
+        outcome = "ok" if success else "rate_limited" if status_code == 429 else "error"
+        llm_ledger.record(self.provider_name, model_name, outcome, latency_ms, prompt_tokens, completion_tokens,
+                          tokens_estimated, status_code)
+        if status_code == 429:
+            # Quota belongs to the key: cool the key down, leave the provider's breaker alone
+            self.limiter.throttled()
+            self.breaker.release()
+            return
+        self.breaker.record(success, latency_ms)
+
+    def _admit(self):
+        try:
+            self.breaker.acquire()
+        except CircuitOpenError as e:
+            raise ProviderError(self.provider_name, str(e))
+
+    def _acquire(self, estimated_tokens: int, deadline: Optional[RequestDeadline] = None):
+        """Wait for a rate slot (briefly, and never past the deadline) and the circuit breaker, or raise at once"""
+        try:
+            self.limiter.acquire(estimated_tokens, deadline.remaining() if deadline is not None else None)
+        except QuotaExhaustedError as e:
+            raise ProviderQuotaError(self.provider_name, str(e), e.retry_after)
+        try:
+            self._admit()
+        except ProviderError:
+            self.limiter.settle(estimated_tokens, 0, sent=False)
+            raise
+
+    async def _aacquire(self, estimated_tokens: int, deadline: Optional[RequestDeadline] = None):
+        try:
+            await self.limiter.aacquire(estimated_tokens, deadline.remaining() if deadline is not None else None)
+        except QuotaExhaustedError as e:
+            raise ProviderQuotaError(self.provider_name, str(e), e.retry_after)
+        try:
+            self._admit()
+        except ProviderError:
+            self.limiter.settle(estimated_tokens, 0, sent=False)
+            raise
+
+    def _finish(self, status_code: int, body: Any, model_name: str, latency_ms: float,
+                estimated_tokens: int, prompt_estimate: int) -> LLMResponse:
+        if status_code != 200:
+            self._record(model_name, latency_ms, False, status_code)
+            self.limiter.settle(estimated_tokens, 0)
+            raise ProviderError(self.provider_name, f"API error: {status_code}", status_code)
+        try:
+            response = self.parse_response(body(), model_name, latency_ms)
+        except ProviderError:
+            self._record(model_name, latency_ms, False, status_code)
+            self.limiter.settle(estimated_tokens, None)
+            raise
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            self._record(model_name, latency_ms, False, status_code)
+            self.limiter.settle(estimated_tokens, None)
+            raise ProviderError(self.provider_name, f"malformed response: {e}")
+        usage = None
+        if response.prompt_tokens is not None and response.completion_tokens is not None:
+            usage = response.prompt_tokens + response.completion_tokens
+            self._record(model_name, latency_ms, True, status_code, response.prompt_tokens, response.completion_tokens)
+        else:
+            # No usage reported: count the estimated prompt and the text actually returned
+            self._record(model_name, latency_ms, True, status_code, prompt_estimate,
+                         len(response.text) // 4, tokens_estimated=True)
+        self.limiter.settle(estimated_tokens, usage)
+        return response
+
+    def generate(self, prompt: str, system_prompt: Optional[str] = None, model: Optional[str] = None,
+                 temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                 timeout: Optional[float] = None) -> LLMResponse:
+        """Blocking call over the shared requests session"""
+        model_name, url, headers, payload = self._prepare(prompt, system_prompt, model, temperature, max_tokens)
+        estimated_tokens = self.estimate_tokens(prompt, system_prompt, max_tokens)
+        deadline = self._check_deadline()
+        with deadline_stage(f"{self.provider_name}:{model_name}") as stage:
+            self._acquire(estimated_tokens, deadline)
+            timeout, deadline_bound = self._call_timeout(timeout, deadline)
+            start = time.perf_counter()
+            try:
+                response = self.registry.session.post(url, headers=headers, json=payload, timeout=timeout)
+            except requests.Timeout as e:
+                if deadline_bound:
+                    stage["outcome"] = "deadline"
+                    raise self._deadline_cut(estimated_tokens, model_name, (time.perf_counter() - start) * 1000,
+                                             self.estimate_prompt_tokens(prompt, system_prompt))
+                self._record(model_name, (time.perf_counter() - start) * 1000, False)
+                self.limiter.settle(estimated_tokens, 0)
+                raise ProviderError(self.provider_name, f"request failed: {e}")
+            except requests.RequestException as e:
+                self._record(model_name, (time.perf_counter() - start) * 1000, False)
+                self.limiter.settle(estimated_tokens, 0)
+                raise ProviderError(self.provider_name, f"request failed: {e}")
+            return self._finish(response.status_code, response.json, model_name,
+                                (time.perf_counter() - start) * 1000, estimated_tokens,
+                                self.estimate_prompt_tokens(prompt, system_prompt))
+
+    async def agenerate(self, prompt: str, system_prompt: Optional[str] = None, model: Optional[str] = None,
+                        temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                        timeout: Optional[float] = None) -> LLMResponse:
+        """Non-blocking call over the shared httpx.AsyncClient"""
+        model_name, url, headers, payload = self._prepare(prompt, system_prompt, model, temperature, max_tokens)
+        estimated_tokens = self.estimate_tokens(prompt, system_prompt, max_tokens)
+        deadline = self._check_deadline()
+        with deadline_stage(f"{self.provider_name}:{model_name}") as stage:
+            await self._aacquire(estimated_tokens, deadline)
+            timeout, deadline_bound = self._call_timeout(timeout, deadline)
+            start = time.perf_counter()
+            try:
+                response = await self.registry.async_client.post(url, headers=headers, json=payload, timeout=timeout)
+            except asyncio.CancelledError:
+                # Cancelled by the caller (e.g. a hedge was won elsewhere): not the provider's fault
+                self.breaker.release()
+                llm_ledger.record(self.provider_name, model_name, "cancelled", (time.perf_counter() - start) * 1000,
+                                  self.estimate_prompt_tokens(prompt, system_prompt), tokens_estimated=True)
+                raise
+            except httpx.TimeoutException as e:
+                if deadline_bound:
+                    stage["outcome"] = "deadline"
+                    raise self._deadline_cut(estimated_tokens, model_name, (time.perf_counter() - start) * 1000,
+                                             self.estimate_prompt_tokens(prompt, system_prompt))
+                self._record(model_name, (time.perf_counter() - start) * 1000, False)
+                self.limiter.settle(estimated_tokens, 0)
+                raise ProviderError(self.provider_name, f"request failed: {e!r}")
+            except httpx.HTTPError as e:
+                self._record(model_name, (time.perf_counter() - start) * 1000, False)
+                self.limiter.settle(estimated_tokens, 0)
+                raise ProviderError(self.provider_name, f"request failed: {e!r}")
+            return self._finish(response.status_code, response.json, model_name,
+                                (time.perf_counter() - start) * 1000, estimated_tokens,
+                                self.estimate_prompt_tokens(prompt, system_prompt))
+
+    async def astream(self, prompt: str, system_prompt: Optional[str] = None, model: Optional[str] = None,
+                      temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                      timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Yield completion text as the provider streams it"""
+        model_name, url, headers, payload = self._prepare(prompt, system_prompt, model, temperature, max_tokens)
+        url, payload = self.build_stream_request(url, payload)
+        estimated_tokens = self.estimate_tokens(prompt, system_prompt, max_tokens)
+        deadline = self._check_deadline()
+        with deadline_stage(f"{self.provider_name}:{model_name}:stream") as stage:
+            await self._aacquire(estimated_tokens, deadline)
+            timeout, deadline_bound = self._call_timeout(timeout, deadline)
+            streamed_chars = 0
+            start = time.perf_counter()
+            try:
+                async with self.registry.async_client.stream(
+                    "POST", url, headers=headers, json=payload, timeout=timeout
+                ) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        self._record(model_name, (time.perf_counter() - start) * 1000, False, response.status_code)
+                        self.limiter.settle(estimated_tokens, 0)
+                        raise ProviderError(self.provider_name, f"API error: {response.status_code}", response.status_code)
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        text = self.parse_stream_chunk(json.loads(data))
+                        if text:
+                            streamed_chars += len(text)
+                            yield text
+            except (asyncio.CancelledError, GeneratorExit):
+                # The consumer went away (client disconnected); not the provider's fault
+                self.breaker.release()
+                self.limiter.settle(estimated_tokens, None)
+                llm_ledger.record(self.provider_name, model_name, "cancelled", (time.perf_counter() - start) * 1000,
+                                  self.estimate_prompt_tokens(prompt, system_prompt), streamed_chars // 4,
+                                  tokens_estimated=True)
+                raise
+            except httpx.TimeoutException as e:
+                if deadline_bound:
+                    stage["outcome"] = "deadline"
+                    raise self._deadline_cut(estimated_tokens, model_name, (time.perf_counter() - start) * 1000,
+                                             self.estimate_prompt_tokens(prompt, system_prompt))
+                self._record(model_name, (time.perf_counter() - start) * 1000, False)
+                self.limiter.settle(estimated_tokens, None)
+                raise ProviderError(self.provider_name, f"stream failed: {e!r}")
+            except httpx.HTTPError as e:
+                self._record(model_name, (time.perf_counter() - start) * 1000, False)
+                self.limiter.settle(estimated_tokens, None)
+                raise ProviderError(self.provider_name, f"stream failed: {e!r}")
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                self._record(model_name, (time.perf_counter() - start) * 1000, False)
+                self.limiter.settle(estimated_tokens, None)
+                raise ProviderError(self.provider_name, f"malformed stream event: {e}")
+            # Streams carry no usage; count the prompt estimate plus the text actually received
+            prompt_estimate = self.estimate_prompt_tokens(prompt, system_prompt)
+            self._record(model_name, (time.perf_counter() - start) * 1000, True, 200,
+                         prompt_estimate, streamed_chars // 4, tokens_estimated=True)
+            self.limiter.settle(estimated_tokens, prompt_estimate + streamed_chars // 4)
+
+
+class GrokClient(HTTPProviderClient):
+    """x.ai chat-completions client"""
+
+    provider_name = "grok"
+
+    def build_request(self, prompt, system_prompt, model, temperature, max_tokens):
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        payload = {
+            "messages": messages,
+            "model": model,
+            "stream": False,
+            "temperature": temperature
+        }
+        if max_tokens:
+            payload["max_tokens"] = max_tokens
+        return f"{self.base_url}/chat/completions", {"Authorization": f"Bearer {self.api_key}"}, payload
+
+    def build_stream_request(self, url, payload):
+        return url, {**payload, "stream": True}
+
+    def parse_stream_chunk(self, chunk):
+        choices = chunk.get("choices") or []
+        if not choices:
+            return ""
+        return (choices[0].get("delta") or {}).get("content") or ""
+
+    def parse_response(self, result, model, latency_ms):
+        usage = result.get("usage") or {}
+        return LLMResponse(
+            text=result["choices"][0]["message"]["content"].strip(),
+            provider=self.provider_name,
+            model=model,
+            latency_ms=latency_ms,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens")
+        )
+
+
+class GeminiClient(HTTPProviderClient):
+    """Gemini generateContent client over REST"""
+
+    provider_name = "gemini"
+
+    def build_request(self, prompt, system_prompt, model, temperature, max_tokens):
+        payload: Dict[str, Any] = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": temperature}
+        }
+        if max_tokens:
+            payload["generationConfig"]["maxOutputTokens"] = max_tokens
+        if system_prompt:
+            payload["systemInstruction"] = {"parts": [{"text": system_prompt}]}
+        return f"{self.base_url}/models/{model}:generateContent", {"x-goog-api-key": self.api_key}, payload
+
+    def build_stream_request(self, url, payload):
+        return url.replace(":generateContent", ":streamGenerateContent") + "?alt=sse", payload
+
+    def parse_stream_chunk(self, chunk):
+        candidates = chunk.get("candidates") or []
+        parts = candidates[0].get("content", {}).get("parts", []) if candidates else []
+        return "".join(part.get("text", "") for part in parts)
+
+    def parse_response(self, result, model, latency_ms):
+        candidates = result.get("candidates") or []
+        parts = candidates[0].get("content", {}).get("parts", []) if candidates else []
+        text = "".join(part.get("text", "") for part in parts).strip()
+        if not text:
+            raise ProviderError(self.provider_name, "empty response")
+        usage = result.get("usageMetadata") or {}
+        return LLMResponse(
+            text=text,
+            provider=self.provider_name,
+            model=model,
+            latency_ms=latency_ms,
+            prompt_tokens=usage.get("promptTokenCount"),
+            completion_tokens=usage.get("candidatesTokenCount")
+        )
+
+
+class LocalClient(GrokClient):
+    """OpenAI-compatible chat-completions server on the box (llama.cpp server, Ollama, vLLM)"""
+
+    provider_name = "local"
+
+    def __init__(self, config: Dict[str, Any], registry: "ProviderClientRegistry",
+                 stats: ProviderStats, breaker: CircuitBreaker, limiter: ProviderRateLimiter):
+        super().__init__(config, registry, stats, breaker, limiter)
+        self.json_mode = config.get("json_mode", False)
+
+    def build_request(self, prompt, system_prompt, model, temperature, max_tokens):
+        url, headers, payload = super().build_request(prompt, system_prompt, model, temperature, max_tokens)
+        if not self.api_key:
+            headers = {}
+        if self.json_mode:
+            # Grammar-constrained decoding keeps small models from wandering out of JSON
+            payload["response_format"] = {"type": "json_object"}
+        return url, headers, payload
+
+
+CLIENT_CLASSES = {
+    AIProvider.GROK: GrokClient,
+    AIProvider.GEMINI: GeminiClient,
+    AIProvider.LOCAL: LocalClient
+}
+
+# Penalty per recent 429 when ranking keys by remaining quota
+THROTTLE_PENALTY = 0.25
+
+
+def mask_key(index: int, api_key: str) -> str:
+    """Label for a key in logs and stats that does not reveal it"""
+    return f"key{index + 1}...{api_key[-4:]}" if len(api_key) > 8 else f"key{index + 1}"
+
+
+class ProviderKeyPool:
+    """A provider's API keys, each with its own client and quota
+
+    Latency statistics and the circuit breaker stay per provider: they describe the
+    service, while quota and 429s belong to the key.
+    """
+
+    def __init__(self, provider: AIProvider, config: Dict[str, Any], rate_limits: Dict[str, Any]):
+        self.provider = provider
+        self.config = config
+        self.keys: List[str] = list(config.get("api_keys") or [])
+        self.limiters = [
+            ProviderRateLimiter(f"{provider.value}[{mask_key(index, key)}]", config, rate_limits)
+            for index, key in enumerate(self.keys)
+        ]
+        self.clients: List[Optional[HTTPProviderClient]] = [None] * len(self.keys)
+        self.selected = [0] * len(self.keys)
+        self._next = 0
+
+    def can_admit(self) -> bool:
+        return any(limiter.can_admit() for limiter in self.limiters)
+
+    def _score(self, index: int) -> float:
+        limiter = self.limiters[index]
+        if not limiter.can_admit():
+            return float("-inf")
+        return limiter.headroom() - THROTTLE_PENALTY * limiter.recent_throttles()
+
+    def select(self) -> int:
+        """Key with the most quota left; ties rotate so equal keys share the load"""
+        count = len(self.keys)
+        order = [(self._next + offset) % count for offset in range(count)]
+        best = max(order, key=self._score)
+        self._next = (best + 1) % count
+        self.selected[best] += 1
+        return best
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {"key": mask_key(index, key), "selected": self.selected[index], **self.limiters[index].snapshot()}
+            for index, key in enumerate(self.keys)
+        ]
+
+
+class ProviderClientRegistry:
+    """Lazily creates one client per provider and the shared HTTP pools per worker
+
+    Sync callers use a pooled requests.Session; async callers use one httpx.AsyncClient,
+    so a worker can hold hundreds of pending provider calls without extra threads.
+    """
+
+    def __init__(self, config: AIConfig):
+        self.config = config
+        self.stats: Dict[AIProvider, ProviderStats] = {provider: ProviderStats() for provider in CLIENT_CLASSES}
+        self.breakers: Dict[AIProvider, CircuitBreaker] = {
+            provider: CircuitBreaker(provider.value, config.circuit_breaker) for provider in CLIENT_CLASSES
+        }
+        # Latency and errors per (provider, model), for routing between model tiers
+        self._model_stats: Dict[Tuple[str, str], ProviderStats] = {}
+        self.key_pools: Dict[AIProvider, ProviderKeyPool] = {
+            provider: ProviderKeyPool(provider, config.get_provider_config(provider), config.rate_limits)
+            for provider in CLIENT_CLASSES
+        }
+        self._session: Optional[requests.Session] = None
+        self._adapter: Optional[HTTPAdapter] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        # Re-entrant: get_client holds it while the session property may also take it
+        self._lock = threading.RLock()
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    pool = self.config.http_pool
+                    # pool_connections is the number of per-host pools; pool_maxsize is what each
+                    # host keeps alive, matching httpx's max_keepalive_connections
+                    self._adapter = HTTPAdapter(
+                        pool_connections=HTTP_POOL_HOSTS,
+                        pool_maxsize=pool["max_keepalive"]
+                    )
+                    session = requests.Session()
+                    session.mount("https://", self._adapter)
+                    session.mount("http://", self._adapter)
+                    session.headers.update({"Content-Type": "application/json"})
+                    self._session = session
+        return self._session
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        # Only touched from the event loop thread, so no lock is needed
+        if self._async_client is None or self._async_client.is_closed:
+            pool = self.config.http_pool
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=pool["async_max_connections"],
+                    max_keepalive_connections=pool["max_keepalive"]
+                ),
+                headers={"Content-Type": "application/json"}
+            )
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def is_available(self, provider: AIProvider) -> bool:
+        return (provider in CLIENT_CLASSES
+                and self.config.is_provider_enabled(provider)
+                and bool(self.key_pools[provider].keys))
+
+    def is_callable(self, provider: AIProvider) -> bool:
+        """Configured, not short-circuited and with a key within quota (or a short wait of it)"""
+        return (self.is_available(provider)
+                and not self.breakers[provider].is_open()
+                and self.key_pools[provider].can_admit())
+
+    def get_client(self, provider: AIProvider) -> HTTPProviderClient:
+        """Get the client for the provider key with the most quota left, creating it on first use
+
+        Fetch a client per call rather than holding on to one, so calls spread across keys.
+        """
+        if not self.is_available(provider):
+            raise ProviderError(provider.value, "provider not configured")
+        pool = self.key_pools[provider]
+        with self._lock:
+            index = pool.select()
+            client = pool.clients[index]
+            if client is None:
+                client = CLIENT_CLASSES[provider](
+                    {**pool.config, "api_key": pool.keys[index]},
+                    self, self.stats[provider], self.breakers[provider], pool.limiters[index]
+                )
+                pool.clients[index] = client
+        return client
+
+    def model_stats(self, provider_name: str, model: str) -> ProviderStats:
+        key = (provider_name, model)
+        stats = self._model_stats.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._model_stats.setdefault(key, ProviderStats())
+        return stats
+
+    def _current_timeout(self, provider: AIProvider) -> Optional[float]:
+        # Every key's client shares the provider's latency stats, so any of them will do
+        client = next((client for client in self.key_pools[provider].clients if client is not None), None)
+        return round(client.current_timeout(), 2) if client is not None else None
+
+    def _connection_stats(self) -> List[Dict[str, Any]]:
+        """Per-host connection reuse from the urllib3 pools behind the shared session"""
+        if self._adapter is None:
+            return []
+        pools = []
+        for key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                "host": pool.host,
+                "connections_opened": pool.num_connections,
+                "requests_sent": pool.num_requests,
+                "idle_connections": pool.pool.qsize() if pool.pool else 0
+            })
+        return pools
+
+    def _async_connection_stats(self) -> Dict[str, Any]:
+        if self._async_client is None or self._async_client.is_closed:
+            return {"open": False}
+        pool = getattr(self._async_client._transport, "_pool", None)
+        connections = getattr(pool, "connections", [])
+        return {
+            "open": True,
+            "connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle())
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "clients_created": {
+                provider.value: sum(1 for client in pool.clients if client is not None)
+                for provider, pool in self.key_pools.items()
+            },
+            "providers": {
+                provider.value: {
+                    **stats.snapshot(),
+                    "circuit": self.breakers[provider].snapshot(),
+                    "keys": self.key_pools[provider].snapshot(),
+                    "timeout_seconds": self._current_timeout(provider)
+                }
+                for provider, stats in self.stats.items()
+            },
+            "models": {
+                f"{provider_name}/{model}": stats.snapshot()
+                for (provider_name, model), stats in list(self._model_stats.items())
+            },
+            "http_pools": self._connection_stats(),
+            "async_http_pool": self._async_connection_stats()
+        }
+
+
+# Global registry instance
+provider_registry = ProviderClientRegistry(get_ai_config())
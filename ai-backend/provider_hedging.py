@@ -0,0 +1,185 @@
+"""
+Hedged LLM Requests across Providers
+Starts the primary provider, starts the next one if the primary has not produced a valid
+answer within the hedge delay (or fails first), keeps the first result that parses and
+cancels the rest, so worst-case latency is no longer the sum of all provider timeouts
+"""
+
+import asyncio
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+from ai_config import AIConfig, AIProvider, get_ai_config
+from provider_clients import LLMResponse, ProviderError, ProviderClientRegistry, provider_registry
+
+# Rough prompt size for cancelled attempts whose usage the provider never reported
+CHARS_PER_TOKEN = 4
+
+
+class HedgeStats:
+    """Per-provider launches, wins and the token cost hedging added"""
+
+    def __init__(self):
+        self.races = 0
+        self.hedges_fired = 0
+        self.all_failed = 0
+        self.providers: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _provider(self, name: str) -> Dict[str, Any]:
+        return self.providers.setdefault(name, {
+            "launched": 0,
+            "wins": 0,
+            "failed": 0,
+            "discarded": 0,
+            "cancelled": 0,
+            "added_tokens": 0,
+            "added_tokens_estimated": 0,
+            "added_cost_usd": 0.0
+        })
+
+    def record_race(self, launched: List[str], hedged: bool, winner: Optional[str]):
+        with self._lock:
+            self.races += 1
+            if hedged:
+                self.hedges_fired += 1
+            if winner is None:
+                self.all_failed += 1
+            for name in launched:
+                entry = self._provider(name)
+                entry["launched"] += 1
+                if name == winner:
+                    entry["wins"] += 1
+
+    def record_loser(self, name: str, outcome: str, tokens: int, estimated: bool, cost_per_1k: float):
+        """outcome is "failed", "discarded" (answered after the winner) or "cancelled" (still in flight)"""
+        with self._lock:
+            entry = self._provider(name)
+            entry[outcome] += 1
+            entry["added_tokens"] += tokens
+            if estimated:
+                entry["added_tokens_estimated"] += tokens
+            entry["added_cost_usd"] += tokens / 1000 * cost_per_1k
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            providers = {}
+            for name, entry in self.providers.items():
+                providers[name] = {
+                    **entry,
+                    "added_cost_usd": round(entry["added_cost_usd"], 6),
+                    "win_rate": round(entry["wins"] / entry["launched"], 3) if entry["launched"] else None
+                }
+            return {
+                "races": self.races,
+                "hedges_fired": self.hedges_fired,
+                "hedge_rate": round(self.hedges_fired / self.races, 3) if self.races else None,
+                "all_failed": self.all_failed,
+                "providers": providers
+            }
+
+
+class ProviderHedger:
+    """Races provider attempts in priority order with a staggered start"""
+
+    def __init__(self, config: AIConfig, registry: ProviderClientRegistry):
+        self.config = config
+        self.registry = registry
+        self.stats = HedgeStats()
+
+    def hedge_delay(self, provider: AIProvider) -> float:
+        """Seconds to wait on a provider before starting the next one"""
+        settings = self.config.hedging
+        delay_ms = settings["delay_ms"]
+        if delay_ms is None:
+            delay_ms = self.registry.stats[provider].percentile(95) or settings["default_delay_ms"]
+        return max(delay_ms, settings["min_delay_ms"]) / 1000.0
+
+    async def _attempt(self, provider: AIProvider, prompt: str, options: Dict[str, Any],
+                       parse: Callable[[LLMResponse], Any]) -> Tuple[Any, LLMResponse]:
+        client = self.registry.get_client(provider)
+        response = await client.agenerate(prompt, **options)
+        try:
+            return parse(response), response
+        except Exception as e:
+            # Keep the response so its tokens are still counted against the race
+            error = ProviderError(provider.value, f"invalid response: {e}")
+            error.response = response
+            raise error
+
+    async def generate(self, prompt: str, attempts: List[Tuple[AIProvider, Dict[str, Any]]],
+                       parse: Callable[[LLMResponse], Any]) -> Tuple[Any, LLMResponse]:
+        """Return (parsed result, winning response) from the first attempt that parses
+
+        ``attempts`` are (provider, agenerate options) in priority order; ``parse`` turns a
+        response into the caller's result and raises if it is unusable.
+        """
+        # Providers with an open circuit are skipped outright rather than raced
+        attempts = [(provider, options) for provider, options in attempts if self.registry.is_callable(provider)]
+        if not attempts:
+            raise ProviderError("hedge", "no provider configured, within quota or with a closed circuit")
+
+        tasks: Dict[asyncio.Task, AIProvider] = {}
+        queue = list(attempts)
+        hedged = False
+        last_error: Optional[Exception] = None
+        winner: Optional[Tuple[Any, LLMResponse]] = None
+
+        def launch():
+            provider, options = queue.pop(0)
+            tasks[asyncio.ensure_future(self._attempt(provider, prompt, options, parse))] = provider
+            return provider
+
+        current = launch()
+        pending = set(tasks)
+        try:
+            while pending and winner is None:
+                timeout = self.hedge_delay(current) if queue else None
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The running attempts are slower than the hedge delay: start the next provider
+                    hedged = True
+                    current = launch()
+                    pending = {task for task in tasks if not task.done()}
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        winner = task.result()
+                        break
+                    last_error = task.exception()
+                if winner is None and queue and not pending:
+                    # Everything in flight failed; fail over immediately rather than waiting
+                    current = launch()
+                    pending = {task for task in tasks if not task.done()}
+        finally:
+            self._record(prompt, tasks, hedged, winner)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        if winner is None:
+            raise last_error or ProviderError("hedge", "all providers failed")
+        return winner
+
+    def _record(self, prompt: str, tasks: Dict[asyncio.Task, AIProvider],
+                hedged: bool, winner: Optional[Tuple[Any, LLMResponse]]):
+        winning_provider = winner[1].provider if winner else None
+        self.stats.record_race([provider.value for provider in tasks.values()], hedged, winning_provider)
+        for task, provider in tasks.items():
+            if winner is not None and provider.value == winning_provider:
+                continue
+            cost_per_1k = self.config.get_provider_config(provider).get("cost_per_1k_tokens", 0.0)
+            if not task.done():
+                # About to be cancelled; the provider has the prompt even though nobody is listening
+                self.stats.record_loser(provider.value, "cancelled", len(prompt) // CHARS_PER_TOKEN, True, cost_per_1k)
+                continue
+            error = task.exception()
+            response = task.result()[1] if error is None else getattr(error, "response", None)
+            tokens = 0
+            if response is not None:
+                tokens = (response.prompt_tokens or 0) + (response.completion_tokens or 0)
+            self.stats.record_loser(provider.value, "failed" if error else "discarded", tokens, False, cost_per_1k)
+
+
+# Global hedger instance
+provider_hedger = ProviderHedger(get_ai_config(), provider_registry)
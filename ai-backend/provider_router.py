@@ -0,0 +1,136 @@
+"""
+Cost- and Latency-aware Provider Router
+Orders the providers for each task by measured latency, error rate and cost per 1k tokens,
+picks the model tier the task calls for and skips models too slow for the caller's deadline;
+every decision is logged and kept for analysis
+"""
+
+import json
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+
+from ai_config import AIConfig, AIProvider, get_ai_config
+from provider_clients import ProviderClientRegistry, provider_registry
+
+# Tokens assumed per call when comparing costs
+ROUTING_TOKENS_PER_CALL = 1000
+
+
+class ProviderRouter:
+    """Turns a task and per-provider request options into an ordered list of attempts"""
+
+    def __init__(self, config: AIConfig, registry: ProviderClientRegistry):
+        self.config = config
+        self.registry = registry
+        self.settings = config.routing
+        self.decisions = deque(maxlen=self.settings["recent_decisions"])
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _expected_latency_ms(self, provider: AIProvider, model: str, tier: str, interactive: bool) -> Tuple[float, str]:
+        """p95 for interactive tasks (the tail is what users feel), p50 for offline work"""
+        pct = 95 if interactive else 50
+        min_samples = self.settings["min_samples"]
+        latency = self.registry.model_stats(provider.value, model).percentile(pct, min_samples)
+        if latency is not None:
+            return latency, f"model_p{pct}"
+        # Providers with a known latency profile (CPU inference on the box) override the default
+        provider_default = self.config.get_provider_config(provider).get("default_latency_ms", {}).get(tier)
+        if provider_default is not None:
+            return provider_default, "provider_default"
+        return self.settings["default_latency_ms"][tier], "default"
+
+    def _candidate(self, task_settings: Dict[str, Any], provider: AIProvider,
+                   deadline_ms: Optional[float]) -> Dict[str, Any]:
+        provider_config = self.config.get_provider_config(provider)
+        tier = task_settings["tier"]
+        model = provider_config.get("models", {}).get(tier, provider_config.get("model"))
+        cost_per_1k = provider_config.get("model_costs", {}).get(tier, provider_config.get("cost_per_1k_tokens", 0.0))
+        latency_ms, latency_source = self._expected_latency_ms(provider, model, tier, task_settings["interactive"])
+        error_rate = self.registry.model_stats(provider.value, model).error_rate()
+
+        # Seconds of latency and cents per call on one scale; failures mean paying for a retry
+        cost_cents = cost_per_1k * ROUTING_TOKENS_PER_CALL / 1000 * 100
+        score = (task_settings["latency_weight"] * latency_ms / 1000
+                 + task_settings["cost_weight"] * cost_cents) / max(0.1, 1 - error_rate)
+        # Static priority only breaks ties
+        score += provider_config.get("priority", 9) * 1e-3
+
+        candidate = {
+            "provider": provider.value,
+            "model": model,
+            "tier": tier,
+            "expected_latency_ms": round(latency_ms, 1),
+            "latency_source": latency_source,
+            "error_rate": round(error_rate, 3),
+            "cost_per_1k_tokens": cost_per_1k,
+            "score": round(score, 4),
+            "skipped": None
+        }
+        if not self.registry.is_callable(provider):
+            candidate["skipped"] = "unavailable"
+        elif deadline_ms is not None and latency_ms > deadline_ms:
+            candidate["skipped"] = "slower_than_deadline"
+        return candidate
+
+    def plan(self, task: str, request_options: Dict[AIProvider, Dict[str, Any]],
+             deadline_seconds: Optional[float] = None) -> List[Tuple[AIProvider, Dict[str, Any]]]:
+        """(provider, options with the routed model) in the order they should be tried
+
+        ``request_options`` lists the providers that can serve the task; a provider whose
+        expected latency exceeds the remaining deadline is only kept if nothing else fits.
+        """
+        task_settings = self.settings["tasks"][task]
+        deadline_ms = deadline_seconds * 1000 if deadline_seconds is not None else None
+        candidates = [self._candidate(task_settings, provider, deadline_ms) for provider in request_options]
+        usable = [c for c in candidates if c["skipped"] is None]
+        if not usable:
+            # Nothing expected to finish in time: try the fastest available ones anyway
+            usable = sorted(
+                (c for c in candidates if c["skipped"] == "slower_than_deadline"),
+                key=lambda c: c["expected_latency_ms"]
+            )
+        else:
+            usable.sort(key=lambda c: c["score"])
+
+        self._log(task, deadline_ms, candidates, usable)
+        return [
+            (AIProvider(c["provider"]), {**request_options[AIProvider(c["provider"])], "model": c["model"]})
+            for c in usable
+        ]
+
+    def _log(self, task: str, deadline_ms: Optional[float], candidates: List[Dict[str, Any]],
+             chosen: List[Dict[str, Any]]):
+        decision = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "task": task,
+            "deadline_ms": round(deadline_ms, 1) if deadline_ms is not None else None,
+            "route": [f"{c['provider']}/{c['model']}" for c in chosen],
+            "candidates": candidates
+        }
+        with self._lock:
+            self.decisions.append(decision)
+            task_counts = self.counts.setdefault(task, {})
+            first = decision["route"][0] if decision["route"] else "none"
+            task_counts[first] = task_counts.get(first, 0) + 1
+        if self.settings["log_decisions"]:
+            print(f"route {json.dumps(decision, separators=(',', ':'))}")
+
+    def recent(self, limit: int = 50, task: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            decisions = [d for d in self.decisions if task is None or d["task"] == task]
+        return decisions[-limit:][::-1]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "decisions": sum(sum(counts.values()) for counts in self.counts.values()),
+                "first_choice_by_task": {task: dict(counts) for task, counts in self.counts.items()},
+                "tasks": self.settings["tasks"]
+            }
+
+
+# Global router instance
+provider_router = ProviderRouter(get_ai_config(), provider_registry)
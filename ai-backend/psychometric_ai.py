@@ -3,9 +3,10 @@ AI-Powered Psychometric Assessment System
 Uses machine learning and NLP to generate personalized questions and analyze responses
 """
 
+import asyncio
 import json
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from pydantic import BaseModel
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
@@ -17,8 +18,37 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+from ai_config import AIProvider, ai_config
+from provider_clients import ProviderDeadlineError, provider_registry
+from provider_hedging import provider_hedger
+from insight_cache import insight_cache, insight_cache_key
+from cohort_clusters import cluster_model
+from single_flight import insight_flights, prompt_flight_key
+from provider_router import provider_router
+from request_deadline import current_deadline, remaining_seconds, deadline_stage, without_deadline
+from llm_output import parse_question, parse_analysis
+from local_generation import TemplateQuestionEngine
+from insight_templates import get_insight_templates
+
 # AI Configuration - Using Google Gemini
 
+# Providers that can serve recommendation insights, with their request options;
+# provider_router decides the order and model per task
+RECOMMENDATION_PROVIDERS = [
+    (AIProvider.GROK, {
+        "system_prompt": "You are a career counselor specializing in Jammu & Kashmir students. Provide practical, actionable advice.",
+        "temperature": 0.7
+    }),
+    (AIProvider.GEMINI, {"temperature": 0.7, "max_tokens": 600}),
+    (AIProvider.LOCAL, {
+        "system_prompt": "You are a career counselor for Jammu & Kashmir students. Answer only with JSON.",
+        "temperature": 0.5
+    })
+]
+RECOMMENDATION_REQUEST_OPTIONS = dict(RECOMMENDATION_PROVIDERS)
+# Providers that can generate assessment questions
+QUESTION_PROVIDERS = [AIProvider.GEMINI, AIProvider.GROK, AIProvider.LOCAL]
+
 class PersonalityTrait(BaseModel):
     name: str
     description: str
@@ -66,6 +96,7 @@ class PsychometricAI:
         self.personality_traits = self._load_personality_traits()
         self.career_streams = self._load_career_streams()
         self.question_bank = self._load_question_bank()
+        self.template_questions = TemplateQuestionEngine(self.personality_traits, self.question_bank)
         
     def _load_personality_traits(self) -> List[PersonalityTrait]:
         """Load personality traits for assessment"""
@@ -526,7 +557,9 @@ class PsychometricAI:
                                   academic_performance: Dict[str, float],
                                   num_questions: int = 5) -> List[PsychometricQuestion]:
         """
-        Generate adaptive questions from curated question bank (no AI generation to save quota)
+        Generate adaptive questions for the traits assessed least so far. They come from the curated
+        question bank unless AI_QUESTION_SOURCE asks for generated ones: "ai" tries the routed
+        providers, then the on-box templates; "local" only the templates
         """
         # Analyze previous responses to identify areas needing more assessment
         trait_confidence = self._calculate_trait_confidence(user_responses)
@@ -534,6 +567,8 @@ class PsychometricAI:
         # Get questions that target traits with lowest confidence
         available_questions = self.question_bank.copy()
         selected_questions = []
+        # Trait each slot was picked for (None for the diversity fill)
+        slot_traits = []
         
         # Prioritize questions for traits that need more assessment
         traits_by_priority = sorted(trait_confidence.keys(), key=lambda x: trait_confidence[x])
@@ -547,16 +582,38 @@ class PsychometricAI:
                 # Select the best question for this trait
                 selected_question = trait_questions[0]  # Take first available
                 selected_questions.append(selected_question)
+                slot_traits.append(trait)
                 
         # Fill remaining slots with diverse questions
         while len(selected_questions) < num_questions and len(selected_questions) < len(available_questions):
             remaining_questions = [q for q in available_questions if q not in selected_questions]
             if remaining_questions:
                 selected_questions.append(remaining_questions[0])
+                slot_traits.append(None)
             else:
                 break
         
-        return selected_questions[:num_questions]
+        source = ai_config.question_generation["source"]
+        if source not in ("ai", "local"):
+            return selected_questions[:num_questions]
+        
+        # Bank questions stay as the fallback for each slot; once the request deadline runs out
+        # no further provider calls are made and the remaining slots keep their bank question
+        deadline = current_deadline()
+        questions = []
+        generated_count = 0
+        for question_num, (trait, bank_question) in enumerate(zip(slot_traits, selected_questions[:num_questions]), 1):
+            generated = None
+            if trait and source == "ai" and not (deadline is not None and deadline.expired()):
+                generated = self._try_ai_generation(trait, academic_performance, question_num)
+            if trait and generated is None:
+                # Templates take microseconds, so they still run after the deadline
+                generated = self._try_local_generation(trait, academic_performance, question_num)
+            if generated:
+                generated_count += 1
+            questions.append(generated or bank_question)
+        self._served_by("question_generation" if generated_count else "question_bank")
+        return questions
     
     def _analyze_response_patterns(self, user_responses: List[UserResponse]) -> Dict[str, Any]:
         """Analyze patterns in user responses for better question generation"""
@@ -607,26 +664,18 @@ class PsychometricAI:
                                      response_patterns: Dict[str, Any], question_num: int) -> PsychometricQuestion:
         """Generate AI question with adaptive context based on response patterns"""
         
-        # Try Gemini first (primary provider)
-        question = self._try_adaptive_gemini_generation(target_trait, academic_performance, response_patterns, question_num)
+        # Try the routed AI providers first
+        question = self._try_adaptive_ai_generation(target_trait, academic_performance, response_patterns, question_num)
         if question:
             return question
         
         # Fallback to regular AI generation
         return self._generate_ai_question(target_trait, academic_performance, question_num)
     
-    def _try_adaptive_gemini_generation(self, target_trait: str, academic_performance: Dict[str, float], 
-                                      response_patterns: Dict[str, Any], question_num: int) -> Optional[PsychometricQuestion]:
-        """Generate adaptive question using Gemini with response pattern analysis"""
-        if not os.getenv("GOOGLE_API_KEY"):
-            return None
-            
+    def _try_adaptive_ai_generation(self, target_trait: str, academic_performance: Dict[str, float], 
+                                    response_patterns: Dict[str, Any], question_num: int) -> Optional[PsychometricQuestion]:
+        """Generate adaptive question with response pattern analysis on the routed provider"""
         try:
-            import google.generativeai as genai
-            
-            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-            model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-1.5-flash"))
-            
             # Analyze patterns
             strong_subjects = [subj for subj, score in academic_performance.items() if score > 75]
             avg_score = sum(academic_performance.values()) / len(academic_performance) if academic_performance else 70
@@ -657,26 +706,11 @@ Return ONLY this JSON:
   "scenario": "Context if needed"
 }}"""
             
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.8,
-                    max_output_tokens=350
-                )
-            )
-            
-            # Parse response
-            response_text = response.text.strip()
-            if response_text.startswith("```json"):
-                response_text = response_text[7:-3]
-            elif response_text.startswith("```"):
-                response_text = response_text[3:-3]
-            
-            ai_response = json.loads(response_text)
-            
-            if "question" in ai_response and "options" in ai_response and len(ai_response["options"]) == 4:
+            generated = self._generate_question_json(prompt, 0.8, 350, QUESTION_PROVIDERS)
+            if generated:
+                ai_response, response = generated
                 return PsychometricQuestion(
-                    id=f"adaptive_gemini_{target_trait}_{question_num}",
+                    id=f"adaptive_{response.provider}_{target_trait}_{question_num}",
                     question=ai_response["question"],
                     question_type="scenario" if ai_response.get("scenario") else "multiple_choice",
                     options=ai_response["options"],
@@ -689,44 +723,66 @@ Return ONLY this JSON:
             return None
             
         except Exception as e:
-            print(f"Adaptive Gemini generation failed: {e}")
+            print(f"Adaptive AI generation failed: {e}")
             return None
     
     def _generate_ai_question(self, target_trait: str, academic_performance: Dict[str, float], 
                             question_num: int) -> PsychometricQuestion:
         """Generate a question using AI based on target trait and academic performance"""
         
-        # Try Gemini generation first, then fallback
+        # Try AI generation first, then fallback
         try:
-            question = self._try_gemini_generation(target_trait, academic_performance, question_num)
+            question = self._try_ai_generation(target_trait, academic_performance, question_num)
             if question:
                 return question
         except Exception as e:
-            print(f"Gemini generation failed: {e}")
+            print(f"AI generation failed: {e}")
         
-        # If Gemini fails, use fallback questions
+        # Then the on-box template engine, so questions never need the network
+        question = self._try_local_generation(target_trait, academic_performance, question_num)
+        if question:
+            return question
+        
+        # If everything else fails, use fallback questions
         return self._get_fallback_question(target_trait, question_num)
     
 
-    def _try_gemini_generation(self, target_trait: str, academic_performance: Dict[str, float], 
-                              question_num: int) -> Optional[PsychometricQuestion]:
-        """Try generating question using Google Gemini directly (simplified approach)"""
-        if not os.getenv("GOOGLE_API_KEY"):
-            return None
-            
+    def _try_ai_generation(self, target_trait: str, academic_performance: Dict[str, float], 
+                           question_num: int,
+                           providers: List[AIProvider] = QUESTION_PROVIDERS) -> Optional[PsychometricQuestion]:
+        """Try generating a question on the provider and model the router picks"""
         try:
-            import google.generativeai as genai
+            prompt = self._build_question_prompt(target_trait, academic_performance)
             
-            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-            model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-1.5-flash"))
+            generated = self._generate_question_json(prompt, 0.7, 300, providers)
+            if generated:
+                ai_response, response = generated
+                return PsychometricQuestion(
+                    id=f"{response.provider}_{target_trait}_{question_num}",
+                    question=ai_response["question"],
+                    question_type="scenario" if ai_response.get("scenario") else "multiple_choice",
+                    options=ai_response["options"],
+                    traits_measured=[target_trait],
+                    difficulty_level=3,
+                    scenario=ai_response.get("scenario"),
+                    context=f"Generated with {response.model}"
+                )
             
-            # Analyze academic performance
-            strong_subjects = [subj for subj, score in academic_performance.items() if score > 75]
-            weak_subjects = [subj for subj, score in academic_performance.items() if score < 60]
-            avg_score = sum(academic_performance.values()) / len(academic_performance) if academic_performance else 70
+            return None
             
-            # Create focused prompt
-            prompt = f"""Create a psychometric question to assess {target_trait.replace('_', ' ')} for a student from Jammu & Kashmir.
+        except Exception as e:
+            print(f"AI generation failed: {e}")
+            return None
+    
+    def _build_question_prompt(self, target_trait: str, academic_performance: Dict[str, float]) -> str:
+        """Prompt asking a provider for one question on ``target_trait``"""
+        # Analyze academic performance
+        strong_subjects = [subj for subj, score in academic_performance.items() if score > 75]
+        weak_subjects = [subj for subj, score in academic_performance.items() if score < 60]
+        avg_score = sum(academic_performance.values()) / len(academic_performance) if academic_performance else 70
+        
+        # Create focused prompt
+        return f"""Create a psychometric question to assess {target_trait.replace('_', ' ')} for a student from Jammu & Kashmir.
 
 Student Profile:
 - Average Score: {avg_score:.0f}%
@@ -745,49 +801,43 @@ Return ONLY this JSON:
   "options": ["Option 1", "Option 2", "Option 3", "Option 4"],
   "scenario": "Brief context if needed"
 }}"""
-            
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    max_output_tokens=300
-                )
-            )
-            
-            # Parse response
-            response_text = response.text.strip()
-            if response_text.startswith("```json"):
-                response_text = response_text[7:-3]
-            elif response_text.startswith("```"):
-                response_text = response_text[3:-3]
-            
-            ai_response = json.loads(response_text)
-            
-            # Validate
-            if "question" in ai_response and "options" in ai_response and len(ai_response["options"]) == 4:
-                return PsychometricQuestion(
-                    id=f"gemini_{target_trait}_{question_num}",
-                    question=ai_response["question"],
-                    question_type="scenario" if ai_response.get("scenario") else "multiple_choice",
-                    options=ai_response["options"],
-                    traits_measured=[target_trait],
-                    difficulty_level=3,
-                    scenario=ai_response.get("scenario"),
-                    context="Generated with Gemini Flash"
-                )
-            
-            return None
-            
-        except Exception as e:
-            print(f"Gemini generation failed: {e}")
+    
+    def _generate_question_json(self, prompt: str, temperature: float, max_tokens: int,
+                                providers: List[AIProvider]) -> Optional[Tuple[Dict[str, Any], Any]]:
+        """(question JSON, provider response) from the first routed provider that returns a valid question"""
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired():
+            # Out of request budget: the caller serves a fallback question straight away
             return None
+        attempts = provider_router.plan(
+            "question_generation",
+            {provider: {"temperature": temperature, "max_tokens": max_tokens} for provider in providers},
+            remaining_seconds()
+        )
+        for provider, options in attempts:
+            try:
+                response = provider_registry.get_client(provider).generate(prompt, **options)
+                # Schema-checked: a question with exactly four non-blank options
+                return parse_question(response.text), response
+            except Exception as e:
+                print(f"{provider.value.title()} question generation failed: {e}")
+        return None
     
     def _try_local_generation(self, target_trait: str, academic_performance: Dict[str, float], 
                              question_num: int) -> Optional[PsychometricQuestion]:
-        """Try generating question using local LLM (placeholder for future implementation)"""
-        # This could be implemented with Ollama, Llama.cpp, or similar
-        # For now, return None to fall back to predefined questions
-        return None
+        """Deterministic question from trait keywords and the J&K scenario bank, built on the box"""
+        if not ai_config.get_provider_config(AIProvider.LOCAL).get("template_questions"):
+            return None
+        with deadline_stage("local_template"):
+            generated = self.template_questions.generate(target_trait, academic_performance, question_num)
+        if generated is None:
+            return None
+        return PsychometricQuestion(
+            question_type="scenario",
+            traits_measured=[target_trait],
+            difficulty_level=3,
+            **generated
+        )
     
     def _get_fallback_question(self, target_trait: str, question_num: int) -> PsychometricQuestion:
         """Fallback questions when AI generation fails"""
@@ -836,8 +886,9 @@ Return ONLY this JSON:
         
         return trait_confidence
     
-    def analyze_responses(self, responses: List[UserResponse], 
-                         academic_performance: Dict[str, float]) -> PersonalityProfile:
+    async def analyze_responses(self, responses: List[UserResponse], 
+                               academic_performance: Dict[str, float],
+                               enhance_with_ai: bool = True) -> PersonalityProfile:
         """
         Analyze user responses to create personality profile and AI-powered recommendations
         """
@@ -856,7 +907,11 @@ Return ONLY this JSON:
         areas_for_development = self._identify_development_areas(trait_scores)
         
         # Generate AI-powered stream recommendations using both academic and personality data
-        recommended_streams = self._recommend_streams(trait_scores, academic_performance)
+        if enhance_with_ai:
+            recommended_streams = await self._recommend_streams(trait_scores, academic_performance)
+        else:
+            # Deferred mode: the ranked algorithmic list now, AI insights are patched in later
+            recommended_streams = self._get_basic_recommendations(trait_scores, academic_performance)
         
         # Calculate overall confidence
         confidence_score = self._calculate_confidence_score(responses, trait_scores)
@@ -1048,8 +1103,8 @@ Return ONLY this JSON:
         
         return [development_mapping[trait] for trait, score in sorted_traits[:2] if score < 0.4]
     
-    def _recommend_streams(self, trait_scores: Dict[str, float], 
-                          academic_performance: Dict[str, float]) -> List[Dict[str, Any]]:
+    async def _recommend_streams(self, trait_scores: Dict[str, float], 
+                                academic_performance: Dict[str, float]) -> List[Dict[str, Any]]:
         """Generate AI-powered stream recommendations based on traits and academic performance"""
         
         # First get basic recommendations using traditional logic
@@ -1057,13 +1112,15 @@ Return ONLY this JSON:
         
         # Then enhance with AI analysis
         try:
-            ai_recommendations = self._get_ai_enhanced_recommendations(
+            ai_recommendations = await self._get_ai_enhanced_recommendations(
                 trait_scores, academic_performance, basic_recommendations
             )
-            return ai_recommendations if ai_recommendations else basic_recommendations
+            if ai_recommendations:
+                return ai_recommendations
         except Exception as e:
             print(f"AI recommendation failed, using basic recommendations: {e}")
-            return basic_recommendations
+        self._served_by("basic")
+        return basic_recommendations
     
     def _get_basic_recommendations(self, trait_scores: Dict[str, float], 
                                  academic_performance: Dict[str, float]) -> List[Dict[str, Any]]:
@@ -1150,139 +1207,178 @@ Return ONLY this JSON:
         recommendations.sort(key=lambda x: x["match_percentage"], reverse=True)
         return recommendations[:5]
     
-    def _get_ai_enhanced_recommendations(self, trait_scores: Dict[str, float], 
-                                       academic_performance: Dict[str, float],
-                                       basic_recommendations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Use AI to enhance stream recommendations with personalized insights"""
+    async def _get_ai_enhanced_recommendations(self, trait_scores: Dict[str, float], 
+                                             academic_performance: Dict[str, float],
+                                             basic_recommendations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Use AI to enhance stream recommendations with personalized insights
+        
+        Within a request deadline the providers only get what is left of the budget; once it
+        runs out the mock insights are served at once and the stage that used it up is recorded.
+        """
+        deadline = current_deadline()
+        
+        reused_analysis = await self._reuse_ai_analysis(trait_scores, academic_performance, basic_recommendations)
+        if reused_analysis is not None:
+            return self._fill_missing_insights(
+                self._merge_ai_analysis(reused_analysis, basic_recommendations), trait_scores, academic_performance
+            )
+        
+        if not any(provider_registry.is_callable(provider) for provider, _ in RECOMMENDATION_PROVIDERS):
+            # Out of quota or short-circuited: answer right away instead of failing through the providers
+            print("No AI provider within quota, using mock AI insights")
+            return self._serve_mock_ai_insights(basic_recommendations, trait_scores, academic_performance)
+        
+        if deadline is not None and deadline.expired():
+            deadline.exhaust("reuse")
+            print(f"Request deadline exhausted by {deadline.exhausted_by}, using mock AI insights")
+            return self._serve_mock_ai_insights(basic_recommendations, trait_scores, academic_performance)
         
-        # Try Grok first (primary AI provider)
-        try:
-            return self._try_grok_recommendations(trait_scores, academic_performance, basic_recommendations)
-        except Exception as e:
-            print(f"Grok failed: {e}")
-            
-        # Try Gemini as fallback
         try:
-            return self._try_gemini_recommendations(trait_scores, academic_performance, basic_recommendations)
+            with deadline_stage("ai_providers") as stage:
+                fetch = self._fetch_ai_analysis(trait_scores, academic_performance, basic_recommendations)
+                if deadline is None:
+                    ai_analysis, provider = await fetch
+                else:
+                    try:
+                        ai_analysis, provider = await asyncio.wait_for(fetch, deadline.remaining())
+                    except asyncio.TimeoutError:
+                        stage["outcome"] = "deadline"
+                        deadline.exhaust("ai_providers")
+                        raise
+            self._served_by(provider)
+            return self._fill_missing_insights(
+                self._merge_ai_analysis(ai_analysis, basic_recommendations), trait_scores, academic_performance
+            )
+        except asyncio.TimeoutError:
+            print(f"Request deadline of {deadline.budget_ms:.0f}ms exhausted by {deadline.exhausted_by}, "
+                  f"using mock AI insights")
+            return self._serve_mock_ai_insights(basic_recommendations, trait_scores, academic_performance)
         except Exception as e:
-            print(f"Gemini failed: {e}")
+            print(f"AI providers failed: {e}")
             
         # Both AI providers failed, use mock AI insights
         print("Both AI providers failed, using mock AI insights")
-        return self._get_mock_ai_insights(basic_recommendations, trait_scores, academic_performance)
+        return self._serve_mock_ai_insights(basic_recommendations, trait_scores, academic_performance)
     
-    def _try_gemini_recommendations(self, trait_scores: Dict[str, float], 
-                                  academic_performance: Dict[str, float],
-                                  basic_recommendations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Try Gemini for AI recommendations"""
-        if not os.getenv("GOOGLE_API_KEY"):
-            raise Exception("No Gemini API key")
-            
-        import google.generativeai as genai
-        
-        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-        model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-1.5-flash"))
-        
-        # Prepare data for AI analysis
-        top_traits = sorted(trait_scores.items(), key=lambda x: x[1], reverse=True)[:3]
-        strong_subjects = [subj for subj, score in academic_performance.items() if score > 75]
-        weak_subjects = [subj for subj, score in academic_performance.items() if score < 60]
+    def _serve_mock_ai_insights(self, basic_recommendations: List[Dict[str, Any]],
+                                trait_scores: Dict[str, float],
+                                academic_performance: Dict[str, float]) -> List[Dict[str, Any]]:
+        with deadline_stage("mock"):
+            recommendations = self._get_mock_ai_insights(basic_recommendations, trait_scores, academic_performance)
+        self._served_by("mock")
+        return recommendations
+    
+    def _fill_missing_insights(self, enhanced_recommendations: List[Dict[str, Any]],
+                               trait_scores: Dict[str, float],
+                               academic_performance: Dict[str, float]) -> List[Dict[str, Any]]:
+        """Give top-3 streams a repaired (truncated) analysis did not cover the template insights"""
+        if all(rec.get("ai_insights") for rec in enhanced_recommendations[:3]):
+            return enhanced_recommendations
+        mock_recommendations = self._get_mock_ai_insights(enhanced_recommendations, trait_scores, academic_performance)
+        for rec, mock_rec in zip(enhanced_recommendations[:3], mock_recommendations[:3]):
+            if not rec.get("ai_insights") and mock_rec.get("ai_insights"):
+                rec["ai_insights"] = mock_rec["ai_insights"]
+        return enhanced_recommendations
+    
+    def _served_by(self, source: str):
+        """Note on the request deadline what the recommendations were built from"""
+        deadline = current_deadline()
+        if deadline is not None and deadline.served_by is None:
+            deadline.serve(source)
+    
+    async def _reuse_ai_analysis(self, trait_scores: Dict[str, float], 
+                                 academic_performance: Dict[str, float],
+                                 basic_recommendations: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """An existing analysis for this profile from the prompt cache or its cohort cluster, if any"""
+        # Students with the same coarse profile produce the same prompt, so reuse its analysis
+        cache_key = insight_cache_key(trait_scores, academic_performance, basic_recommendations)
+        with deadline_stage("cache"):
+            cached, state = await insight_cache.get(cache_key)
+        if cached is not None:
+            if state == "stale":
+                # The refresh outlives this request, so it does not inherit the request's deadline
+                insight_cache.revalidate(
+                    cache_key,
+                    lambda: without_deadline(lambda: self._fetch_ai_analysis(
+                        trait_scores, academic_performance, basic_recommendations, task="offline_insights"
+                    ))
+                )
+            self._served_by("cache")
+            return cached["analysis"]
+        
+        # Otherwise reuse the insights generated for the student's trait-space cohort
+        with deadline_stage("cluster"):
+            analysis = await cluster_model.lookup(trait_scores, academic_performance, basic_recommendations)
+        if analysis is not None:
+            self._served_by("cluster")
+        return analysis
+    
+    async def _fetch_ai_analysis(self, trait_scores: Dict[str, float], 
+                                 academic_performance: Dict[str, float],
+                                 basic_recommendations: List[Dict[str, Any]],
+                                 task: str = "insights") -> Tuple[Dict[str, Any], str]:
+        """Get a parsed analysis from the providers; returns (analysis, provider name)
+        
+        ``task`` selects the routing profile: "insights" while a student waits, "offline_insights"
+        for background refreshes and cohort rebuilds.
+        """
+        prompt = self._build_recommendation_prompt(trait_scores, academic_performance, basic_recommendations)
+        cache_key = insight_cache_key(trait_scores, academic_performance, basic_recommendations)
         
-        # Create AI prompt for personalized recommendations
-        prompt = f"""Analyze this J&K student's profile and provide personalized career stream insights:
-
-PERSONALITY PROFILE:
-Top Traits: {', '.join([f'{trait.replace("_", " ").title()}: {score:.0%}' for trait, score in top_traits])}
-
-ACADEMIC PERFORMANCE:
-Strong Subjects (>75%): {', '.join(strong_subjects) if strong_subjects else 'None'}
-Weak Subjects (<60%): {', '.join(weak_subjects) if weak_subjects else 'None'}
-Average Score: {sum(academic_performance.values()) / len(academic_performance):.0f}%
-
-TOP STREAM RECOMMENDATIONS:
-{chr(10).join([f"{i+1}. {rec['stream']} ({rec['match_percentage']}% match)" for i, rec in enumerate(basic_recommendations[:3])])}
-
-For each of the top 3 streams, provide:
-1. Why this stream fits their personality and academic profile
-2. Specific career opportunities in Jammu & Kashmir context
-3. Potential challenges and how to overcome them
-4. Actionable next steps for this student
-
-Return ONLY this JSON:
-{{
-  "enhanced_recommendations": [
-    {{
-      "stream": "Stream Name",
-      "personality_fit": "Brief explanation of personality match...",
-      "jk_opportunities": "Specific J&K career opportunities...",
-      "challenges": "Main challenges and solutions...",
-      "next_steps": "3-4 actionable steps...",
-      "confidence": 0.85
-    }}
-  ],
-  "overall_guidance": "General career advice for this student profile..."
-}}"""
+        async def call() -> Tuple[Dict[str, Any], str]:
+            ai_analysis, provider = await self._call_ai_providers(prompt, task)
+            # Cached inside the shared call, so the answer is kept even if its callers stopped waiting
+            await insight_cache.put(cache_key, ai_analysis, provider)
+            return ai_analysis, provider
         
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.7,
-                max_output_tokens=600
+        # Identical prompts in flight at the same time share one provider call (per task, since tiers differ)
+        try:
+            return await insight_flights.do(prompt_flight_key(f"{task}:{prompt}"), call)
+        except ProviderDeadlineError:
+            # The shared call ran on the budget of the request that started it; retry if ours has time left
+            deadline = current_deadline()
+            if deadline is None or deadline.expired():
+                raise
+            return await call()
+    
+    async def _call_ai_providers(self, prompt: str, task: str) -> Tuple[Dict[str, Any], str]:
+        attempts = provider_router.plan(task, RECOMMENDATION_REQUEST_OPTIONS, remaining_seconds())
+        if ai_config.hedging["enabled"]:
+            # Race the routed providers: the next starts if the current one is slower than the hedge delay or fails
+            ai_analysis, response = await provider_hedger.generate(
+                prompt,
+                attempts,
+                lambda response: self._parse_ai_analysis(response.text)
             )
-        )
-        
-        # Parse AI response
-        response_text = response.text.strip()
-        if response_text.startswith("```json"):
-            response_text = response_text[7:-3]
-        elif response_text.startswith("```"):
-            response_text = response_text[3:-3]
-        
-        ai_analysis = json.loads(response_text)
-        
-        # Enhance recommendations with AI insights
-        enhanced_recommendations = basic_recommendations.copy()
-        
-        for ai_rec in ai_analysis.get("enhanced_recommendations", []):
-            # Find matching recommendation
-            for rec in enhanced_recommendations:
-                if rec["stream"] == ai_rec["stream"]:
-                    rec["ai_insights"] = {
-                        "personality_fit": ai_rec.get("personality_fit", ""),
-                        "jk_opportunities": ai_rec.get("jk_opportunities", ""),
-                        "challenges": ai_rec.get("challenges", ""),
-                        "next_steps": ai_rec.get("next_steps", ""),
-                        "confidence": ai_rec.get("confidence", 0.8)
-                    }
-                    # Boost match percentage slightly for AI-enhanced recommendations
-                    rec["match_percentage"] = min(100, rec["match_percentage"] + 3)
-                    break
-        
-        # Add overall guidance to the first recommendation
-        if enhanced_recommendations and "overall_guidance" in ai_analysis:
-            enhanced_recommendations[0]["overall_guidance"] = ai_analysis["overall_guidance"]
-        
-        return enhanced_recommendations
+            return ai_analysis, response.provider
+        
+        # Try the routed providers in order
+        last_error: Optional[Exception] = None
+        for provider, options in attempts:
+            try:
+                return await self._request_ai_analysis(provider, prompt, options), provider.value
+            except Exception as e:
+                print(f"{provider.value.title()} failed: {e}")
+                last_error = e
+        raise last_error or RuntimeError("no AI provider configured")
     
-    def _try_grok_recommendations(self, trait_scores: Dict[str, float], 
-                                academic_performance: Dict[str, float],
-                                basic_recommendations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Try Grok API for AI recommendations"""
-        if not os.getenv("GROK_API_KEY"):
-            raise Exception("No Grok API key")
-            
-        try:
-            import requests
-        except ImportError:
-            raise Exception("requests library not available")
-        
+    async def _request_ai_analysis(self, provider: AIProvider, prompt: str,
+                                   options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # Awaited on the shared async pool, so the worker keeps serving while the provider responds
+        client = provider_registry.get_client(provider)
+        response = await client.agenerate(prompt, **(options or RECOMMENDATION_REQUEST_OPTIONS[provider]))
+        return self._parse_ai_analysis(response.text)
+    
+    def _build_recommendation_prompt(self, trait_scores: Dict[str, float], 
+                                     academic_performance: Dict[str, float],
+                                     basic_recommendations: List[Dict[str, Any]]) -> str:
+        """Prompt asking a provider to enrich the top 3 streams with personalised insights"""
         # Prepare data for AI analysis
         top_traits = sorted(trait_scores.items(), key=lambda x: x[1], reverse=True)[:3]
         strong_subjects = [subj for subj, score in academic_performance.items() if score > 75]
         weak_subjects = [subj for subj, score in academic_performance.items() if score < 60]
         
-        # Create prompt for Grok
-        prompt = f"""Analyze this J&K student's profile and provide personalized career stream insights:
+        return f"""Analyze this J&K student's profile and provide personalized career stream insights:
 
 PERSONALITY PROFILE:
 Top Traits: {', '.join([f'{trait.replace("_", " ").title()}: {score:.0%}' for trait, score in top_traits])}
@@ -1315,64 +1411,32 @@ Return ONLY this JSON:
   ],
   "overall_guidance": "General career advice for this student profile..."
 }}"""
-
-        # Make request to Grok API
-        headers = {
-            "Authorization": f"Bearer {os.getenv('GROK_API_KEY')}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are a career counselor specializing in Jammu & Kashmir students. Provide practical, actionable advice."
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ],
-            "model": "grok-beta",
-            "stream": False,
-            "temperature": 0.7
+    
+    def _parse_ai_analysis(self, ai_response_text: str) -> Dict[str, Any]:
+        """Parse a provider's analysis, tolerating prose and truncation; raises ValueError if unusable"""
+        return parse_analysis(ai_response_text)
+    
+    def _format_ai_insights(self, ai_rec: Dict[str, Any]) -> Dict[str, Any]:
+        """The ai_insights block for one stream entry of a provider analysis"""
+        return {
+            "personality_fit": ai_rec.get("personality_fit", ""),
+            "jk_opportunities": ai_rec.get("jk_opportunities", ""),
+            "challenges": ai_rec.get("challenges", ""),
+            "next_steps": ai_rec.get("next_steps", ""),
+            "confidence": ai_rec.get("confidence", 0.8)
         }
-        
-        response = requests.post(
-            "https://api.x.ai/v1/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=30
-        )
-        
-        if response.status_code != 200:
-            raise Exception(f"Grok API error: {response.status_code}")
-        
-        result = response.json()
-        ai_response_text = result["choices"][0]["message"]["content"].strip()
-        
-        # Parse response
-        if ai_response_text.startswith("```json"):
-            ai_response_text = ai_response_text[7:-3]
-        elif ai_response_text.startswith("```"):
-            ai_response_text = ai_response_text[3:-3]
-        
-        ai_analysis = json.loads(ai_response_text)
-        
-        # Enhance recommendations with AI insights
-        enhanced_recommendations = basic_recommendations.copy()
+    
+    def _merge_ai_analysis(self, ai_analysis: Dict[str, Any],
+                           basic_recommendations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge a parsed analysis into copies of the basic recommendations"""
+        # Copy each recommendation so concurrent requests never share mutated dicts
+        enhanced_recommendations = [dict(rec) for rec in basic_recommendations]
         
         for ai_rec in ai_analysis.get("enhanced_recommendations", []):
             # Find matching recommendation
             for rec in enhanced_recommendations:
-                if rec["stream"] == ai_rec["stream"]:
-                    rec["ai_insights"] = {
-                        "personality_fit": ai_rec.get("personality_fit", ""),
-                        "jk_opportunities": ai_rec.get("jk_opportunities", ""),
-                        "challenges": ai_rec.get("challenges", ""),
-                        "next_steps": ai_rec.get("next_steps", ""),
-                        "confidence": ai_rec.get("confidence", 0.8)
-                    }
+                if rec["stream"] == ai_rec.get("stream"):
+                    rec["ai_insights"] = self._format_ai_insights(ai_rec)
                     # Boost match percentage slightly for AI-enhanced recommendations
                     rec["match_percentage"] = min(100, rec["match_percentage"] + 3)
                     break
@@ -1386,68 +1450,46 @@ Return ONLY this JSON:
     def _get_mock_ai_insights(self, basic_recommendations: List[Dict[str, Any]], 
                              trait_scores: Dict[str, float], 
                              academic_performance: Dict[str, float]) -> List[Dict[str, Any]]:
-        """Generate mock AI insights for demo purposes when API quota is exhausted"""
+        """Template insights for the top 3 streams when no provider answer is available
         
-        # Get top traits for personalization
-        top_traits = sorted(trait_scores.items(), key=lambda x: x[1], reverse=True)[:2]
-        strong_subjects = [subj for subj, score in academic_performance.items() if score > 75]
+        Rendered from the compiled catalog templates, so every stream gets insights in microseconds.
+        """
+        templates = get_insight_templates()
+        legacy_streams = {stream.name: stream for stream in self.career_streams}
         
-        enhanced_recommendations = basic_recommendations.copy()
-        
-        # Mock insights for top 3 recommendations
-        mock_insights = {
-            "Computer Science & Engineering": {
-                "personality_fit": f"Your strong {top_traits[0][0].replace('_', ' ')} ({top_traits[0][1]:.0%}) and {top_traits[1][0].replace('_', ' ')} ({top_traits[1][1]:.0%}) make you well-suited for tech roles that require both problem-solving and innovation.",
-                "jk_opportunities": "J&K is rapidly developing its IT sector with initiatives like Digital Kashmir. Opportunities include software development for government projects, fintech startups in Srinagar, and remote work for global companies.",
-                "challenges": "Limited local tech infrastructure and fewer mentorship opportunities. Overcome by joining online communities, contributing to open-source projects, and considering internships in Bangalore or Delhi.",
-                "next_steps": "1. Master programming languages like Python/Java 2. Build projects showcasing J&K culture 3. Apply for government IT schemes 4. Network with J&K tech professionals on LinkedIn",
-                "confidence": 0.92
-            },
-            "Business Administration": {
-                "personality_fit": f"Your {top_traits[0][0].replace('_', ' ')} and people-oriented skills align perfectly with business leadership roles, especially in managing teams and driving organizational growth.",
-                "jk_opportunities": "Growing tourism industry, handicraft export businesses, and government administrative roles. Opportunities in managing family businesses, tourism startups, and NGO leadership positions.",
-                "challenges": "Limited formal business networks and traditional business practices. Build modern business skills through online courses and connect with young entrepreneurs in Kashmir.",
-                "next_steps": "1. Pursue BBA/MBA from recognized institutions 2. Intern with local businesses 3. Start small ventures (e-commerce for Kashmiri products) 4. Join business associations",
-                "confidence": 0.88
-            },
-            "Medical Sciences": {
-                "personality_fit": f"Your strong helping others trait ({trait_scores.get('helping_others', 0.5):.0%}) and research orientation make you ideal for healthcare roles that combine patient care with medical research.",
-                "jk_opportunities": "High demand for doctors in rural Kashmir, telemedicine initiatives, and medical research on high-altitude medicine. Government medical colleges offer good opportunities.",
-                "challenges": "Intense competition for medical seats and long study duration. Prepare thoroughly for NEET, consider alternative healthcare careers like nursing or physiotherapy.",
-                "next_steps": "1. Focus on Biology, Chemistry, Physics 2. Join NEET coaching 3. Volunteer at local hospitals 4. Consider AIIMS Jammu for quality education",
-                "confidence": 0.85
-            },
-            "Liberal Arts & Humanities": {
-                "personality_fit": f"Your creativity and social skills make you perfect for roles in education, content creation, and social work that require understanding human behavior and communication.",
-                "jk_opportunities": "Teaching positions, content creation about Kashmir culture, tourism guide services, and social work with NGOs. Growing demand for digital content creators.",
-                "challenges": "Lower starting salaries and limited career progression paths. Diversify skills with digital marketing, freelance writing, and online teaching.",
-                "next_steps": "1. Develop writing and communication skills 2. Create content about J&K culture 3. Pursue B.Ed for teaching 4. Learn digital marketing",
-                "confidence": 0.80
-            },
-            "Pure Sciences": {
-                "personality_fit": f"Your analytical thinking and research orientation are perfect for scientific research and discovery, especially in areas relevant to J&K's unique environment.",
-                "jk_opportunities": "Research on Kashmir's biodiversity, climate studies, agricultural research, and positions in DRDO labs. Government research institutions offer stable careers.",
-                "challenges": "Limited research funding and fewer industry applications. Consider interdisciplinary approaches and collaboration with international researchers.",
-                "next_steps": "1. Excel in Physics/Chemistry/Math 2. Participate in science fairs 3. Apply for research internships 4. Consider IIT/NIT for quality education",
-                "confidence": 0.83
-            }
-        }
+        enhanced_recommendations = [dict(rec) for rec in basic_recommendations]
         
-        # Apply mock insights to matching streams
-        for i, rec in enumerate(enhanced_recommendations[:3]):
-            stream_name = rec["stream"]
-            if stream_name in mock_insights:
-                rec["ai_insights"] = mock_insights[stream_name]
+        for rec in enhanced_recommendations[:3]:
+            legacy = legacy_streams.get(rec["stream"])
+            insights = templates.render(
+                rec["stream"], trait_scores, academic_performance,
+                fallback_stream=self._legacy_stream_fields(legacy) if legacy else None
+            )
+            if insights:
+                rec["ai_insights"] = insights
                 # Boost match percentage slightly for "AI-enhanced" recommendations
                 rec["match_percentage"] = min(100, rec["match_percentage"] + 3)
         
         # Add overall guidance based on top traits
         if enhanced_recommendations:
-            trait_name = top_traits[0][0].replace('_', ' ').title()
-            enhanced_recommendations[0]["overall_guidance"] = f"Your strongest trait is {trait_name} ({top_traits[0][1]:.0%}), which opens doors to leadership and innovation roles. Focus on developing complementary skills in technology and communication. Consider opportunities that leverage J&K's unique cultural and geographical advantages. Build a strong network both locally and nationally to maximize career opportunities."
+            enhanced_recommendations[0]["overall_guidance"] = templates.render_guidance(
+                trait_scores, [rec["stream"] for rec in enhanced_recommendations[:3]]
+            )
         
         return enhanced_recommendations
     
+    def _legacy_stream_fields(self, stream: CareerStream) -> Dict[str, Any]:
+        """A legacy career stream in the catalog's field layout, for the insight templates"""
+        return {
+            "name": stream.name,
+            "personality_requirements": stream.required_traits,
+            # Legacy streams carry no mark thresholds; 60% is the usual eligibility floor
+            "academic_requirements": {subject.lower().replace(" ", "_"): 60 for subject in stream.subjects},
+            "career_paths": stream.career_paths,
+            "salary_range": stream.salary_range,
+            "growth_prospects": stream.growth_prospects
+        }
+    
     def _calculate_confidence_score(self, responses: List[UserResponse], 
                                   trait_scores: Dict[str, float]) -> float:
         """Calculate overall confidence in the assessment"""
@@ -0,0 +1,265 @@
+"""
+Per-provider Rate Limiting and Quota Budgeting
+Token buckets for requests and tokens per minute plus a daily budget keep calls inside the
+provider's quota; a call that cannot start within a short wait is refused up front, so the
+caller falls back to algorithmic output instead of discovering the quota through an HTTP 429
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+
+# 429s older than this no longer count against a key when choosing between keys
+THROTTLE_MEMORY_SECONDS = 300
+
+
+class QuotaExhaustedError(Exception):
+    """Raised instead of calling a provider that is out of rate or daily budget"""
+
+    def __init__(self, name: str, reason: str, retry_after: Optional[float] = None):
+        super().__init__(f"{name} {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to a burst of one minute's worth
+
+    Reservations may drive the level negative: later callers then wait behind earlier
+    ones, which keeps the wait queue first-come first-served without an explicit queue.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` units could be taken"""
+        self._refill()
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+    def refund(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class ProviderRateLimiter:
+    """RPM and TPM buckets, a daily token/request budget and a bounded wait for one provider"""
+
+    def __init__(self, name: str, provider_config: Dict[str, Any], settings: Dict[str, Any]):
+        self.name = name
+        self.max_wait_seconds = settings["max_wait_seconds"]
+        self.max_waiters = settings["max_waiters"]
+        self.cooldown_seconds = settings["cooldown_seconds"]
+        rpm = provider_config.get("rpm") or 0
+        tpm = provider_config.get("tpm") or 0
+        self.requests_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self.cost_per_1k_tokens = provider_config.get("cost_per_1k_tokens", 0.0)
+        self.daily_budget_usd = provider_config.get("daily_budget_usd") or 0.0
+        self.daily_requests = provider_config.get("daily_requests") or 0
+        # Paid providers get a token allowance from the dollar budget; free tiers only a request cap
+        self.daily_token_budget = (
+            int(self.daily_budget_usd / self.cost_per_1k_tokens * 1000)
+            if self.daily_budget_usd > 0 and self.cost_per_1k_tokens > 0 else 0
+        )
+
+        self.day = self._today()
+        self.tokens_today = 0
+        self.requests_today = 0
+        self.cooldown_until = 0.0
+        self.throttled_at = deque(maxlen=50)
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.total_wait_ms = 0.0
+        self.rejected: Dict[str, int] = {"daily_budget": 0, "rate": 0, "queue_full": 0, "cooldown": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _roll_day(self):
+        today = self._today()
+        if today != self.day:
+            self.day = today
+            self.tokens_today = 0
+            self.requests_today = 0
+
+    def _budget_left(self, estimated_tokens: int) -> bool:
+        if self.daily_requests and self.requests_today >= self.daily_requests:
+            return False
+        if self.daily_token_budget and self.tokens_today + estimated_tokens > self.daily_token_budget:
+            return False
+        return True
+
+    def _required_wait(self, estimated_tokens: int) -> float:
+        wait = 0.0
+        if self.requests_bucket is not None:
+            wait = self.requests_bucket.wait_for(1)
+        if self.tokens_bucket is not None:
+            wait = max(wait, self.tokens_bucket.wait_for(estimated_tokens))
+        return wait
+
+    def can_admit(self, estimated_tokens: int = 0) -> bool:
+        """Whether a call could start within the wait limit; reserves nothing"""
+        with self._lock:
+            self._roll_day()
+            return (time.monotonic() >= self.cooldown_until
+                    and self._budget_left(estimated_tokens)
+                    and self._required_wait(estimated_tokens) <= self.max_wait_seconds)
+
+    def reserve(self, estimated_tokens: int, max_wait: Optional[float] = None) -> float:
+        """Reserve one request and its estimated tokens; returns how long to wait before sending"""
+        max_wait = self.max_wait_seconds if max_wait is None else min(max_wait, self.max_wait_seconds)
+        with self._lock:
+            self._roll_day()
+            now = time.monotonic()
+            if now < self.cooldown_until:
+                self.rejected["cooldown"] += 1
+                raise QuotaExhaustedError(self.name, "cooling down after a provider 429",
+                                          self.cooldown_until - now)
+            if not self._budget_left(estimated_tokens):
+                self.rejected["daily_budget"] += 1
+                raise QuotaExhaustedError(self.name, "daily budget exhausted")
+            wait = self._required_wait(estimated_tokens)
+            if wait > max_wait:
+                self.rejected["rate"] += 1
+                raise QuotaExhaustedError(self.name, f"rate limit, next slot in {wait:.1f}s", wait)
+            if wait > 0 and self.waiting >= self.max_waiters:
+                self.rejected["queue_full"] += 1
+                raise QuotaExhaustedError(self.name, "wait queue full", wait)
+            if self.requests_bucket is not None:
+                self.requests_bucket.take(1)
+            if self.tokens_bucket is not None:
+                self.tokens_bucket.take(estimated_tokens)
+            self.requests_today += 1
+            self.tokens_today += estimated_tokens
+            self.admitted += 1
+            if wait > 0:
+                self.queued += 1
+                self.total_wait_ms += wait * 1000
+            return wait
+
+    def acquire(self, estimated_tokens: int, max_wait: Optional[float] = None):
+        """Blocking reserve for sync callers"""
+        wait = self.reserve(estimated_tokens, max_wait)
+        if wait > 0:
+            self._wait_started()
+            try:
+                time.sleep(wait)
+            finally:
+                self._wait_finished()
+
+    async def aacquire(self, estimated_tokens: int, max_wait: Optional[float] = None):
+        """Reserve without blocking the event loop; a cancelled waiter gives its slot back"""
+        wait = self.reserve(estimated_tokens, max_wait)
+        if wait > 0:
+            self._wait_started()
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.settle(estimated_tokens, 0, sent=False)
+                raise
+            finally:
+                self._wait_finished()
+
+    def _wait_started(self):
+        with self._lock:
+            self.waiting += 1
+
+    def _wait_finished(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int], sent: bool = True):
+        """Replace a reservation's estimate with the tokens the provider reported
+
+        ``actual_tokens`` of None keeps the estimate; an unsent request also returns its slot.
+        """
+        with self._lock:
+            self._roll_day()
+            delta = 0 if actual_tokens is None else actual_tokens - estimated_tokens
+            self.tokens_today = max(0, self.tokens_today + delta)
+            if self.tokens_bucket is not None:
+                if delta < 0:
+                    self.tokens_bucket.refund(-delta)
+                else:
+                    self.tokens_bucket.take(delta)
+            if not sent:
+                self.requests_today = max(0, self.requests_today - 1)
+                if self.requests_bucket is not None:
+                    self.requests_bucket.refund(1)
+
+    def throttled(self):
+        """The provider answered 429: stop sending for the cooldown period"""
+        with self._lock:
+            now = time.monotonic()
+            self.cooldown_until = now + self.cooldown_seconds
+            self.throttled_at.append(now)
+        print(f"{self.name} returned 429; pausing calls for {self.cooldown_seconds:.0f}s")
+
+    def recent_throttles(self) -> int:
+        cutoff = time.monotonic() - THROTTLE_MEMORY_SECONDS
+        with self._lock:
+            return sum(1 for at in self.throttled_at if at >= cutoff)
+
+    def headroom(self) -> float:
+        """Fraction of quota left, by the tightest of the minute buckets and the daily budget"""
+        with self._lock:
+            self._roll_day()
+            fractions = [1.0]
+            for bucket in (self.requests_bucket, self.tokens_bucket):
+                if bucket is not None:
+                    bucket._refill()
+                    fractions.append(bucket.level / bucket.capacity)
+            if self.daily_requests:
+                fractions.append(1 - self.requests_today / self.daily_requests)
+            if self.daily_token_budget:
+                fractions.append(1 - self.tokens_today / self.daily_token_budget)
+            return min(fractions)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._roll_day()
+            now = time.monotonic()
+            if self.requests_bucket is not None:
+                self.requests_bucket._refill()
+            if self.tokens_bucket is not None:
+                self.tokens_bucket._refill()
+            return {
+                "requests_per_minute": self.requests_bucket.capacity if self.requests_bucket else None,
+                "requests_available": round(self.requests_bucket.level, 1) if self.requests_bucket else None,
+                "tokens_per_minute": self.tokens_bucket.capacity if self.tokens_bucket else None,
+                "tokens_available": round(self.tokens_bucket.level) if self.tokens_bucket else None,
+                "day": self.day,
+                "requests_today": self.requests_today,
+                "daily_requests": self.daily_requests or None,
+                "tokens_today": self.tokens_today,
+                "daily_token_budget": self.daily_token_budget or None,
+                "spent_today_usd": round(self.tokens_today / 1000 * self.cost_per_1k_tokens, 4),
+                "daily_budget_usd": self.daily_budget_usd or None,
+                "cooldown_seconds_left": round(max(0.0, self.cooldown_until - now), 1),
+                "throttled_429": len(self.throttled_at),
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "avg_queue_wait_ms": round(self.total_wait_ms / self.queued, 1) if self.queued else None,
+                "rejected": dict(self.rejected)
+            }
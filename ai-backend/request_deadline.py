@@ -0,0 +1,197 @@
+"""
+Per-request Deadline Budgets
+A request's time budget comes from the client's deadline header or the server default; cache,
+cluster and provider stages run against what is left of it and record their share, so an
+answer served from the fallback says which stage used up the time
+"""
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional, Callable, Awaitable, TypeVar
+
+T = TypeVar("T")
+
+_current_deadline: ContextVar[Optional["RequestDeadline"]] = ContextVar("request_deadline", default=None)
+
+
+class RequestDeadline:
+    """Remaining budget of one request plus a timeline of the stages that spent it"""
+
+    def __init__(self, budget_ms: float, source: str, reserve_ms: float = 0.0):
+        self.budget_ms = budget_ms
+        self.source = source
+        self.reserve_ms = reserve_ms
+        self.started = time.perf_counter()
+        self.stages: List[Dict[str, Any]] = []
+        self.open_stages: Dict[int, Dict[str, Any]] = {}
+        self.exhausted_by: Optional[str] = None
+        self.served_by: Optional[str] = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def remaining(self) -> float:
+        """Seconds left for provider work, after the reserve kept for the fallback"""
+        return max(0.0, (self.budget_ms - self.reserve_ms - self.elapsed_ms()) / 1000)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def bound(self, timeout: float) -> float:
+        """A stage timeout cut down to the remaining budget"""
+        return min(timeout, self.remaining())
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage; one still running when the budget runs out is the one that used it up"""
+        with self._lock:
+            stage_id = self._next_id
+            self._next_id += 1
+            started_ms = self.elapsed_ms()
+            entry = {"stage": name, "start_ms": round(started_ms, 1)}
+            self.open_stages[stage_id] = entry
+        outcome = "ok"
+        try:
+            yield entry
+        except BaseException as e:
+            outcome = "cancelled" if isinstance(e, (asyncio.CancelledError, GeneratorExit)) else "error"
+            raise
+        finally:
+            with self._lock:
+                self.open_stages.pop(stage_id, None)
+                entry["duration_ms"] = round(self.elapsed_ms() - started_ms, 1)
+                entry.setdefault("outcome", outcome)
+                self.stages.append(entry)
+                if self.exhausted_by is None and self.expired():
+                    self.exhausted_by = name
+
+    def exhaust(self, fallback_stage: str):
+        """The budget ran out mid-flight: blame the most recently started stage still open"""
+        with self._lock:
+            if self.exhausted_by is not None:
+                return
+            if self.open_stages:
+                latest = max(self.open_stages.values(), key=lambda entry: entry["start_ms"])
+                self.exhausted_by = latest["stage"]
+            else:
+                self.exhausted_by = fallback_stage
+
+    def serve(self, served_by: str):
+        """Record what the response was built from: cache, cluster, a provider, mock or basic"""
+        self.served_by = served_by
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = list(self.stages) + [
+                {**entry, "duration_ms": round(self.elapsed_ms() - entry["start_ms"], 1), "outcome": "running"}
+                for entry in self.open_stages.values()
+            ]
+        return {
+            "budget_ms": self.budget_ms,
+            "source": self.source,
+            "elapsed_ms": round(self.elapsed_ms(), 1),
+            "remaining_ms": round(max(0.0, self.budget_ms - self.elapsed_ms()), 1),
+            "exhausted": self.exhausted_by is not None,
+            "exhausted_by": self.exhausted_by,
+            "served_by": self.served_by,
+            "stages": sorted(stages, key=lambda entry: entry["start_ms"])
+        }
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, one entry per stage"""
+        entries = []
+        for entry in self.report()["stages"]:
+            token = "".join(c if c.isalnum() or c in "-_" else "_" for c in entry["stage"])
+            entries.append(f'{token};dur={entry["duration_ms"]};desc="{entry["outcome"]}"'
+                           if entry["outcome"] != "ok" else f'{token};dur={entry["duration_ms"]}')
+        entries.append(f"total;dur={round(self.elapsed_ms(), 1)}")
+        return ", ".join(entries)
+
+
+class DeadlineStats:
+    """How often budgets ran out, which stage spent them and what was served instead"""
+
+    def __init__(self):
+        self.requests = 0
+        self.exhausted = 0
+        self.exhausted_by: Dict[str, int] = {}
+        self.served_by: Dict[str, int] = {}
+        self.from_header = 0
+        self._lock = threading.Lock()
+
+    def record(self, deadline: RequestDeadline):
+        with self._lock:
+            self.requests += 1
+            if deadline.source == "header":
+                self.from_header += 1
+            if deadline.exhausted_by is not None:
+                self.exhausted += 1
+                self.exhausted_by[deadline.exhausted_by] = self.exhausted_by.get(deadline.exhausted_by, 0) + 1
+            if deadline.served_by is not None:
+                self.served_by[deadline.served_by] = self.served_by.get(deadline.served_by, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "from_header": self.from_header,
+                "exhausted": self.exhausted,
+                "exhausted_rate": round(self.exhausted / self.requests, 3) if self.requests else None,
+                "exhausted_by": dict(self.exhausted_by),
+                "served_by": dict(self.served_by)
+            }
+
+
+def start_deadline(header_value: Optional[str], settings: Dict[str, Any]) -> Optional[RequestDeadline]:
+    """Open the deadline for the current request from its header, or the server default"""
+    if not settings["enabled"]:
+        return None
+    budget_ms, source = settings["default_ms"], "default"
+    if header_value:
+        try:
+            budget_ms = min(settings["max_ms"], max(settings["min_ms"], float(header_value)))
+            source = "header"
+        except ValueError:
+            print(f"Ignoring malformed deadline header: {header_value!r}")
+    deadline = RequestDeadline(budget_ms, source, settings["reserve_ms"])
+    _current_deadline.set(deadline)
+    return deadline
+
+
+def current_deadline() -> Optional[RequestDeadline]:
+    return _current_deadline.get()
+
+
+def remaining_seconds() -> Optional[float]:
+    """Seconds left in the current request's budget, or None outside a deadline"""
+    deadline = _current_deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+@contextmanager
+def deadline_stage(name: str):
+    """Time a stage against the current deadline; a no-op outside one"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        yield None
+        return
+    with deadline.stage(name) as entry:
+        yield entry
+
+
+async def without_deadline(fn: Callable[[], Awaitable[T]]) -> T:
+    """Run background work started from a request without inheriting its budget"""
+    token = _current_deadline.set(None)
+    try:
+        return await fn()
+    finally:
+        _current_deadline.reset(token)
+
+
+# Process-wide deadline outcomes
+deadline_stats = DeadlineStats()
@@ -0,0 +1,74 @@
+"""
+Single-flight Coalescing of Identical Provider Calls
+When a class submits together, many requests build the same prompt before the insight cache
+is filled; the first caller runs the provider call and the others await its parsed result
+"""
+
+import asyncio
+import hashlib
+from typing import Dict, Any, Callable, Awaitable, TypeVar
+
+T = TypeVar("T")
+
+
+def prompt_flight_key(prompt: str) -> str:
+    """Whitespace-insensitive hash of a prompt"""
+    normalized = " ".join(prompt.split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """At most one in-flight call per key; concurrent callers share its result or error
+
+    The call runs as its own task, so a caller that is cancelled (a client disconnect, a
+    lost hedge) does not cancel it for everyone else awaiting the same key.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.in_flight: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "calls": 0,
+            "executions": 0,
+            "coalesced": 0,
+            "shared_failures": 0
+        }
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+        if not task.cancelled():
+            # Mark the error retrieved even if every caller went away
+            task.exception()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        self.stats["calls"] += 1
+        task = self.in_flight.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done, key=key: self._done(key, done))
+            self.stats["executions"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if not leader:
+                self.stats["shared_failures"] += 1
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        calls = self.stats["calls"]
+        return {
+            **self.stats,
+            "coalesced_rate": round(self.stats["coalesced"] / calls, 3) if calls else None,
+            "in_flight": len(self.in_flight)
+        }
+
+
+# Recommendation insight requests, keyed on the normalized prompt
+insight_flights = SingleFlight("recommendation_insights")
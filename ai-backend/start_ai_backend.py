@@ -128,19 +128,9 @@ def test_endpoints():
         else:
             print("❌ Health check failed")
             
-        # Test Gemini generation
-        response = requests.post(f"{base_url}/test-gemini", timeout=10)
-        if response.status_code == 200:
-            test_data = response.json()
-            if test_data.get("success"):
-                print("✅ Gemini AI test passed")
-                print(f"   Model: {test_data.get('model_used')}")
-                print(f"   Sample question generated successfully")
-            else:
-                print("❌ Gemini AI test failed")
-                print(f"   Error: {test_data.get('message')}")
-        else:
-            print("❌ Gemini test endpoint failed")
+        # Benchmarks spend real quota, so they are left to POST /benchmark/providers
+        # or python provider_benchmark.py
+        print("💡 Benchmark providers with: python provider_benchmark.py")
             
     except requests.exceptions.RequestException as e:
         print(f"❌ Could not connect to server: {e}")
@@ -165,7 +155,7 @@ def main():
     print("\n✅ All checks passed! Starting server...")
     print("🌐 Server will be available at: http://localhost:8000")
     print("📚 API Documentation: http://localhost:8000/docs")
-    print("🧪 Test Gemini: http://localhost:8000/test-gemini")
+    print("🧪 Benchmark providers: POST http://localhost:8000/benchmark/providers")
     print("\n⏹️  Press Ctrl+C to stop the server")
     
     # Start server
@@ -0,0 +1,224 @@
+"""
+Faceted Filtering for the Streams Catalog
+Parses catalog strings (duration, salary, exams...) into structured fields at load time
+and keeps bitmap indexes so facet filters and facet counts are a few integer operations
+"""
+
+import bisect
+import re
+from typing import List, Dict, Any, Optional, Tuple
+
+from streams_database import get_all_streams, get_catalog_version
+
+_YEARS_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(?:\s*-\s*(\d+(?:\.\d+)?))?\s*years?", re.IGNORECASE)
+_LPA_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(?:\s*-\s*(\d+(?:\.\d+)?))?\+?\s*LPA", re.IGNORECASE)
+
+# Facets that are filtered by "any of these values"
+CATEGORICAL_FACETS = ["category", "growth_prospects", "entrance_exams"]
+
+
+def parse_duration_years(duration: str) -> Tuple[Optional[float], Optional[float]]:
+    """Parse "4 years (B.Tech)", "3-4 years" or "3 years (BA) + 2 years (MA)" into (min, max) years"""
+    min_years = 0.0
+    max_years = 0.0
+    found = False
+    for match in _YEARS_PATTERN.finditer(duration or ""):
+        low = float(match.group(1))
+        high = float(match.group(2)) if match.group(2) else low
+        min_years += low
+        max_years += high
+        found = True
+    return (min_years, max_years) if found else (None, None)
+
+
+def parse_salary_lpa(salary: str) -> Tuple[Optional[float], Optional[float]]:
+    """Parse "₹4-12 LPA" or "₹25-50+ LPA" into (min, max) lakhs per annum"""
+    match = _LPA_PATTERN.search(salary or "")
+    if not match:
+        return None, None
+    low = float(match.group(1))
+    high = float(match.group(2)) if match.group(2) else low
+    return low, high
+
+
+def normalize_facet_value(value: str) -> str:
+    """Normalize a facet value for lookups ("JEE Main (for Agri Engg)" -> "jee main")"""
+    return re.sub(r"\s*\(.*?\)", "", value or "").strip().lower()
+
+
+def _bits(mask: int) -> List[int]:
+    """Positions of the set bits in a bitmap"""
+    positions = []
+    while mask:
+        low_bit = mask & -mask
+        positions.append(low_bit.bit_length() - 1)
+        mask ^= low_bit
+    return positions
+
+
+class StreamFacetIndex:
+    """Bitmap indexes over the parsed streams catalog
+
+    Each stream gets a bit position; every facet value maps to an int bitmap of the
+    streams carrying it. Numeric facets keep cumulative bitmaps so a range filter is a
+    single bisect plus one lookup.
+    """
+
+    def __init__(self, streams: List[Dict[str, Any]], catalog_version: str):
+        self.catalog_version = catalog_version
+        self.streams = streams
+        self.records = [self._parse_stream(stream) for stream in streams]
+        self.records_by_name = {record["name"]: record for record in self.records}
+        self.all_mask = (1 << len(streams)) - 1
+
+        # value key -> bitmap, value key -> display label
+        self.categorical: Dict[str, Dict[str, int]] = {facet: {} for facet in CATEGORICAL_FACETS}
+        self.labels: Dict[str, Dict[str, str]] = {facet: {} for facet in CATEGORICAL_FACETS}
+        for position, record in enumerate(self.records):
+            for facet in CATEGORICAL_FACETS:
+                values = record[facet] if isinstance(record[facet], list) else [record[facet]]
+                for value in values:
+                    key = normalize_facet_value(value)
+                    if not key:
+                        continue
+                    self.categorical[facet][key] = self.categorical[facet].get(key, 0) | (1 << position)
+                    self.labels[facet].setdefault(key, re.sub(r"\s*\(.*?\)", "", value).strip())
+
+        # Shortest route duration: streams with duration_min_years <= x
+        self._duration_thresholds, self._duration_masks = self._cumulative(
+            "duration_min_years", ascending=True
+        )
+        # Entry salary ceiling: streams whose entry range reaches at least x
+        self._salary_thresholds, self._salary_masks = self._cumulative(
+            "entry_salary_max_lpa", ascending=False
+        )
+
+    @staticmethod
+    def _parse_stream(stream: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract the structured fields used for faceting"""
+        duration_min, duration_max = parse_duration_years(stream.get("duration", ""))
+        salary = stream.get("salary_range", {})
+        entry_min, entry_max = parse_salary_lpa(salary.get("entry_level", ""))
+        _, senior_max = parse_salary_lpa(salary.get("senior_level", ""))
+        return {
+            "name": stream["name"],
+            "category": stream.get("category", ""),
+            "growth_prospects": stream.get("growth_prospects", ""),
+            "entrance_exams": stream.get("entrance_exams", []),
+            "duration_min_years": duration_min,
+            "duration_max_years": duration_max,
+            "entry_salary_min_lpa": entry_min,
+            "entry_salary_max_lpa": entry_max,
+            "senior_salary_max_lpa": senior_max,
+        }
+
+    def _cumulative(self, field: str, ascending: bool) -> Tuple[List[float], List[int]]:
+        """Build sorted thresholds and cumulative bitmaps for a numeric field
+
+        ascending=True:  masks[i] holds streams with value <= thresholds[i]
+        ascending=False: masks[i] holds streams with value >= thresholds[i]
+        """
+        by_value: Dict[float, int] = {}
+        for position, record in enumerate(self.records):
+            value = record[field]
+            if value is not None:
+                by_value[value] = by_value.get(value, 0) | (1 << position)
+
+        thresholds = sorted(by_value)
+        masks = [0] * len(thresholds)
+        running = 0
+        order = range(len(thresholds)) if ascending else reversed(range(len(thresholds)))
+        for i in order:
+            running |= by_value[thresholds[i]]
+            masks[i] = running
+        return thresholds, masks
+
+    def _at_most(self, thresholds: List[float], masks: List[int], limit: float) -> int:
+        i = bisect.bisect_right(thresholds, limit) - 1
+        return masks[i] if i >= 0 else 0
+
+    def _at_least(self, thresholds: List[float], masks: List[int], limit: float) -> int:
+        i = bisect.bisect_left(thresholds, limit)
+        return masks[i] if i < len(thresholds) else 0
+
+    def _facet_masks(self, filters: Dict[str, Any]) -> Dict[str, int]:
+        """Turn a filters dict into one bitmap per active facet"""
+        masks = {}
+        facet_params = {
+            "category": filters.get("categories") or filters.get("category"),
+            "growth_prospects": filters.get("growth_prospects"),
+            "entrance_exams": filters.get("entrance_exams"),
+        }
+        for facet, values in facet_params.items():
+            if not values:
+                continue
+            if isinstance(values, str):
+                values = [values]
+            mask = 0
+            for value in values:
+                mask |= self.categorical[facet].get(normalize_facet_value(value), 0)
+            masks[facet] = mask
+
+        if filters.get("max_duration_years") is not None:
+            masks["duration"] = self._at_most(
+                self._duration_thresholds, self._duration_masks, float(filters["max_duration_years"])
+            )
+        if filters.get("min_entry_salary_lpa") is not None:
+            masks["entry_salary"] = self._at_least(
+                self._salary_thresholds, self._salary_masks, float(filters["min_entry_salary_lpa"])
+            )
+        return masks
+
+    def filter(self, filters: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Apply facet filters and return (matching streams, facet counts)
+
+        Facet counts for each facet are computed against all *other* active filters,
+        so the UI can show how many streams selecting another value would give.
+        """
+        masks = self._facet_masks(filters or {})
+
+        result_mask = self.all_mask
+        for mask in masks.values():
+            result_mask &= mask
+
+        facets: Dict[str, Any] = {}
+        for facet in CATEGORICAL_FACETS:
+            base_mask = self.all_mask
+            for name, mask in masks.items():
+                if name != facet:
+                    base_mask &= mask
+            facets[facet] = sorted(
+                (
+                    {"value": self.labels[facet][key], "count": bin(bitmap & base_mask).count("1")}
+                    for key, bitmap in self.categorical[facet].items()
+                ),
+                key=lambda item: (-item["count"], item["value"])
+            )
+
+        facets["duration_years"] = self._range_summary(result_mask, "duration_min_years", "duration_max_years")
+        facets["entry_salary_lpa"] = self._range_summary(result_mask, "entry_salary_min_lpa", "entry_salary_max_lpa")
+
+        matching = [self.streams[position] for position in _bits(result_mask)]
+        return matching, facets
+
+    def _range_summary(self, mask: int, min_field: str, max_field: str) -> Dict[str, Optional[float]]:
+        """Min/max of a numeric facet across the filtered streams"""
+        lows = [self.records[p][min_field] for p in _bits(mask) if self.records[p][min_field] is not None]
+        highs = [self.records[p][max_field] for p in _bits(mask) if self.records[p][max_field] is not None]
+        return {"min": min(lows) if lows else None, "max": max(highs) if highs else None}
+
+    def get_parsed_fields(self, stream_name: str) -> Dict[str, Any]:
+        """Structured fields parsed for a stream (empty dict if unknown)"""
+        return self.records_by_name.get(stream_name, {})
+
+
+_facet_index: Optional[StreamFacetIndex] = None
+
+
+def get_facet_index() -> StreamFacetIndex:
+    """Get the facet index, rebuilding it when the catalog version changes"""
+    global _facet_index
+    version = get_catalog_version()
+    if _facet_index is None or _facet_index.catalog_version != version:
+        _facet_index = StreamFacetIndex(get_all_streams(), version)
+    return _facet_index
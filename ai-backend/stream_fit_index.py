@@ -0,0 +1,199 @@
+"""
+Reverse Matching Index: which students fit a given stream
+Stores each student's top-k stream scores in denormalized form when a profile is written,
+so "strong fits for Nursing" is a sorted scan of a (stream, score) index with keyset pagination
+"""
+
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+from pymongo import ASCENDING, DESCENDING, DeleteMany, UpdateOne
+
+from db import answers_collection, stream_fit_collection
+from streams_database import get_catalog_version, search_streams_by_requirements
+
+# How many of a student's best streams are indexed
+TOP_K_STREAMS = 5
+
+_indexes_ready = False
+
+
+def ensure_indexes():
+    """Create the scan index (stream, score) and the per-student lookup index once per process"""
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    stream_fit_collection.create_index(
+        [("stream", ASCENDING), ("score", DESCENDING), ("user_id", ASCENDING)],
+        name="stream_score_scan"
+    )
+    stream_fit_collection.create_index([("user_id", ASCENDING)], name="user_lookup")
+    answers_collection.create_index([("stream_scores_catalog_version", ASCENDING)], name="stream_scores_version")
+    _indexes_ready = True
+
+
+def compute_top_stream_scores(trait_scores: Dict[str, float], academic_performance: Dict[str, float],
+                              k: int = TOP_K_STREAMS) -> List[Dict[str, Any]]:
+    """Score every catalog stream for a student and keep the k best"""
+    matches = search_streams_by_requirements(trait_scores, academic_performance, threshold=0.0)
+    return [
+        {
+            "stream": match["stream_data"]["name"],
+            "category": match["stream_data"]["category"],
+            "rank": rank,
+            "score": round(match["match_score"] * 100, 2),
+            "personality_match": round(match["personality_match"] * 100, 2),
+            "academic_match": round(match["academic_match"] * 100, 2)
+        }
+        for rank, match in enumerate(matches[:k], start=1)
+    ]
+
+
+def fit_row_writes(user_id: str, top_scores: List[Dict[str, Any]], catalog_version: str,
+                   now: datetime) -> List[Any]:
+    """Upsert a student's rows by (user_id, stream) and drop only streams that left the top-k,
+    so a concurrent scan never sees the student missing from the index"""
+    writes: List[Any] = [
+        UpdateOne(
+            {"user_id": user_id, "stream": entry["stream"]},
+            {"$set": {**entry, "catalog_version": catalog_version, "updated_at": now}},
+            upsert=True
+        )
+        for entry in top_scores
+    ]
+    writes.append(DeleteMany({"user_id": user_id, "stream": {"$nin": [entry["stream"] for entry in top_scores]}}))
+    return writes
+
+
+def index_student(user_id: str, trait_scores: Dict[str, float],
+                  academic_performance: Dict[str, float]) -> List[Dict[str, Any]]:
+    """Recompute and store a student's top-k stream scores (profile field + reverse index rows)"""
+    ensure_indexes()
+    catalog_version = get_catalog_version()
+    top_scores = compute_top_stream_scores(trait_scores, academic_performance or {})
+    now = datetime.now(timezone.utc)
+
+    answers_collection.update_one(
+        {"user_id": user_id},
+        {"$set": {
+            "top_stream_scores": top_scores,
+            "stream_scores_catalog_version": catalog_version
+        }}
+    )
+
+    stream_fit_collection.bulk_write(fit_row_writes(user_id, top_scores, catalog_version, now), ordered=False)
+    return top_scores
+
+
+def refresh_stale_scores(batch_size: int = 500, max_batches: Optional[int] = None) -> Dict[str, Any]:
+    """Recompute scores for profiles indexed under an older catalog version, one batch at a time
+
+    Profiles are processed in user_id order so an interrupted refresh simply resumes:
+    anything already recomputed carries the current version and is no longer matched.
+    """
+    ensure_indexes()
+    catalog_version = get_catalog_version()
+    stale_query = {
+        "trait_scores": {"$exists": True},
+        "stream_scores_catalog_version": {"$ne": catalog_version}
+    }
+    projection = {"user_id": 1, "trait_scores": 1, "academic_performance": 1}
+
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        docs = list(answers_collection.find(stale_query, projection)
+                    .sort("user_id", ASCENDING).limit(batch_size))
+        if not docs:
+            break
+
+        now = datetime.now(timezone.utc)
+        profile_updates = []
+        fit_writes = []
+        for doc in docs:
+            user_id = doc.get("user_id")
+            try:
+                top_scores = compute_top_stream_scores(doc["trait_scores"], doc.get("academic_performance") or {})
+            except Exception as e:
+                # Still stamp the version so a malformed profile cannot stall the refresh
+                print(f"Failed to score profile {doc.get('user_id')}: {e}")
+                top_scores = []
+            profile_updates.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"top_stream_scores": top_scores, "stream_scores_catalog_version": catalog_version}}
+            ))
+            # A profile without a user cannot be indexed; it is still stamped above
+            if user_id:
+                fit_writes.extend(fit_row_writes(user_id, top_scores, catalog_version, now))
+
+        if fit_writes:
+            stream_fit_collection.bulk_write(fit_writes, ordered=False)
+        answers_collection.bulk_write(profile_updates, ordered=False)
+
+        processed += len(docs)
+        batches += 1
+
+    return {
+        "catalog_version": catalog_version,
+        "profiles_refreshed": processed,
+        "batches": batches,
+        "remaining_stale": count_stale_profiles()
+    }
+
+
+def count_stale_profiles() -> int:
+    return answers_collection.count_documents({
+        "trait_scores": {"$exists": True},
+        "stream_scores_catalog_version": {"$ne": get_catalog_version()}
+    })
+
+
+def encode_cursor(score: float, user_id: str) -> str:
+    return f"{score}:{user_id}"
+
+
+def decode_cursor(cursor: str) -> Optional[Dict[str, Any]]:
+    try:
+        score, user_id = cursor.split(":", 1)
+        return {"score": float(score), "user_id": user_id}
+    except (ValueError, AttributeError):
+        return None
+
+
+def find_students_for_stream(stream: str, limit: int = 50, cursor: Optional[str] = None,
+                             min_score: Optional[float] = None,
+                             user_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Students ranked by fit for a stream, paginated by (score, user_id) keyset
+
+    The cursor is the last row of the previous page, so each page is an index range scan
+    rather than a growing skip().
+    """
+    ensure_indexes()
+    query: Dict[str, Any] = {"stream": stream}
+    if min_score is not None:
+        query["score"] = {"$gte": min_score}
+    if user_ids:
+        query["user_id"] = {"$in": user_ids}
+
+    after = decode_cursor(cursor) if cursor else None
+    if after:
+        keyset = {"$or": [
+            {"score": {"$lt": after["score"]}},
+            {"score": after["score"], "user_id": {"$gt": after["user_id"]}}
+        ]}
+        query = {"$and": [query, keyset]}
+
+    rows = list(
+        stream_fit_collection.find(query, {"_id": 0})
+        .sort([("score", DESCENDING), ("user_id", ASCENDING)])
+        .limit(limit + 1)
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "stream": stream,
+        "students": rows,
+        "next_cursor": encode_cursor(rows[-1]["score"], rows[-1]["user_id"]) if has_more and rows else None,
+        "catalog_version": get_catalog_version()
+    }
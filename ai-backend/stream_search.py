@@ -0,0 +1,181 @@
+"""
+Full-Text Search over the Streams Catalog
+Fits a TF-IDF vectorizer once per catalog version and keeps the sparse document matrix
+in memory, so a query is one sparse dot product plus a top-k selection
+"""
+
+import re
+import numpy as np
+from typing import List, Dict, Any, Optional
+from sklearn.feature_extraction.text import TfidfVectorizer, ENGLISH_STOP_WORDS
+
+from streams_database import get_all_streams, get_catalog_version, search_streams_by_requirements
+
+# Catalog fields that are searchable, with a repeat factor acting as a field boost
+SEARCHABLE_FIELDS = {
+    "name": 3,
+    "category": 1,
+    "description": 2,
+    "career_paths": 2,
+    "skills_required": 1,
+    "jk_opportunities": 1,
+    "future_trends": 1,
+}
+
+
+_TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def _tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stop words removed and plurals folded ("computers" -> "computer")"""
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        if token in ENGLISH_STOP_WORDS:
+            continue
+        if len(token) > 4 and token.endswith("ies"):
+            token = token[:-3] + "y"
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _field_text(value: Any) -> str:
+    if isinstance(value, list):
+        return " . ".join(str(item) for item in value)
+    return str(value or "")
+
+
+class StreamTextIndex:
+    """TF-IDF index with one document per stream and one per (stream, career path)"""
+
+    def __init__(self, streams: List[Dict[str, Any]], catalog_version: str):
+        self.catalog_version = catalog_version
+        self.streams = streams
+
+        documents = []
+        self.doc_types: List[str] = []
+        self.doc_streams: List[int] = []
+        self.doc_titles: List[str] = []
+
+        for position, stream in enumerate(streams):
+            parts = []
+            for field, boost in SEARCHABLE_FIELDS.items():
+                parts.extend([_field_text(stream.get(field))] * boost)
+            documents.append(" . ".join(parts))
+            self.doc_types.append("stream")
+            self.doc_streams.append(position)
+            self.doc_titles.append(stream["name"])
+
+            # Careers get their own documents so "data scientist" ranks the career itself
+            for career in stream.get("career_paths", []):
+                documents.append(" . ".join([career, career, stream["name"], stream.get("description", "")]))
+                self.doc_types.append("career")
+                self.doc_streams.append(position)
+                self.doc_titles.append(career)
+
+        self.vectorizer = TfidfVectorizer(
+            tokenizer=_tokenize,
+            token_pattern=None,
+            lowercase=False,
+            ngram_range=(1, 2),
+            sublinear_tf=True,
+            strip_accents="unicode"
+        )
+        # Rows are L2-normalised, so a dot product with a query vector is cosine similarity
+        self.matrix = self.vectorizer.fit_transform(documents).tocsr()
+        self.doc_types_array = np.array(self.doc_types)
+        self.doc_streams_array = np.array(self.doc_streams)
+
+    def score(self, query: str) -> np.ndarray:
+        """Cosine similarity of every document against the query"""
+        query_vector = self.vectorizer.transform([query])
+        return (self.matrix @ query_vector.T).toarray().ravel()
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, candidates: np.ndarray, k: int) -> np.ndarray:
+        """Indices (into scores) of the k best candidates with a non-zero score"""
+        candidates = candidates[scores[candidates] > 0]
+        if len(candidates) > k:
+            partition = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[partition]
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def search(self, query: str, top_k: int = 10, doc_type: str = "stream",
+               allowed_streams: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Return the top-k documents of a type as dicts with text relevance"""
+        scores = self.score(query)
+        candidates = np.flatnonzero(self.doc_types_array == doc_type)
+
+        if allowed_streams is not None:
+            allowed = set(allowed_streams)
+            allowed_positions = [i for i, stream in enumerate(self.streams) if stream["name"] in allowed]
+            candidates = candidates[np.isin(self.doc_streams_array[candidates], allowed_positions)]
+
+        hits = []
+        for doc in self._top_k(scores, candidates, top_k):
+            stream = self.streams[self.doc_streams[doc]]
+            hits.append({
+                "title": self.doc_titles[doc],
+                "type": self.doc_types[doc],
+                "stream": stream["name"],
+                "stream_data": stream,
+                "text_score": float(scores[doc])
+            })
+        return hits
+
+
+_text_index: Optional[StreamTextIndex] = None
+
+
+def get_text_index() -> StreamTextIndex:
+    """Get the TF-IDF index, refitting it when the catalog version changes"""
+    global _text_index
+    version = get_catalog_version()
+    if _text_index is None or _text_index.catalog_version != version:
+        _text_index = StreamTextIndex(get_all_streams(), version)
+    return _text_index
+
+
+def search_streams_by_text(query: str, top_k: int = 10,
+                           trait_scores: Optional[Dict[str, float]] = None,
+                           academic_performance: Optional[Dict[str, float]] = None,
+                           text_weight: float = 0.6,
+                           allowed_streams: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Search streams and careers by free text, optionally blended with the trait match score
+
+    The blended score is ``text_weight * relevance + (1 - text_weight) * match_score``,
+    where relevance is the text score normalised by the best hit of the query.
+    """
+    index = get_text_index()
+    # Over-fetch streams so re-ranking by the blended score has something to reorder
+    stream_hits = index.search(query, top_k=top_k * 2, doc_type="stream",
+                               allowed_streams=allowed_streams)
+    career_hits = index.search(query, top_k=top_k, doc_type="career", allowed_streams=allowed_streams)
+
+    blended = bool(trait_scores and academic_performance)
+    if stream_hits:
+        best = stream_hits[0]["text_score"]
+        for hit in stream_hits:
+            hit["relevance"] = hit["text_score"] / best if best > 0 else 0.0
+
+    if blended and stream_hits:
+        matches = search_streams_by_requirements(
+            trait_scores, academic_performance, threshold=0.0,
+            streams=[hit["stream_data"] for hit in stream_hits]
+        )
+        match_scores = {m["stream_data"]["name"]: m["match_score"] for m in matches}
+        for hit in stream_hits:
+            hit["match_score"] = match_scores.get(hit["stream"], 0.0)
+            hit["score"] = text_weight * hit["relevance"] + (1 - text_weight) * hit["match_score"]
+        stream_hits.sort(key=lambda hit: hit["score"], reverse=True)
+    else:
+        for hit in stream_hits:
+            hit["score"] = hit["relevance"]
+
+    return {
+        "catalog_version": index.catalog_version,
+        "blended": blended,
+        "streams": stream_hits[:top_k],
+        "careers": career_hits
+    }
@@ -4,6 +4,9 @@ Contains detailed information about career streams, requirements, and opportunit
 Specifically tailored for Indian students, with J&K context
 """
 
+import hashlib
+import json
+
 COMPREHENSIVE_STREAMS_DATABASE = {
     "engineering_technology": {
         "computer_science_engineering": {
@@ -615,10 +618,29 @@ def get_all_streams():
             all_streams.append(stream)
     return all_streams
 
-def search_streams_by_requirements(trait_scores, academic_performance, threshold=0.6):
-    """Search streams that match given requirements"""
+_catalog_version = None
+
+def get_catalog_version():
+    """Get a content hash of the streams database, used to invalidate derived indexes"""
+    global _catalog_version
+    if _catalog_version is None:
+        refresh_catalog_version()
+    return _catalog_version
+
+def refresh_catalog_version():
+    """Recompute the catalog version after the database has been modified in place"""
+    global _catalog_version
+    payload = json.dumps(COMPREHENSIVE_STREAMS_DATABASE, sort_keys=True, ensure_ascii=False)
+    _catalog_version = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+    return _catalog_version
+
+def search_streams_by_requirements(trait_scores, academic_performance, threshold=0.6, streams=None):
+    """Search streams that match given requirements
+
+    If ``streams`` is given only those streams are scored (e.g. after facet filtering).
+    """
     matching_streams = []
-    all_streams = get_all_streams()
+    all_streams = get_all_streams() if streams is None else streams
     
     for stream in all_streams:
         # Calculate personality match
@@ -0,0 +1,205 @@
+"""
+Student Similarity Index for "students like me" lookups
+Keeps trait + academic vectors of stored profiles in one in-memory float32 matrix
+that is updated in place when a profile is written and scanned with a single BLAS call
+"""
+
+import threading
+import time
+import numpy as np
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from db import answers_collection
+
+TRAIT_NAMES = [
+    "analytical_thinking",
+    "creativity",
+    "leadership",
+    "social_skills",
+    "technical_aptitude",
+    "entrepreneurial_spirit",
+    "research_orientation",
+    "helping_others"
+]
+
+# Academic dimensions; each maps the subject names students actually submit onto one slot
+SUBJECT_GROUPS = {
+    "mathematics": ["mathematics", "maths", "math", "statistics"],
+    "physics": ["physics"],
+    "chemistry": ["chemistry"],
+    "biology": ["biology", "botany", "zoology"],
+    "english": ["english", "literature"],
+    "computer_science": ["computer science", "computer_science", "informatics practices", "it"],
+    "commerce": ["economics", "accountancy", "business studies", "commerce"],
+    "humanities": ["history", "geography", "political science", "sociology", "psychology"]
+}
+
+# Academics are on a 0-100 scale; this scales them so they weigh less than the trait profile
+ACADEMIC_WEIGHT = 0.5
+
+# Re-read profiles written by other workers at most this often
+SYNC_INTERVAL_SECONDS = 60
+
+_SUBJECT_LOOKUP = {alias: group for group, aliases in SUBJECT_GROUPS.items() for alias in aliases}
+
+
+def build_profile_vector(trait_scores: Dict[str, float], academic_performance: Dict[str, float]) -> np.ndarray:
+    """Encode a profile as [8 traits in 0-1] + [weighted subject groups] + [weighted average]"""
+    traits = [float(trait_scores.get(trait, 0.5)) for trait in TRAIT_NAMES]
+
+    average = (sum(academic_performance.values()) / len(academic_performance)) if academic_performance else 60.0
+    groups: Dict[str, List[float]] = {}
+    for subject, score in (academic_performance or {}).items():
+        group = _SUBJECT_LOOKUP.get(subject.strip().lower().replace("_", " "))
+        if group:
+            groups.setdefault(group, []).append(float(score))
+    academics = [
+        (sum(groups[group]) / len(groups[group]) if group in groups else average) / 100.0 * ACADEMIC_WEIGHT
+        for group in SUBJECT_GROUPS
+    ]
+    academics.append(average / 100.0 * ACADEMIC_WEIGHT)
+
+    return np.array(traits + academics, dtype=np.float32)
+
+
+class StudentSimilarityIndex:
+    """Brute-force k-NN over a growable float32 matrix
+
+    At ~17 dimensions a ball tree gives no pruning benefit over one matrix-vector product,
+    and a flat matrix can be updated row by row without rebuilding. 500k profiles take ~35MB.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self.dimensions = len(TRAIT_NAMES) + len(SUBJECT_GROUPS) + 1
+        self.vectors = np.zeros((initial_capacity, self.dimensions), dtype=np.float32)
+        self.norms = np.zeros(initial_capacity, dtype=np.float32)
+        self.user_ids: List[str] = []
+        self.top_streams: List[Optional[str]] = []
+        self.rows: Dict[str, int] = {}
+        self.size = 0
+
+        self.loaded = False
+        self.last_sync: Optional[datetime] = None
+        self._last_sync_check = 0.0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _grow(self):
+        capacity = self.vectors.shape[0] * 2
+        vectors = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        norms = np.zeros(capacity, dtype=np.float32)
+        norms[:self.size] = self.norms[:self.size]
+        self.vectors, self.norms = vectors, norms
+
+    def upsert(self, user_id: str, trait_scores: Dict[str, float],
+               academic_performance: Dict[str, float], top_stream: Optional[str] = None):
+        """Insert or overwrite a student's vector"""
+        vector = build_profile_vector(trait_scores, academic_performance)
+        with self._lock:
+            row = self.rows.get(user_id)
+            if row is None:
+                if self.size == self.vectors.shape[0]:
+                    self._grow()
+                row = self.size
+                self.rows[user_id] = row
+                self.user_ids.append(user_id)
+                self.top_streams.append(top_stream)
+                self.size += 1
+            else:
+                self.top_streams[row] = top_stream
+            self.vectors[row] = vector
+            self.norms[row] = float(vector @ vector)
+
+    def _load_profiles(self, query: Dict[str, Any]) -> int:
+        projection = {
+            "user_id": 1,
+            "trait_scores": 1,
+            "academic_performance": 1,
+            "recommended_streams": {"$slice": 1},
+            "updated_at": 1
+        }
+        count = 0
+        newest = self.last_sync
+        for doc in answers_collection.find(query, projection):
+            if not doc.get("user_id") or not doc.get("trait_scores"):
+                continue
+            streams = doc.get("recommended_streams") or []
+            top_stream = streams[0].get("stream") if streams else None
+            self.upsert(doc["user_id"], doc["trait_scores"], doc.get("academic_performance") or {}, top_stream)
+            if doc.get("updated_at") and (newest is None or doc["updated_at"] > newest):
+                newest = doc["updated_at"]
+            count += 1
+        self.last_sync = newest
+        return count
+
+    def ensure_loaded(self):
+        """Bulk-load stored profiles on first use, then pick up other workers' writes periodically"""
+        if self.loaded and time.monotonic() - self._last_sync_check <= SYNC_INTERVAL_SECONDS:
+            return
+        with self._load_lock:
+            query = {"trait_scores": {"$exists": True}}
+            if not self.loaded:
+                self._load_profiles(query)
+                self.loaded = True
+            elif time.monotonic() - self._last_sync_check > SYNC_INTERVAL_SECONDS:
+                if self.last_sync:
+                    query["updated_at"] = {"$gt": self.last_sync}
+                self._load_profiles(query)
+            self._last_sync_check = time.monotonic()
+
+    def query(self, vector: np.ndarray, k: int = 20,
+              exclude_user_id: Optional[str] = None) -> List[Tuple[str, float, Optional[str]]]:
+        """Return (user_id, distance, top_stream) for the k nearest stored profiles"""
+        size = self.size
+        if size == 0:
+            return []
+        vectors = self.vectors[:size]
+        # ||a - b||^2 = ||a||^2 + ||b||^2 - 2ab, one GEMV for the whole matrix
+        distances = self.norms[:size] + float(vector @ vector) - 2.0 * (vectors @ vector)
+
+        exclude_row = self.rows.get(exclude_user_id) if exclude_user_id else None
+        if exclude_row is not None:
+            distances[exclude_row] = np.inf
+
+        k = min(k, size - (1 if exclude_row is not None else 0))
+        if k <= 0:
+            return []
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [
+            (self.user_ids[row], float(np.sqrt(max(distances[row], 0.0))), self.top_streams[row])
+            for row in nearest
+        ]
+
+    def get_vector(self, user_id: str) -> Optional[np.ndarray]:
+        row = self.rows.get(user_id)
+        return self.vectors[row].copy() if row is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "profiles_indexed": self.size,
+            "dimensions": self.dimensions,
+            "capacity": int(self.vectors.shape[0]),
+            "memory_mb": round(self.vectors.nbytes / 1024 / 1024, 2),
+            "loaded": self.loaded,
+            "last_sync": self.last_sync.isoformat() if self.last_sync else None
+        }
+
+
+def summarize_neighbour_choices(neighbours: List[Tuple[str, float, Optional[str]]]) -> List[Dict[str, Any]]:
+    """Aggregate neighbours' top streams into "students like you chose" percentages"""
+    counts: Dict[str, int] = {}
+    for _, _, stream in neighbours:
+        if stream:
+            counts[stream] = counts.get(stream, 0) + 1
+    total = sum(counts.values())
+    return [
+        {"stream": stream, "students": count, "percentage": round(count / total * 100, 1)}
+        for stream, count in sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+
+# Global index instance
+student_index = StudentSimilarityIndex()
@@ -0,0 +1,15 @@
+"""
+Test setup: the ai-backend modules are flat, so tests import them from the parent directory;
+Mongo is replaced by mongomock before db.py creates its client
+"""
+
+import os
+import sys
+
+import mongomock
+import pymongo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["MONGODB_URI"] = "mongodb://localhost:27017"
+os.environ.setdefault("AI_LOG_ROUTING", "false")
+pymongo.MongoClient = mongomock.MongoClient
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from ai_config import AIProvider, ai_config
+import batch_enrichment
+from batch_enrichment import BatchEnrichmentJob
+from db import recommendations_collection
+from fake_providers import reply_for
+from llm_ledger import _ledger_scope
+from provider_clients import LLMResponse
+from psychometric_ai import psychometric_ai
+
+
+class FakeBatchClient:
+    """Answers batch prompts like the fake provider service, remembering the ledger scope"""
+
+    def __init__(self):
+        self.scopes = []
+
+    async def agenerate(self, prompt, **options):
+        self.scopes.append(dict(_ledger_scope.get() or {}))
+        return LLMResponse(text=reply_for(prompt), provider="grok", model="grok-beta", latency_ms=1.0,
+                           prompt_tokens=len(prompt) // 4, completion_tokens=400)
+
+
+def insert_pending(user_id, trait_scores, academics):
+    recommendations_collection.insert_one({
+        "user_id": user_id,
+        "assessment_id": f"{user_id}_1",
+        "recommended_streams": psychometric_ai._get_basic_recommendations(trait_scores, academics),
+        "trait_scores_snapshot": trait_scores,
+        "academic_performance_snapshot": academics,
+        "insights_pending": True,
+        "generated_at": datetime.utcnow() - timedelta(minutes=5)
+    })
+
+
+def test_run_enriches_pending_documents(monkeypatch):
+    recommendations_collection.delete_many({})
+    students = {
+        "batch_a": {"analytical_thinking": 0.91, "technical_aptitude": 0.87, "research_orientation": 0.62},
+        "batch_b": {"helping_others": 0.93, "social_skills": 0.81, "research_orientation": 0.71},
+        "batch_c": {"creativity": 0.94, "entrepreneurial_spirit": 0.77, "leadership": 0.58},
+    }
+    for user_id, trait_scores in students.items():
+        insert_pending(user_id, trait_scores, {"Mathematics": 81, "Biology": 74, "English": 69})
+
+    client = FakeBatchClient()
+    monkeypatch.setattr(batch_enrichment.provider_router, "plan",
+                        lambda task, options, *args: [(AIProvider.GROK, {})])
+    monkeypatch.setattr(batch_enrichment.provider_registry, "get_client", lambda provider: client)
+
+    job = BatchEnrichmentJob({**ai_config.batch_enrichment, "batch_size": 8})
+    summary = asyncio.run(job.run())
+
+    assert summary["claimed"] == 3
+    assert summary["enriched"] == 3
+    assert summary["failed"] == 0
+    assert summary["batches"] == 1
+    assert recommendations_collection.count_documents({"insights_pending": True}) == 0
+    doc = recommendations_collection.find_one({"user_id": "batch_a"})
+    assert doc["recommended_streams"][0].get("ai_insights")
+    # Provider calls of the run are ledgered under the job, not a user
+    assert client.scopes == [{"endpoint": "batch_enrichment", "user_id": None}]
+    assert not job.running
+
+
+def test_run_returns_none_while_a_run_is_in_progress():
+    job = BatchEnrichmentJob(ai_config.batch_enrichment)
+
+    async def overlapping():
+        async with job._lock:
+            return await job.run()
+
+    assert asyncio.run(overlapping()) is None
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from llm_output import IncrementalArrayParser, LLMOutputError, extract_json, parse_analysis, parse_question
+
+ANALYSIS = {
+    "enhanced_recommendations": [
+        {"stream": "Engineering", "personality_fit": "Strong analytical profile", "confidence": 0.9},
+        {"stream": "Medicine", "personality_fit": "Cares for others", "next_steps": ["Take NEET", "Shadow a doctor"]},
+    ],
+    "overall_guidance": "Keep Mathematics strong."
+}
+
+
+def test_parse_analysis_clean_reply():
+    analysis = parse_analysis(json.dumps(ANALYSIS))
+
+    assert [item["stream"] for item in analysis["enhanced_recommendations"]] == ["Engineering", "Medicine"]
+    assert analysis["overall_guidance"] == "Keep Mathematics strong."
+    medicine = analysis["enhanced_recommendations"][1]
+    assert medicine["next_steps"] == "Take NEET; Shadow a doctor"
+    assert medicine["confidence"] == 0.8
+
+
+def test_parse_analysis_extracts_from_fences_and_prose():
+    reply = "Here is the analysis you asked for:\n```json\n" + json.dumps(ANALYSIS) + "\n```\nGood luck!"
+
+    assert extract_json(reply, dict)[1] == "extracted"
+    assert len(parse_analysis(reply)["enhanced_recommendations"]) == 2
+
+
+def test_parse_analysis_repairs_truncated_reply():
+    text = json.dumps(ANALYSIS)
+    # Cut inside the second stream's object, as a token limit would
+    truncated = text[:text.index("Cares for")]
+
+    _, outcome = extract_json(truncated, dict)
+    analysis = parse_analysis(truncated)
+
+    assert outcome == "repaired"
+    assert [item["stream"] for item in analysis["enhanced_recommendations"]] == ["Engineering"]
+
+
+def test_parse_analysis_drops_invalid_items_and_clamps_confidence():
+    reply = json.dumps({"enhanced_recommendations": [
+        {"stream": "Commerce", "personality_fit": "Business minded", "confidence": 4},
+        {"stream": "Arts"},
+        "not an object"
+    ]})
+
+    analysis = parse_analysis(reply)
+
+    assert analysis["enhanced_recommendations"] == [{
+        "stream": "Commerce", "personality_fit": "Business minded", "jk_opportunities": "",
+        "challenges": "", "next_steps": "", "confidence": 1.0
+    }]
+    assert "overall_guidance" not in analysis
+
+
+@pytest.mark.parametrize("reply", [
+    "I cannot help with that.",
+    json.dumps({"recommendations": []}),
+    json.dumps({"enhanced_recommendations": [{"stream": "Arts"}]}),
+])
+def test_parse_analysis_rejects_unusable_replies(reply):
+    with pytest.raises(LLMOutputError):
+        parse_analysis(reply)
+
+
+def test_parse_question_requires_four_options():
+    question = {"question": "Which task do you enjoy most?", "options": ["A", "B", "C", "D"]}
+
+    assert parse_question(json.dumps(question))["options"] == ["A", "B", "C", "D"]
+    with pytest.raises(LLMOutputError):
+        parse_question(json.dumps({**question, "options": ["A", "B", "C"]}))
+
+
+def test_incremental_parser_yields_each_object_once_as_it_closes():
+    text = json.dumps(ANALYSIS)
+    parser = IncrementalArrayParser("enhanced_recommendations")
+
+    first_end = text.index("}") + 1
+    assert parser.feed(text[:first_end - 1]) == []
+    assert [item["stream"] for item in parser.feed(text[first_end - 1:first_end])] == ["Engineering"]
+    assert not parser.finished
+
+    rest = [parser.feed(char) for char in text[first_end:]]
+
+    assert [item["stream"] for batch in rest for item in batch] == ["Medicine"]
+    assert [item["stream"] for item in parser.objects] == ["Engineering", "Medicine"]
+    assert parser.finished
+
+
+def test_incremental_parser_ignores_braces_inside_strings_and_before_the_array():
+    reply = ('{"note": "{not the array}", "enhanced_recommendations": ['
+             '{"stream": "Arts", "personality_fit": "Likes \\"{design}\\" work"}]}')
+    parser = IncrementalArrayParser("enhanced_recommendations")
+
+    completed = []
+    for start in range(0, len(reply), 7):
+        completed.extend(parser.feed(reply[start:start + 7]))
+
+    assert completed == [{"stream": "Arts", "personality_fit": 'Likes "{design}" work'}]
+    assert parser.finished
@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+import rate_limiter
+from rate_limiter import ProviderRateLimiter, QuotaExhaustedError, TokenBucket
+
+SETTINGS = {"max_wait_seconds": 2.0, "max_waiters": 1, "cooldown_seconds": 30.0}
+
+
+class Clock:
+    """Stands in for time.monotonic so bucket refills are exact"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    return clock
+
+
+def limiter(**provider_config):
+    return ProviderRateLimiter("grok", provider_config, SETTINGS)
+
+
+def test_bucket_starts_full_and_refills_at_the_per_minute_rate(clock):
+    bucket = TokenBucket(60)
+
+    assert bucket.wait_for(60) == 0
+    bucket.take(60)
+    assert bucket.wait_for(1) == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert bucket.wait_for(1) == pytest.approx(0.5)
+    clock.now += 3600
+    # A long idle period refills only up to one minute's worth
+    assert bucket.wait_for(60) == 0
+    assert bucket.level == 60
+
+
+def test_bucket_reservations_queue_behind_each_other(clock):
+    bucket = TokenBucket(60)
+    bucket.take(60)
+
+    bucket.take(1)
+
+    assert bucket.wait_for(1) == pytest.approx(2.0)
+
+
+def test_reserve_waits_within_max_wait_then_refuses(clock):
+    grok = limiter(rpm=60)
+    for _ in range(60):
+        assert grok.reserve(0) == 0
+
+    assert grok.reserve(0) == pytest.approx(1.0)
+    assert grok.reserve(0) == pytest.approx(2.0)
+    with pytest.raises(QuotaExhaustedError) as error:
+        grok.reserve(0)
+
+    assert error.value.reason.startswith("rate limit")
+    assert error.value.retry_after == pytest.approx(3.0)
+    assert grok.snapshot()["rejected"]["rate"] == 1
+    assert grok.queued == 2
+
+
+def test_reserve_refuses_when_the_wait_queue_is_full(clock):
+    grok = limiter(rpm=60)
+    for _ in range(60):
+        grok.reserve(0)
+    grok.waiting = SETTINGS["max_waiters"]
+
+    with pytest.raises(QuotaExhaustedError) as error:
+        grok.reserve(0)
+
+    assert error.value.reason == "wait queue full"
+
+
+def test_token_bucket_limits_large_prompts(clock):
+    grok = limiter(tpm=1000)
+
+    assert grok.reserve(900) == 0
+    with pytest.raises(QuotaExhaustedError):
+        # 1100 tokens short at 1000/min is 66s, far beyond the wait limit
+        grok.reserve(1200)
+    assert grok.reserve(100) == 0
+
+
+def test_settle_refunds_overestimated_tokens_and_unsent_requests(clock):
+    grok = limiter(rpm=10, tpm=1000, cost_per_1k_tokens=0.01, daily_budget_usd=0.02)
+    assert grok.daily_token_budget == 2000
+
+    grok.reserve(800)
+    grok.settle(800, 300)
+    assert grok.tokens_today == 300
+    assert grok.tokens_bucket.level == pytest.approx(700)
+
+    grok.reserve(500)
+    grok.settle(500, 0, sent=False)
+    assert grok.requests_today == 1
+    assert grok.requests_bucket.level == pytest.approx(9)
+
+
+def test_daily_budget_refuses_once_spent(clock):
+    grok = limiter(daily_requests=2)
+    grok.reserve(0)
+    grok.reserve(0)
+
+    with pytest.raises(QuotaExhaustedError) as error:
+        grok.reserve(0)
+
+    assert error.value.reason == "daily budget exhausted"
+    assert not grok.can_admit()
+
+
+def test_throttled_pauses_calls_for_the_cooldown(clock):
+    grok = limiter(rpm=60)
+    grok.throttled()
+
+    with pytest.raises(QuotaExhaustedError) as error:
+        grok.reserve(0)
+    assert error.value.retry_after == pytest.approx(30.0)
+    assert grok.recent_throttles() == 1
+
+    clock.now += 30
+    assert grok.reserve(0) == 0
+
+
+def test_cancelled_waiter_gives_its_slot_back():
+    grok = ProviderRateLimiter("grok", {"rpm": 60}, {**SETTINGS, "max_waiters": 5})
+    for _ in range(60):
+        grok.reserve(0)
+
+    async def cancel_while_waiting():
+        waiter = asyncio.ensure_future(grok.aacquire(0))
+        await asyncio.sleep(0.05)
+        assert grok.waiting == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    asyncio.run(cancel_while_waiting())
+
+    assert grok.waiting == 0
+    assert grok.requests_today == 60
+    # The refunded slot puts the next caller back at the front of the queue
+    assert grok.requests_bucket.wait_for(1) < 1.0
@@ -0,0 +1,131 @@
+import asyncio
+import gc
+
+import pytest
+
+from single_flight import SingleFlight, prompt_flight_key
+
+
+class ProviderCall:
+    """A provider call that finishes when the test releases it"""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.release = asyncio.Event()
+        self.runs = 0
+
+    async def __call__(self):
+        self.runs += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_prompt_flight_key_ignores_whitespace():
+    assert prompt_flight_key("Rank  the\nstreams ") == prompt_flight_key("Rank the streams")
+    assert prompt_flight_key("Rank the streams") != prompt_flight_key("Rank the subjects")
+
+
+def test_concurrent_callers_share_one_execution():
+    flights = SingleFlight("test")
+
+    async def scenario():
+        call = ProviderCall(result={"enhanced_recommendations": []})
+        callers = [asyncio.ensure_future(flights.do("prompt", call)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert flights.get_stats()["in_flight"] == 1
+        call.release.set()
+        return call, await asyncio.gather(*callers)
+
+    call, results = asyncio.run(scenario())
+
+    assert call.runs == 1
+    assert all(result is results[0] for result in results)
+    stats = flights.get_stats()
+    assert stats["executions"] == 1
+    assert stats["coalesced"] == 4
+    assert stats["coalesced_rate"] == 0.8
+    assert stats["in_flight"] == 0
+
+
+def test_failure_is_shared_and_counted_for_followers_only():
+    flights = SingleFlight("test")
+
+    async def scenario():
+        call = ProviderCall(error=RuntimeError("provider 503"))
+        callers = [asyncio.ensure_future(flights.do("prompt", call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        call.release.set()
+        return await asyncio.gather(*callers, return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+
+    assert all(isinstance(error, RuntimeError) and str(error) == "provider 503" for error in errors)
+    assert flights.stats["shared_failures"] == 2
+    assert flights.get_stats()["in_flight"] == 0
+
+
+def test_next_call_after_a_failure_runs_again():
+    flights = SingleFlight("test")
+
+    async def scenario():
+        failing = ProviderCall(error=RuntimeError("timeout"))
+        failing.release.set()
+        with pytest.raises(RuntimeError):
+            await flights.do("prompt", failing)
+        retry = ProviderCall(result="ok")
+        retry.release.set()
+        return await flights.do("prompt", retry)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert flights.stats["executions"] == 2
+
+
+def test_cancelled_leader_does_not_cancel_the_shared_call():
+    flights = SingleFlight("test")
+
+    async def scenario():
+        call = ProviderCall(result="insights")
+        leader = asyncio.ensure_future(flights.do("prompt", call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("prompt", call))
+        await asyncio.sleep(0)
+
+        # The leader's client disconnects while the provider call is in flight
+        leader.cancel()
+        await asyncio.gather(leader, return_exceptions=True)
+        call.release.set()
+        return leader, await follower, call
+
+    leader, result, call = asyncio.run(scenario())
+
+    assert leader.cancelled()
+    assert result == "insights"
+    assert call.runs == 1
+    assert flights.get_stats()["in_flight"] == 0
+
+
+def test_failure_with_every_caller_gone_is_not_left_unretrieved():
+    flights = SingleFlight("test")
+    unretrieved = []
+
+    async def scenario():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unretrieved.append(context))
+        call = ProviderCall(error=RuntimeError("provider 500"))
+        caller = asyncio.ensure_future(flights.do("prompt", call))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        task = flights.in_flight["prompt"]
+        call.release.set()
+        # Unlike gather, wait does not retrieve the task's exception
+        await asyncio.wait([task])
+        del task
+        gc.collect()
+
+    asyncio.run(scenario())
+
+    assert unretrieved == []
+    assert flights.get_stats()["in_flight"] == 0